@@ -0,0 +1,52 @@
+"""Cost of decoding and encoding LumApps payloads with each JSON codec.
+
+Run from the repository root, with the package installed:
+
+    python benchmarks/bench_codec.py [items]
+"""
+
+import sys
+from copy import deepcopy
+from json import load
+from timeit import timeit
+
+from lumapps.api.codec import OrjsonCodec, StdlibCodec, orjson
+
+
+def payloads(n_items: int):
+    """A content listing page, a community and the discovery document."""
+    data = {}
+    with open("tests/legacy/test_data/content_1.json") as fh:
+        content = load(fh)
+    data["content/list"] = {
+        "items": [deepcopy(content) for _ in range(n_items)],
+        "more": True,
+        "cursor": "c" * 200,
+    }
+    with open("tests/legacy/test_data/community_1.json") as fh:
+        data["community/get"] = load(fh)
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        data["discovery"] = load(fh)
+    return data
+
+
+def main(n_items: int = 100, number: int = 20) -> None:
+    codecs = [StdlibCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    for name, payload in payloads(n_items).items():
+        raw = StdlibCodec().dumps(payload).encode()
+        print(f"{name} ({len(raw) / 1024:.0f} KiB)")
+        for codec in codecs:
+            decode = timeit(lambda: codec.loads(raw), number=number) / number
+            encode = timeit(lambda: codec.dumps(payload), number=number) / number
+            indent = timeit(lambda: codec.dumps(payload, True), number=number)
+            print(
+                f"  {codec.name:8} loads {decode * 1e3:7.2f} ms"
+                f"  dumps {encode * 1e3:7.2f} ms"
+                f"  dumps(indent) {indent / number * 1e3:7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
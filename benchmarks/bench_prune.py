@@ -0,0 +1,63 @@
+"""Per item cost of pruning a content listing, before and after compiling the
+prune filters.
+
+Run from the repository root, with the package installed:
+
+    python benchmarks/bench_prune.py [items]
+"""
+
+import sys
+from copy import deepcopy
+from json import load
+from timeit import timeit
+
+from lumapps.api.utils import (
+    FILTERS,
+    apply_prune_trie,
+    compile_prune_filters,
+    pop_matches,
+)
+
+NAME_PARTS = ("content", "list")
+
+
+def legacy_prune(name_parts, content):
+    # BaseClient._prune before the filters were compiled, run for each item
+    for ep_filter in FILTERS:
+        ep_filter_parts = ep_filter.split("/")
+        if len(name_parts) != len(ep_filter_parts):
+            continue
+        for filter_part, part in zip(ep_filter_parts, name_parts):
+            if filter_part not in ("*", part):
+                break
+        else:
+            for pth in FILTERS[ep_filter]:
+                pop_matches(pth, content)
+    return content
+
+
+def compiled_prune(items):
+    trie = compile_prune_filters(NAME_PARTS)
+    apply_prune_trie(trie, items)
+
+
+def main(n_items: int = 100000) -> None:
+    with open("tests/legacy/test_data/content_1.json") as fh:
+        content = load(fh)
+    pages = [[deepcopy(content) for _ in range(n_items)] for _ in range(2)]
+
+    def legacy():
+        for item in pages[0]:
+            legacy_prune(NAME_PARTS, item)
+
+    before = timeit(legacy, number=1)
+    after = timeit(lambda: compiled_prune(pages[1]), number=1)
+    assert pages[0] == pages[1]
+    print(f"{n_items} items")
+    print(f"before: {before / n_items * 1e9:8.0f} ns/item")
+    print(f"after:  {after / n_items * 1e9:8.0f} ns/item")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
@@ -1 +1,7 @@
-from lumapps.api import BaseClient, FileContent, LumAppsClient  # noqa
+from lumapps.api import (  # noqa
+    AsyncBaseClient,
+    AsyncLumAppsClient,
+    BaseClient,
+    FileContent,
+    LumAppsClient,
+)
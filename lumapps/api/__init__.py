@@ -1,3 +1,5 @@
+from lumapps.api.async_base_client import AsyncBaseClient  # noqa
+from lumapps.api.async_client import AsyncLumAppsClient  # noqa
 from lumapps.api.base_client import BaseClient, FileContent  # noqa
 from lumapps.api.client import LumAppsClient  # noqa
 from lumapps.api.conf import __pypi_packagename__, __version__  # noqa
@@ -0,0 +1,436 @@
+from asyncio import Lock, Semaphore, get_running_loop, run
+from asyncio import gather as gather_tasks
+from functools import partial
+from pathlib import Path
+from time import time
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from httpx import AsyncClient
+
+from lumapps.api.base_client import (
+    BaseClient,
+    FileContent,
+    _application_token_request,
+    _json_body,
+    _read_application_token,
+)
+from lumapps.api.codec import loads
+from lumapps.api.errors import BadCallError, BaseClientError
+from lumapps.api.token_manager import AsyncTokenGetter, AsyncTokenManager
+from lumapps.api.utils import (
+    _parse_endpoint_parts,
+    apply_prune_trie,
+    compile_prune_filters,
+    method_from_discovery,
+)
+
+TokenGetter = AsyncTokenGetter
+
+
+async def async_fetch_access_token(
+    client: AsyncClient,
+    base_url: str,
+    auth_info: Dict[str, str],
+    customer_id: str,
+    user_email: str,
+) -> Tuple[str, int]:
+    request = _application_token_request(base_url, auth_info, customer_id, user_email)
+    return _read_application_token(await client.post(**request))
+
+
+class AsyncBaseClient(BaseClient):
+    def __init__(
+        self,
+        api_info: Dict[str, Any],
+        auth_info: Optional[Dict[str, Any]] = None,
+        token: Optional[str] = None,
+        token_getter: Optional[TokenGetter] = None,
+        prune: bool = False,
+        no_verify: bool = False,
+        proxy_info: Optional[Dict[str, Any]] = None,
+        extra_http_headers: Optional[Dict] = None,
+    ):
+        """Asyncio flavour of the BaseClient, built on `httpx.AsyncClient`.
+
+        Endpoint discovery, pruning and token refresh behave like in the
+        BaseClient, but `get_call`, `iter_call` and `upload` are coroutines so
+        that many calls can be in flight at once.
+
+        Args:
+            auth_info: When specified, a service account or a web auth JSON dict.
+            api_info: When specified, a JSON dict containing the description of your
+                api. Defaults to LumApps API.
+            token: A bearer access token.
+            token_getter: A bearer access token getter function, it can either
+                return the `(token, expires_in)` tuple or an awaitable of it. It
+                is wrapped in an AsyncTokenManager (unless it is one already)
+                which refreshes the token ahead of its expiry and after a 401.
+            prune: Whether or not to use FILTERS to prune LumApps API responses.
+            no_verify: Disables SSL verification.
+            proxy_info: When specified, a JSON dict with proxy parameters.
+        """
+        if token_getter and not isinstance(token_getter, AsyncTokenManager):
+            token_getter = AsyncTokenManager(token_getter)
+        super().__init__(
+            api_info,
+            auth_info=auth_info,
+            token=token,
+            token_getter=token_getter,  # type: ignore
+            prune=prune,
+            no_verify=no_verify,
+            proxy_info=proxy_info,
+            extra_http_headers=extra_http_headers,
+        )
+        self._discovery_lock: Optional[Lock] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+        return False
+
+    def __exit__(self, *exc):
+        raise BaseClientError("Use `async with` on an AsyncBaseClient")
+
+    def close(self):
+        """Release the connection pool like `aclose`, for synchronous code.
+
+        Within a running event loop the pool is closed by a task of the loop,
+        prefer `await aclose()` there.
+        """
+        if self._released:
+            return
+        self._released = True
+        client = self._shared.release()
+        if not client:
+            return
+        try:
+            loop = get_running_loop()
+        except RuntimeError:
+            run(client.aclose())
+        else:
+            self._closing = loop.create_task(client.aclose())
+
+    async def aclose(self):
+        """Release the connection pool, closing it unless a derived client still
+        uses it."""
+        if self._released:
+            return
+        self._released = True
+        client = self._shared.release()
+        if client:
+            await client.aclose()
+
+    def _create_client(self):
+        return AsyncClient(**self._client_kwargs())
+
+    @property
+    def client(self) -> AsyncClient:  # type: ignore
+        """Setup the client object."""
+        return BaseClient.client.fget(self)  # type: ignore
+
+    @property
+    def discovery_doc(self):
+        shared = self._shared
+        if shared.discovery_doc is None:
+            shared.discovery_doc = self._get_cached_discovery_doc()
+        if shared.discovery_doc is None:
+            raise BaseClientError(
+                "Discovery document not loaded yet, "
+                "use `await load_discovery_doc()` first"
+            )
+        return shared.discovery_doc
+
+    async def load_discovery_doc(self) -> Dict[str, Any]:
+        """Load the discovery document, from the cache or from the network."""
+        shared = self._shared
+        if shared.discovery_doc is not None:
+            return shared.discovery_doc
+        if self._discovery_lock is None:
+            self._discovery_lock = Lock()
+        async with self._discovery_lock:
+            if shared.discovery_doc is None:
+                d = self._get_cached_discovery_doc()
+                if not d:
+                    resp = await self.client.get(self._discovery_url)
+                    d = self._store_discovery_doc(loads(resp.content))
+                shared.discovery_doc = d
+        return shared.discovery_doc
+
+    def _revalidate_discovery(self) -> None:
+        """Refresh the discovery data in a task of the event loop if it
+        expired, the refresh is skipped outside of a running event loop."""
+        shared = self._shared
+        expires_at = shared.discovery_expires_at
+        if expires_at is None or time() < expires_at:
+            return
+        try:
+            loop = get_running_loop()
+        except RuntimeError:
+            return
+        with shared.lock:
+            task = shared.refresh_task
+            if shared.discovery_expires_at is None or (task and not task.done()):
+                return
+            shared.refresh_task = loop.create_task(self._refresh_discovery())
+
+    async def _refresh_discovery(self) -> None:  # type: ignore
+        validators, headers = self._discovery_refresh_request()
+        try:
+            resp = await self.client.get(self._discovery_url, headers=headers)
+            self._apply_discovery_refresh(resp, validators)
+        except Exception as err:
+            self._discovery_refresh_failed(err)
+
+    def get_new_client_as(  # type: ignore
+        self, user_email: str, customer_id: str
+    ) -> "AsyncBaseClient":
+        """Get a new AsyncBaseClient using an authorized client account by obtaining
+        a token.
+
+        Args:
+            user_email (str): User you want to authenticate on behalf of
+            customer_id (str): Id of the LumApps customer the user belong to
+
+        Returns:
+            AsyncBaseClient: A new instance of the AsyncBaseClient correctly
+                authenticated.
+        """
+        client = AsyncBaseClient(
+            auth_info=self._auth_info,
+            api_info=self.api_info,
+            no_verify=self.no_verify,
+            proxy_info=self.proxy_info,
+            prune=self.prune,
+            token_getter=lambda: async_fetch_access_token(
+                self.client, self.base_url, self._auth_info, customer_id, user_email
+            ),
+            extra_http_headers=self._extra_http_headers,
+        )
+        self._share_resources(client)
+        return client
+
+    async def _get_token(self) -> Optional[str]:  # type: ignore
+        manager = self.token_manager
+        if manager:
+            self.token = await manager.get_token()  # type: ignore
+        return self.token
+
+    async def _call(  # type: ignore
+        self, name_parts: Sequence[str], params: dict, json=None
+    ):
+        """Construct the call"""
+        await self.load_discovery_doc()
+        token = await self._get_token()
+        verb, path, params = self._get_verb_path_params(name_parts, params)
+        resp = await self.client.request(
+            verb,
+            path,
+            params=params,
+            **_json_body(json, {**self._extra_http_headers, **self._headers}),
+        )
+        if resp.status_code == 401 and self.token_manager:
+            # Token expired, fetch new token and retry!
+            self.token_manager.invalidate(token)
+            await self._get_token()
+            resp = await self.client.request(
+                verb,
+                path,
+                params=params,
+                **_json_body(json, {**self._extra_http_headers, **self._headers}),
+            )
+        resp.raise_for_status()
+        if not resp.content:
+            return None
+        return loads(resp.content)
+
+    async def upload(  # type: ignore
+        self, file_content: FileContent, metadata: dict, *name_parts, **params
+    ):
+        await self.load_discovery_doc()
+        name_parts = _parse_endpoint_parts(name_parts)
+        endpoint: Any = method_from_discovery(self.discovery_doc, name_parts)  # type: ignore  # noqa
+        if not endpoint or not endpoint.get("mediaUpload"):
+            raise BadCallError(
+                f"Endpoint {'.'.join(name_parts)} is not for uploads, "
+                f"use get_call or iter_call instead."
+            )
+        verb, path, params, files = self._get_upload_request(
+            endpoint, file_content, metadata, params
+        )
+        await self._get_token()
+        resp = await self.client.request(
+            verb,
+            path,
+            params=params,
+            files=files,
+            headers={**self._extra_http_headers, **self._headers},
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def upload_call(  # type: ignore
+        self, fpath: Union[Path, str], metadata: dict, *name_parts, **params
+    ):
+        with Path(fpath).open("rb") as fh:
+            return await self.upload(fh, metadata, *name_parts, **params)
+
+    async def get_call(  # type: ignore
+        self, *name_parts, **params
+    ) -> Union[Dict[str, Any], List[Dict[str, Any]], None]:
+        """Generic coroutine to call a lumapps endpoint
+
+        Args:
+            *name_parts: Endpoint, eg user/get or "user", "get"
+            **params: Parameters of the call
+
+        Returns:
+            Object or objects returned by the endpoint call.
+
+        Example:
+            List feedtypes in LumApps:
+            -> GET https://.../_ah/api/lumsites/v1/feedtype/list
+
+            With this endpoint:
+
+                >>> feedtypes = await get_call("feedtype/list")
+                >>> print(feedtypes)
+        """
+        name_parts = _parse_endpoint_parts(name_parts)
+        items: List[dict] = []
+        self.cursor = cursor = params.pop("cursor", None)
+        body = self._pop_body(params)
+        while True:
+            if cursor:
+                if body is not None:
+                    body["cursor"] = cursor
+                else:
+                    params["cursor"] = cursor
+            response = await self._call(name_parts, params, body)
+            if response is None:
+                return None
+
+            more = response.get("more")
+            response_items = response.get("items")
+            if more:
+                if response_items:
+                    self.cursor = cursor = response["cursor"]
+                    items.extend(response_items)
+                else:
+                    # No results but a more field set to true ...
+                    # ie, the api return something wrong
+                    self.cursor = cursor = None
+                    return self._prune(name_parts, items)
+            else:
+                # No more result to get
+                self.cursor = cursor = None
+                if response_items:
+                    items.extend(response_items)
+                    return self._prune(name_parts, items)
+                return [] if more is False else self._prune(name_parts, response)
+
+    async def iter_call(  # type: ignore
+        self, *name_parts, **params
+    ) -> AsyncGenerator[Union[Dict[str, Any], List[Dict[str, Any]]], None]:
+        """
+        Args:
+            *name_parts: Endpoint, eg user/get or "user", "get"
+            **params: Parameters of the call
+
+        Yields:
+            Objects returned by the endpoint call
+
+
+        Example:
+            List feedtypes in LumApps:
+            -> GET https://.../_ah/api/lumsites/v1/feedtype/list
+
+            With this endpoint:
+
+                >>> feedtypes = iter_call("feedtype/list")
+                >>> async for feedtype in feedtypes: print(feedtype)
+        """
+        name_parts = _parse_endpoint_parts(name_parts)
+        self.cursor = cursor = params.pop("cursor", None)
+        body = self._pop_body(params)
+        trie = compile_prune_filters(name_parts) if self.prune else None
+        while True:
+            if cursor:
+                if body is not None:
+                    body["cursor"] = cursor
+                else:
+                    params["cursor"] = cursor
+
+            response = await self._call(name_parts, params, body)
+            more = response.get("more")
+            items = response.get("items")
+
+            if more and items:
+                self.cursor = cursor = response["cursor"]
+            else:
+                # Either the last page or the api returned something wrong
+                # (no results but a more field set to true)
+                self.cursor = cursor = None
+            if items and trie:
+                apply_prune_trie(trie, items)
+            for item in items or ():
+                yield item
+            if not (more and items):
+                return
+
+    async def gather(  # type: ignore
+        self, *calls: Callable[[], Awaitable[Any]], max_concurrency: int = 10
+    ) -> List[Any]:
+        """Run independent coroutines concurrently over the shared connection pool.
+
+        Args:
+            *calls: Callables without arguments returning an awaitable, eg
+                `functools.partial(client.get_call, "user/get", email=email)`
+            max_concurrency: The maximum number of calls in flight at once
+
+        Returns:
+            The results in the order of the calls. When a call raises, its
+            exception is returned in place of its result and the other calls
+            are not interrupted.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        semaphore = Semaphore(max_concurrency)
+
+        async def run(call):
+            async with semaphore:
+                return await call()
+
+        return await gather_tasks(*(run(c) for c in calls), return_exceptions=True)
+
+    async def map_calls(  # type: ignore
+        self, endpoint: str, params_list: Iterable[dict], max_concurrency: int = 10
+    ) -> List[Any]:
+        """Call the same endpoint concurrently for each set of parameters
+
+        Args:
+            endpoint: Endpoint, eg user/get
+            params_list: The parameters of each call, as passed to `get_call`
+            max_concurrency: The maximum number of calls in flight at once
+
+        Returns:
+            The results of `get_call` in the order of `params_list`, with the
+            exception of a failed call in place of its result.
+        """
+        return await self.gather(
+            *(partial(self.get_call, endpoint, **params) for params in params_list),
+            max_concurrency=max_concurrency,
+        )
@@ -0,0 +1,250 @@
+from time import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, cast
+
+from httpx import HTTPStatusError
+
+from lumapps.api.async_base_client import (
+    AsyncBaseClient,
+    TokenGetter,
+    async_fetch_access_token,
+)
+from lumapps.api.cache import BoundedCache
+from lumapps.api.errors import LumAppsClientConfError
+from lumapps.api.token_manager import AsyncTokenManager
+
+
+class AsyncLumAppsClient(AsyncBaseClient):  # pragma: no cover
+    def __init__(
+        self,
+        customer_id: str,
+        instance_id: Optional[str],
+        api_info: Dict[str, Any],
+        cache: Optional[Any] = None,
+        dry_run: bool = False,
+        auth_info: Optional[Dict[str, Any]] = None,
+        token: Optional[str] = None,
+        token_getter: Optional[TokenGetter] = None,
+        prune: bool = False,
+        no_verify: bool = False,
+        proxy_info: Optional[Dict[str, Any]] = None,
+        extra_http_headers: Optional[Dict] = None,
+    ):
+        """Asyncio flavour of the LumAppsClient
+
+        Args:
+            customer_id: The id of the platform you target
+            instance_id: The id of the site you target
+            api_info: The api info to pass to the AsyncBaseClient
+            cache: The cache to use, defaults to a BoundedCache
+            dry_run: Whether to run in dry_run mode or not. This will
+                avoid saving things when callings save endpoints
+        """
+        if not customer_id:
+            raise LumAppsClientConfError("customer_id required")
+        self.customer_id = customer_id
+        self.instance_id = instance_id
+        self.cache = cache if cache is not None else BoundedCache()
+        self.dry_run = dry_run
+        self._langs: Optional[List[str]] = None
+        extra_http_headers = {
+            **({"LumApps-Organization-Id": str(self.customer_id)}),
+            **(extra_http_headers or {}),
+        }
+        super().__init__(
+            api_info,
+            auth_info=auth_info,
+            token=token,
+            token_getter=token_getter,
+            prune=prune,
+            no_verify=no_verify,
+            proxy_info=proxy_info,
+            extra_http_headers=extra_http_headers,
+        )
+
+    def get_token_getter(self, email: str) -> AsyncTokenManager:
+        """Get the AsyncTokenManager handling the tokens of a user, shared by
+        all the clients of the user."""
+        assert email
+        last_token = None
+
+        async def f():
+            nonlocal last_token
+            k = f"{self.customer_id}|TOKEN|{email}"
+            vals = self.cache.get(k)
+            if vals and vals[0] == last_token:
+                # Asked again for the token given last, it was rejected or
+                # expires soon
+                self.cache.delete(k)
+            elif vals:
+                token, expires_at = vals
+                last_token = token
+                return token, int(expires_at - time())
+            token, expiry = await async_fetch_access_token(
+                self.client, self.base_url, self._auth_info, self.customer_id, email
+            )
+            self.cache.set(k, (token, int(time()) + expiry), expiry - 10)
+            last_token = token
+            return token, expiry
+
+        manager = self._get_token_manager(
+            self.customer_id, email, f, AsyncTokenManager  # type: ignore
+        )
+        return cast(AsyncTokenManager, manager)
+
+    def get_user_api(self, email: str, prune: bool = True) -> "AsyncLumAppsClient":
+        client = AsyncLumAppsClient(
+            self.customer_id,
+            self.instance_id,
+            cache=self.cache,
+            dry_run=self.dry_run,
+            token_getter=self.get_token_getter(email),
+            prune=prune,
+            api_info=self.api_info,
+            auth_info=self._auth_info,
+            no_verify=self.no_verify,
+            proxy_info=self.proxy_info,
+        )
+        client._cache_scope = f"{self.customer_id}|{email}"
+        self._share_resources(client)
+        return client
+
+    async def get_langs(self) -> List[str]:
+        if self._langs:
+            return self._langs
+        k = f"{self.customer_id}|INSTANCE_LANGS|{self.instance_id}"
+        langs = self.cache.get(k)
+        if not langs:
+            inst = await self.get_instance()
+            if inst is None:
+                raise LumAppsClientConfError(f"Instance {self.instance_id} not found")
+            default_lang = inst.get("defaultLang")
+            langs = [lang for lang in inst["langs"] if lang != default_lang]
+            if default_lang:
+                langs.insert(0, default_lang)
+            self.cache.set(k, langs, 7200)
+        self._langs = langs
+        return langs
+
+    async def get_first_lang(self) -> str:
+        return (await self.get_langs())[0]
+
+    async def _none_on_404(self, *name_parts, **params) -> Optional[Any]:
+        try:
+            return await self.get_call(*name_parts, **params)
+        except HTTPStatusError as e:
+            if e.response.status_code == 404:
+                return None
+            raise
+
+    async def get_instance(
+        self, *, slug: Optional[str] = None, uid: Optional[str] = None, **kwargs: dict
+    ) -> Optional[Dict[str, Any]]:
+        if slug:
+            return await self._none_on_404("instance/get", slug=slug, **kwargs)
+        return await self._none_on_404(
+            "instance/get", uid=uid or self.instance_id, **kwargs
+        )
+
+    async def get_user(self, id_or_email: str) -> Optional[Dict[str, Any]]:
+        """Get a user from his id or email
+
+        Args:
+            id_or_email: The id or email or the user
+
+        Returns:
+            The retrieved user or None if it was not found
+        """
+        k = f"{self.customer_id}|USER|{id_or_email}"
+        try:
+            return self.cache.get(k, raises=True)
+        except KeyError:
+            pass
+        if "@" in id_or_email:
+            user = await self._none_on_404("user/get", email=id_or_email)
+        else:
+            user = await self._none_on_404("user/get", uid=id_or_email)
+        self.cache.set(k, user, 7200)
+        return user
+
+    async def iter_users(self, **kwargs: dict) -> AsyncGenerator[Dict[str, Any], None]:
+        params: Dict[str, Any] = {"instance": self.instance_id}
+        params.update(kwargs)
+        async for user in self.iter_call("user/list", **params):
+            yield cast(Dict[str, Any], user)
+
+    async def save_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        if self.dry_run:
+            return user
+        return cast(Dict[str, Any], await self.get_call("user/save", body=user))
+
+    async def get_content(
+        self, content_id: str, fields: Optional[str] = None, action: str = "PAGE_EDIT"
+    ) -> Optional[Dict[str, Any]]:
+        params = {}
+        if action:
+            params["action"] = action
+        if fields:
+            params["fields"] = fields
+        return await self._none_on_404("content/get", uid=content_id, **params)
+
+    async def iter_contents(
+        self, content_type_id: Optional[str] = None, **kwargs
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        body: Dict[str, Any] = {
+            "lang": "",
+            "instanceId": self.instance_id,
+            "action": "PAGE_EDIT",
+        }
+        if content_type_id:
+            body["customContentType"] = content_type_id
+        body.update(**kwargs)
+        async for content in self.iter_call("content/list", body=body):
+            yield cast(Dict[str, Any], content)
+
+    async def save_content(self, content: Dict[str, Any]) -> Dict[str, Any]:
+        if self.dry_run:
+            return content
+        saved = await self.get_call(
+            "content/save", body=content, sendNotifications=False
+        )
+        return cast(Dict[str, Any], saved)
+
+    async def get_community(
+        self, community_id: str, fields: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        return await self._none_on_404("community/get", uid=community_id, fields=fields)
+
+    async def iter_communities(
+        self, **kwargs: dict
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        body: Dict[str, Any] = {"lang": "", "instanceId": self.instance_id}
+        body.update(**kwargs)
+        try:
+            async for community in self.iter_call("community/list", body=body):
+                yield cast(Dict[str, Any], community)
+        except HTTPStatusError as e:
+            if e.response.status_code == 400 and "FEATURE_NOT_ENABLED" in str(e):
+                return
+            raise
+
+    async def get_post(self, post_id: str, **kwargs: dict) -> Optional[Dict[str, Any]]:
+        return await self._none_on_404("community/post/get", uid=post_id, **kwargs)
+
+    async def iter_posts(
+        self, community_id: Optional[str] = None, **kwargs: dict
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        body: Dict[str, Any] = {"lang": "", "maxResults": 30}
+        if community_id:
+            body["contentId"] = [community_id]
+        body.update(**kwargs)
+        async for post in self.iter_call("community/post/search", body=body):
+            yield cast(Dict[str, Any], post)
+
+    async def get_group(self, group_id: str) -> Optional[Dict[str, Any]]:
+        return await self._none_on_404("feed/get", uid=group_id)
+
+    async def iter_groups(self, type_id: str) -> AsyncGenerator[Dict[str, Any], None]:
+        async for group in self.iter_call(
+            "feed/list", instance=self.instance_id, type=type_id, action="GROUP_EDIT"
+        ):
+            yield cast(Dict[str, Any], group)
@@ -1,34 +1,69 @@
-from contextlib import AbstractContextManager
-from functools import lru_cache
-from json import JSONDecodeError, dumps, loads
+from contextlib import AbstractContextManager, nullcontext
+from copy import deepcopy
+from datetime import datetime
+from functools import partial
+from hashlib import sha256
+from json import JSONDecodeError
+from logging import warning
 from pathlib import Path
 from textwrap import TextWrapper
+from threading import Lock, RLock, Thread
+from time import time
 from typing import (
     IO,
     Any,
     Callable,
     Dict,
     Generator,
+    Iterable,
     List,
     Optional,
     Sequence,
     Tuple,
+    Type,
     Union,
 )
 from urllib.parse import urlparse
+from weakref import WeakValueDictionary
 
-from httpx import Client, HTTPStatusError
+from httpx import Client, HTTPStatusError, Request, Response, TransportError
 
+from lumapps.api.call_plan import get_call_plan
+from lumapps.api.codec import dumps, loads
+from lumapps.api.concurrency import (
+    AdaptiveConcurrencyLimiter,
+    prefetch_iter,
+    run_concurrently,
+)
 from lumapps.api.conf import __version__
+from lumapps.api.discovery_index import (
+    DiscoveryIndex,
+    EndpointSpec,
+    index_snapshot_key,
+    load_index_snapshot,
+    remove_index_snapshot,
+    save_index_snapshot,
+)
 from lumapps.api.errors import BadCallError, BaseClientError, GetTokenError
+from lumapps.api.projection import response_shape, select_fields
+from lumapps.api.rate_limit import RateLimiter, parse_retry_after
+from lumapps.api.response_cache import ResponseCache
+from lumapps.api.retry import RetryPolicy
+from lumapps.api.singleflight import SingleFlight
+from lumapps.api.streaming import ListingDecoder
+from lumapps.api.token_manager import TokenGetter, TokenManager
 from lumapps.api.utils import (
-    FILTERS,
+    CACHE_MAX_AGE,
+    DISCOVERY_MAX_STALE,
     GOOGLE_APIS,
+    PruneTrie,
     _parse_endpoint_parts,
+    apply_prune_trie,
+    compile_prune_filters,
     get_discovery_cache,
     get_endpoints,
+    is_read_endpoint,
     method_from_discovery,
-    pop_matches,
 )
 
 FileContent = Union[IO[bytes], bytes]
@@ -36,30 +71,53 @@ FileContent = Union[IO[bytes], bytes]
 LUMAPPS_NAME = "lumsites"
 
 
-def fetch_access_token(
-    client: Client,
-    base_url: str,
-    auth_info: Dict[str, str],
-    customer_id: str,
-    user_email: str,
-) -> Tuple[str, int]:
+def _json_body(json: Any, headers: Dict[str, str]) -> Dict[str, Any]:
+    """The httpx arguments sending `json` encoded by the codec of the SDK."""
+    if json is None:
+        return {"headers": headers}
+    return {
+        "content": dumps(json).encode(),
+        "headers": {**headers, "Content-Type": "application/json"},
+    }
+
+
+def _application_token_request(
+    base_url: str, auth_info: Dict[str, str], customer_id: str, user_email: str
+) -> Dict[str, Any]:
     try:
-        response = client.post(
-            f"{base_url}/v2/organizations/{customer_id}/application-token",
-            auth=(auth_info["client_id"], auth_info["client_secret"]),
-            data={"grant_type": "client_credentials", "user_email": user_email},
-        )
-        response.raise_for_status()
-        response_data = response.json()
-        return response_data["access_token"], response_data["expires_in"]
+        return {
+            "url": f"{base_url}/v2/organizations/{customer_id}/application-token",
+            "auth": (auth_info["client_id"], auth_info["client_secret"]),
+            "data": {"grant_type": "client_credentials", "user_email": user_email},
+        }
     except KeyError as err:
         raise GetTokenError(
             f"Missing {err} from auth_info. Use BaseClient(auth_info=...)"
         ) from err
+
+
+def _read_application_token(response: Response) -> Tuple[str, int]:
+    try:
+        response.raise_for_status()
+        response_data = response.json()
+        return response_data["access_token"], response_data["expires_in"]
+    except KeyError as err:
+        raise GetTokenError(f"Missing {err} from token response") from err
     except (HTTPStatusError, JSONDecodeError) as err:
         raise GetTokenError(str(err)) from err
 
 
+def fetch_access_token(
+    client: Client,
+    base_url: str,
+    auth_info: Dict[str, str],
+    customer_id: str,
+    user_email: str,
+) -> Tuple[str, int]:
+    request = _application_token_request(base_url, auth_info, customer_id, user_email)
+    return _read_application_token(client.post(**request))
+
+
 def _get_discovery_urls(base_url: str, api_info: Dict[str, str]) -> Tuple[str, str]:
     api_name = api_info.get("name", LUMAPPS_NAME)
     version = api_info.get("version", "v1")
@@ -81,17 +139,151 @@ def _get_discovery_urls(base_url: str, api_info: Dict[str, str]) -> Tuple[str, s
     )
 
 
+# How long to wait before retrying a failed refresh of the discovery, in seconds
+DISCOVERY_REFRESH_RETRY = 60
+
+_discovery_stats_lock = Lock()
+_discovery_stats = {
+    # Served from the cache before its expiry
+    "fresh": 0,
+    # Served expired from the cache while refreshed in the background
+    "stale_served": 0,
+    # Fetched while the caller waited, there was no usable cached document
+    "blocking_fetches": 0,
+    # Part of the blocking fetches, the cached document was too old to serve
+    "expired_blocking_fetches": 0,
+    # Background refreshes where the document had not changed
+    "not_modified": 0,
+    # Background refreshes where the document changed and was rebuilt
+    "rebuilt": 0,
+    "refresh_errors": 0,
+}
+
+
+def _count_discovery(stat: str) -> None:
+    with _discovery_stats_lock:
+        _discovery_stats[stat] += 1
+
+
+def get_discovery_stats() -> Dict[str, int]:
+    """Get the counters of how the discovery documents were loaded."""
+    with _discovery_stats_lock:
+        return dict(_discovery_stats)
+
+
+def _validators_key(discovery_url: str) -> str:
+    return f"{discovery_url}#validators"
+
+
+class _SharedResources:
+    def __init__(self):
+        """The connection pool and discovery data of a client, shared with the
+        clients derived from it. The connection pool is closed once all the
+        clients sharing it are closed.
+        """
+        self.lock = RLock()
+        self.client: Any = None
+        self.discovery_doc: Optional[Dict[str, Any]] = None
+        self.endpoints: Optional[Dict[Tuple[str, ...], Any]] = None
+        self.index: Optional[DiscoveryIndex] = None
+        # When the discovery data must be revalidated, None to never do it
+        self.discovery_expires_at: Optional[float] = None
+        self.refresh_thread: Optional[Thread] = None
+        # The asyncio task refreshing the discovery data of the async clients
+        self.refresh_task: Any = None
+        self.refs = 1
+
+    def acquire(self) -> None:
+        with self.lock:
+            self.refs += 1
+
+    def release(self) -> Any:
+        """Drop a reference, returns the client to close when it was the last."""
+        with self.lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return None
+            client, self.client = self.client, None
+            return client
+
+
+class _Pager:
+    def __init__(
+        self,
+        params: dict,
+        body: Any,
+        max_items: Optional[int] = None,
+        page_size: Optional[int] = None,
+    ):
+        """Set the cursor and the size of the pages of a listing, and count
+        its items up to `max_items`.
+
+        The size of the page requests is shrunk to the items still wanted.
+        When it is not given, it is the size of the first page.
+        """
+        if max_items is not None and max_items < 1:
+            raise ValueError("max_items must be at least 1")
+        # The paging parameters go in the body of the calls that have one
+        self._target = body if body is not None else params
+        if page_size:
+            self._target["maxResults"] = page_size
+        try:
+            self.page_size: Optional[int] = int(self._target["maxResults"])
+        except (KeyError, TypeError, ValueError):
+            self.page_size = None
+        self.max_items = max_items
+        self.count = 0
+        self.truncated = False
+
+    @property
+    def done(self) -> bool:
+        return self.max_items is not None and self.count >= self.max_items
+
+    def prepare(self, cursor: Optional[str]) -> None:
+        """Set the parameters of the next page request."""
+        if cursor:
+            self._target["cursor"] = cursor
+        if self.page_size is None and self.count:
+            self.page_size = self.count
+        if self.max_items is not None and self.page_size:
+            remaining = self.max_items - self.count
+            if remaining < self.page_size:
+                self._target["maxResults"] = remaining
+
+    def take(self, items: List[Any]) -> List[Any]:
+        """Count the items received, dropping the ones beyond max_items."""
+        if self.max_items is not None:
+            remaining = self.max_items - self.count
+            if len(items) > remaining:
+                items = items[:remaining]
+                self.truncated = True
+        self.count += len(items)
+        return items
+
+    def next_cursor(self, response: Dict[str, Any]) -> Optional[str]:
+        """The cursor to resume the listing after a page, None at its end."""
+        if not response.get("more") or self.truncated:
+            return None
+        return response.get("cursor")
+
+
 class BaseClient(AbstractContextManager):
     def __init__(
         self,
         api_info: Dict[str, Any],
         auth_info: Optional[Dict[str, Any]] = None,
         token: Optional[str] = None,
-        token_getter: Optional[Callable[[], Tuple[str, int]]] = None,
+        token_getter: Optional[TokenGetter] = None,
         prune: bool = False,
         no_verify: bool = False,
         proxy_info: Optional[Dict[str, Any]] = None,
         extra_http_headers: Optional[Dict] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        coalesce_reads: bool = True,
+        response_cache: Optional[ResponseCache] = None,
+        project_fields: bool = False,
     ):
         """
         Args:
@@ -99,10 +291,27 @@ class BaseClient(AbstractContextManager):
             api_info: When specified, a JSON dict containing the description of your
                 api. Defaults to LumApps API.
             token: A bearer access token.
-            token_getter: A bearer access token getter function.
+            token_getter: A bearer access token getter function, returning a
+                `(token, expires_in)` tuple. It is wrapped in a TokenManager (unless
+                it is one already) which refreshes the token ahead of its expiry.
             prune: Whether or not to use FILTERS to prune LumApps API responses.
             no_verify: Disables SSL verification.
             proxy_info: When specified, a JSON dict with proxy parameters.
+            extra_http_headers: Headers added to every request.
+            rate_limiter: When specified, a RateLimiter throttling the calls of
+                this client and of the clients derived from it.
+            concurrency_limiter: When specified, an AdaptiveConcurrencyLimiter
+                bounding the number of requests in flight, shared with the
+                clients derived from this one.
+            retry_policy: When specified, the RetryPolicy of the calls of this
+                client and of the clients derived from it. Otherwise the calls
+                are only retried after a 429 when there is a rate_limiter.
+            coalesce_reads: Whether identical read calls made concurrently
+                (same endpoint, parameters and body) share a single request.
+            response_cache: When specified, the ResponseCache of the read calls
+                of this client and of the clients derived from it.
+            project_fields: Whether to ask the api to leave out of the responses
+                the fields that prune drops, with the `fields` parameter.
         """
         if not api_info or "base_url" not in api_info:
             raise BaseClientError(
@@ -112,31 +321,63 @@ class BaseClient(AbstractContextManager):
         self.no_verify = no_verify
         self.proxy_info = proxy_info
         self.prune = prune
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.retry_policy = retry_policy
+        self.coalesce_reads = coalesce_reads
+        self._singleflight = SingleFlight()
+        self.response_cache = response_cache
+        self.project_fields = project_fields
+        # The user the calls are made for, separates the cached responses of
+        # the users of a shared cache
+        self._cache_scope = ""
         self._auth_info = auth_info or {}
         self._token = None
-        self._endpoints = None
-        self._client = None
+        self._shared = _SharedResources()
+        self._released = False
         self._headers = {
             "x-lumapps-analytics": "off",
             "User-Agent": f"lumapps-sdk {__version__}",
         }
         self._extra_http_headers = extra_http_headers or {}
+        # (token, headers) of the last request, the headers only change with the
+        # token
+        self._request_headers: Optional[Tuple[str, Dict[str, str]]] = None
         self.api_info = api_info
         self._discovery_url, self._api_url = _get_discovery_urls(
             self.base_url, self.api_info
         )
+        if token_getter and not isinstance(token_getter, TokenManager):
+            token_getter = TokenManager(token_getter)
         self.token_getter = token_getter
         self.token = token
-        self.cursor = None
+        if token and self.token_manager:
+            self.token_manager.seed(token)
+        self.cursor: Optional[str] = None
+        # Kept while a client uses them
+        self._token_managers: "WeakValueDictionary[Tuple[str, str], TokenManager]"
+        self._token_managers = WeakValueDictionary()
+        self._token_managers_lock = Lock()
 
     def __exit__(self, *exc):
         self.close()
         return False
 
     def close(self):
-        if self._client:
-            self._client.close()
-            self._client = None
+        """Release the connection pool, closing it unless a derived client still
+        uses it."""
+        if self._released:
+            return
+        self._released = True
+        client = self._shared.release()
+        if client:
+            client.close()
+
+    def _share_resources(self, other: "BaseClient") -> None:
+        """Make a derived client use the connection pool and the discovery data
+        of this one, its authentication stays its own."""
+        self._shared.acquire()
+        other._shared = self._shared
 
     @property
     def base_url(self):
@@ -153,8 +394,20 @@ class BaseClient(AbstractContextManager):
         self._token = v
         self._headers["authorization"] = f"Bearer {self._token}"
 
-    def _create_client(self):
-        kwargs = {
+    @property
+    def coalesced_calls(self) -> int:
+        """The number of calls served by an identical call already in flight."""
+        return self._singleflight.coalesced
+
+    @property
+    def token_manager(self) -> Optional[TokenManager]:
+        """The TokenManager handling the token of this client, if any."""
+        if isinstance(self.token_getter, TokenManager):
+            return self.token_getter
+        return None
+
+    def _client_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {
             "base_url": self.base_url,
             "verify": not self.no_verify,
             "timeout": 120,
@@ -175,58 +428,215 @@ class BaseClient(AbstractContextManager):
 
         if not self._auth_info and not self._token:
             raise BaseClientError("No authentication provided (auth_info or token).")
-        return Client(**kwargs)
+        return kwargs
+
+    def _create_client(self):
+        return Client(**self._client_kwargs())
+
+    @property
+    def _client(self) -> Any:
+        return self._shared.client
+
+    @_client.setter
+    def _client(self, client: Any) -> None:
+        self._shared.client = client
 
     @property
     def client(self) -> Client:
         """Setup the client object."""
-        if self._client is None:
-            self._client = self._create_client()
-        return self._client
+        shared = self._shared
+        client = shared.client
+        if client is not None and not self._released:
+            return client
+        with shared.lock:
+            if self._released:
+                shared.acquire()
+                self._released = False
+            if shared.client is None:
+                shared.client = self._create_client()
+            return shared.client
 
-    @property  # type: ignore
-    @lru_cache()
-    def discovery_doc(self):
-        url = self._discovery_url
-        d = get_discovery_cache().get(url)
+    def _get_cached_discovery_doc(self) -> Optional[Dict[str, Any]]:
+        d = get_discovery_cache().get(self._discovery_url)
         if d and isinstance(d, str):
             return loads(d)
         elif d and isinstance(d, dict):
             return d
+        return None
+
+    def _store_discovery_doc(self, resp_doc: Dict[str, Any]) -> Dict[str, Any]:
+        discovery_base_url = urlparse(resp_doc["baseUrl"])
+        resp_doc["baseUrl"] = discovery_base_url._replace(
+            netloc=urlparse(self.base_url).netloc
+        ).geturl()
+        discovery_root_url = urlparse(resp_doc["rootUrl"])
+        resp_doc["rootUrl"] = discovery_root_url._replace(
+            netloc=urlparse(self.base_url).netloc
+        ).geturl()
+
+        get_discovery_cache().set(self._discovery_url, resp_doc)
+        return resp_doc
+
+    @property
+    def discovery_doc(self):
+        """The discovery document, loaded from the cache or from the network.
+
+        An expired document is served as is while it is refreshed in the
+        background, unless it is older than DISCOVERY_MAX_STALE. The refresh
+        is conditional and the document is only rebuilt when its content
+        changed.
+        """
+        shared = self._shared
+        if shared.discovery_doc is None:
+            with shared.lock:
+                if shared.discovery_doc is None:
+                    shared.discovery_doc = self._load_discovery_doc()
+        self._revalidate_discovery()
+        return shared.discovery_doc
+
+    @staticmethod
+    def _get_discovery_cache_entry(key: str) -> Optional[Tuple[Any, datetime]]:
+        cache = get_discovery_cache()
+        get_entry = getattr(cache, "get_entry", None)
+        if get_entry is None:
+            # A cache without entries only gives the fresh values
+            value = cache.get(key)
+            return (value, datetime.now() + CACHE_MAX_AGE) if value else None
+        return get_entry(key)
+
+    def _load_discovery_doc(self) -> Dict[str, Any]:
+        shared = self._shared
+        entry = self._get_discovery_cache_entry(self._discovery_url)
+        if entry and entry[0]:
+            d, expiry = entry
+            now = datetime.now()
+            if expiry >= now or now - expiry < DISCOVERY_MAX_STALE:
+                _count_discovery("fresh" if expiry >= now else "stale_served")
+                shared.discovery_expires_at = expiry.timestamp()
+                return loads(d) if isinstance(d, str) else d
+            _count_discovery("expired_blocking_fetches")
+        _count_discovery("blocking_fetches")
+        resp = self.client.get(self._discovery_url)
+        d = self._save_discovery(loads(resp.content), resp)
+        shared.discovery_expires_at = time() + CACHE_MAX_AGE.total_seconds()
+        return d
+
+    def _save_discovery(
+        self, resp_doc: Dict[str, Any], resp: Optional[Response] = None
+    ) -> Dict[str, Any]:
+        """Store a discovery document and the validators of its response."""
+        with getattr(get_discovery_cache(), "transaction", nullcontext)():
+            d = self._store_discovery_doc(resp_doc)
+            if resp is not None:
+                self._store_discovery_validators(resp)
+        return d
+
+    def _store_discovery_validators(self, resp: Response) -> None:
+        get_discovery_cache().set(
+            _validators_key(self._discovery_url),
+            {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "digest": sha256(resp.content).hexdigest(),
+            },
+        )
+
+    def _revalidate_discovery(self) -> None:
+        """Refresh the discovery data in the background if it expired."""
+        shared = self._shared
+        expires_at = shared.discovery_expires_at
+        if expires_at is None or time() < expires_at:
+            return
+        with shared.lock:
+            if shared.discovery_expires_at is None or (
+                shared.refresh_thread and shared.refresh_thread.is_alive()
+            ):
+                return
+            shared.refresh_thread = Thread(
+                target=self._refresh_discovery, name="lumapps-discovery", daemon=True
+            )
+            shared.refresh_thread.start()
+
+    def _refresh_discovery(self) -> None:
+        validators, headers = self._discovery_refresh_request()
+        try:
+            resp = self.client.get(self._discovery_url, headers=headers)
+            self._apply_discovery_refresh(resp, validators)
+        except Exception as err:
+            self._discovery_refresh_failed(err)
+
+    def _discovery_refresh_request(self) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """The validators of the cached discovery document and the headers of
+        the conditional request revalidating it."""
+        entry = self._get_discovery_cache_entry(_validators_key(self._discovery_url))
+        validators = entry[0] if entry else {}
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return validators, headers
+
+    def _apply_discovery_refresh(
+        self, resp: Response, validators: Dict[str, Any]
+    ) -> None:
+        """Store the discovery data of a revalidation response."""
+        shared = self._shared
+        if resp.status_code != 304:
+            resp.raise_for_status()
+        unchanged = resp.status_code == 304 or (
+            sha256(resp.content).hexdigest() == validators.get("digest")
+        )
+        cached = self._get_discovery_cache_entry(self._discovery_url)
+        if unchanged and cached:
+            # Extend the cached document and snapshot, nothing to rebuild
+            d = cached[0]
+            self._save_discovery(
+                loads(d) if isinstance(d, str) else d,
+                None if resp.status_code == 304 else resp,
+            )
+            key = self._index_snapshot_key()
+            if shared.index is not None and key:
+                save_index_snapshot(key, shared.index)
+            _count_discovery("not_modified")
+        elif resp.status_code == 304:
+            raise BaseClientError("Not modified but no cached discovery")
         else:
-            resp = self.client.get(url)
-            resp_doc = resp.json()
-
-            discovery_base_url = urlparse(resp_doc["baseUrl"])
-            resp_doc["baseUrl"] = discovery_base_url._replace(
-                netloc=urlparse(self.base_url).netloc
-            ).geturl()
-            discovery_root_url = urlparse(resp_doc["rootUrl"])
-            resp_doc["rootUrl"] = discovery_root_url._replace(
-                netloc=urlparse(self.base_url).netloc
-            ).geturl()
-
-            get_discovery_cache().set(url, resp_doc)
-            return resp_doc
-
-    def _prune(self, name_parts, content):
-        """Prune the api response."""
+            old_key = self._index_snapshot_key()
+            d = self._save_discovery(loads(resp.content), resp)
+            index = DiscoveryIndex.from_discovery(d)
+            key = self._index_snapshot_key()
+            if old_key and old_key != key:
+                remove_index_snapshot(old_key)
+            if key:
+                save_index_snapshot(key, index)
+            with shared.lock:
+                shared.discovery_doc = d
+                shared.index = index
+                shared.endpoints = None
+            _count_discovery("rebuilt")
+        shared.discovery_expires_at = time() + CACHE_MAX_AGE.total_seconds()
+
+    def _discovery_refresh_failed(self, err: Exception) -> None:
+        warning(f"Failed to refresh the discovery document: {err}")
+        _count_discovery("refresh_errors")
+        self._shared.discovery_expires_at = time() + DISCOVERY_REFRESH_RETRY
+
+    def _prune(self, name_parts, content, trie: Optional[PruneTrie] = None):
+        """Prune the api response.
+
+        Args:
+            name_parts: The endpoint
+            content: The response, pruned in place
+            trie: The compiled filters of the endpoint, to avoid compiling them
+                for each object of a listing
+        """
         if not self.prune:
             return content
-        for ep_filter in FILTERS:
-            ep_filter_parts = ep_filter.split("/")
-            if len(name_parts) != len(ep_filter_parts):
-                continue
-            for filter_part, part in zip(ep_filter_parts, name_parts):
-                if filter_part not in ("*", part):
-                    break
-            else:
-                for pth in FILTERS[ep_filter]:
-                    if isinstance(content, list):
-                        for o in content:
-                            pop_matches(pth, o)
-                    else:
-                        pop_matches(pth, content)
+        if trie is None:
+            trie = compile_prune_filters(name_parts)
+        if trie:
+            apply_prune_trie(trie, content)
         return content
 
     def get_new_client_as_using_dwd(self, _user_email: str) -> "BaseClient":
@@ -245,23 +655,96 @@ class BaseClient(AbstractContextManager):
         Returns:
             BaseClient: A new instance of the BaseClient correctly authenticated.
         """
-        return BaseClient(
+        client = BaseClient(
             auth_info=self._auth_info,
             api_info=self.api_info,
             no_verify=self.no_verify,
             proxy_info=self.proxy_info,
             prune=self.prune,
-            token_getter=lambda: fetch_access_token(
-                self.client, self.base_url, self._auth_info, customer_id, user_email
+            token_getter=self._get_token_manager(
+                customer_id,
+                user_email,
+                lambda: fetch_access_token(
+                    self.client, self.base_url, self._auth_info, customer_id, user_email
+                ),
             ),
             extra_http_headers=self._extra_http_headers,
+            rate_limiter=self.rate_limiter,
+            concurrency_limiter=self.concurrency_limiter,
+            retry_policy=self.retry_policy,
+            coalesce_reads=self.coalesce_reads,
+            project_fields=self.project_fields,
+            response_cache=self.response_cache,
         )
+        client._cache_scope = f"{customer_id}|{user_email}"
+        self._share_resources(client)
+        return client
+
+    def _get_token_manager(
+        self,
+        customer_id: str,
+        user_email: str,
+        token_getter: TokenGetter,
+        manager_class: Type[TokenManager] = TokenManager,
+    ) -> TokenManager:
+        """Get the TokenManager shared by the clients derived for a user."""
+        key = (customer_id, user_email)
+        with self._token_managers_lock:
+            manager = self._token_managers.get(key)
+            if manager is None:
+                manager = self._token_managers[key] = manager_class(token_getter)
+            return manager
+
+    def _drop_token_manager(self, customer_id: str, user_email: str) -> None:
+        """Stop sharing the TokenManager of a user with the next derived
+        clients, eg when the user is evicted from a ClientPool."""
+        with self._token_managers_lock:
+            self._token_managers.pop((customer_id, user_email), None)
+
+    @property
+    def discovery_index(self) -> DiscoveryIndex:
+        """The compiled endpoint index of the discovery document.
+
+        It is loaded from a snapshot when there is a fresh one, so that the
+        calls do not need the discovery document to be parsed.
+        """
+        shared = self._shared
+        if shared.index is None:
+            with shared.lock:
+                if shared.index is None:
+                    key = self._index_snapshot_key()
+                    snapshot = load_index_snapshot(key) if key else None
+                    if snapshot:
+                        index, expires_at = snapshot
+                        if shared.discovery_expires_at is None:
+                            # Revalidated like the document it replaces
+                            shared.discovery_expires_at = expires_at
+                    else:
+                        index = DiscoveryIndex.from_discovery(self.discovery_doc)
+                        # The validators are stored with a fetched document
+                        key = self._index_snapshot_key()
+                        if key:
+                            save_index_snapshot(key, index)
+                    shared.index = index
+        self._revalidate_discovery()
+        return shared.index
+
+    def _index_snapshot_key(self) -> Optional[str]:
+        """The key of the index snapshot of the cached discovery document, None
+        when the version of the document is not known."""
+        entry = self._get_discovery_cache_entry(_validators_key(self._discovery_url))
+        validators = entry[0] if entry else None
+        version = validators and (validators.get("etag") or validators.get("digest"))
+        if not version:
+            return None
+        return index_snapshot_key(self._discovery_url, self.base_url, version)
 
     @property
     def endpoints(self):
-        if self._endpoints is None:
-            self._endpoints = get_endpoints(self.discovery_doc)
-        return self._endpoints
+        shared = self._shared
+        if shared.endpoints is None:
+            shared.endpoints = get_endpoints(self.discovery_doc)
+        return shared.endpoints
 
     def get_help(self, name_parts, debug=False):
         help_lines = []
@@ -276,7 +759,7 @@ class BaseClient(AbstractContextManager):
         if "description" in ep_info:
             add_line(ep_info["description"].strip() + "\n")
         if debug:
-            add_line(dumps(ep_info, indent=4, sort_keys=True))
+            add_line(dumps(ep_info, indent=True, sort_keys=True))
         params = ep_info.get("parameters", {})
         if method == "POST":
             params.update(
@@ -312,65 +795,251 @@ class BaseClient(AbstractContextManager):
         fmt = "  {{: <{}}}  {{}}".format(longest_name)
         return "\n".join(fmt.format(*li2) for li2 in lines)
 
-    def _expand_path(self, path, endpoint: dict, params: dict):
-        param_specs = endpoint.get("parameters", {})
-        path_args: dict = {}
-        for param, specs in param_specs.items():
-            if specs.get("required") is True and param not in params:
+    def _expand_path(self, path, endpoint: Union[dict, EndpointSpec], params: dict):
+        if isinstance(endpoint, dict):
+            endpoint = EndpointSpec.from_method(endpoint)
+        for param in endpoint.required_params:
+            if param not in params:
                 raise BadCallError(f"Missing required parameter {param}")
-            if specs["location"] == "path":
-                path_args[param] = None
-        if path_args:
-            for param in path_args:
-                path_args[param] = params.pop(param)
+        if endpoint.path_params:
+            path_args = {param: params.pop(param) for param in endpoint.path_params}
             path = path.format(**path_args)
         return path
 
-    @lru_cache()
-    def _get_endpoint_and_path_from_discovery(self, name_parts):
-        endpoint = method_from_discovery(self.discovery_doc, name_parts)
-        if not endpoint:
-            raise BadCallError(f"Endpoint {'.'.join(name_parts)} not found")
-        if endpoint.get("mediaUpload"):
-            raise BadCallError(
-                f"Endpoint {'.'.join(name_parts)} is for uploads, "
-                f"use upload_call method instead of get_call or iter_call"
+    def _get_verb_path_params(self, name_parts, params: dict):
+        plan = get_call_plan(self.discovery_index, self._api_url, tuple(name_parts))
+        return plan.build(params)
+
+    def _get_token(self) -> Optional[str]:
+        if self.token_manager:
+            self.token = self.token_manager.get_token()
+        return self.token
+
+    def _get_request_headers(self, token, headers: Optional[Dict[str, str]] = None):
+        cached = self._request_headers
+        if cached is None or cached[0] != token:
+            cached = (
+                token,
+                {
+                    **self._extra_http_headers,
+                    **self._headers,
+                    "authorization": f"Bearer {token}",
+                },
             )
-        path = self._api_url + "/" + endpoint.get("path") or "/".join(name_parts)
-        return endpoint, path
+            self._request_headers = cached
+        return {**cached[1], **headers} if headers else cached[1]
 
-    def _get_verb_path_params(self, name_parts, params: dict):
-        endpoint, path = self._get_endpoint_and_path_from_discovery(tuple(name_parts))
-        path = self._expand_path(path, endpoint, params)
-        verb = endpoint.get("httpMethod")
-        return verb, path, params
+    def _request(
+        self,
+        verb: str,
+        path: str,
+        params: dict,
+        json,
+        token,
+        headers=None,
+        stream=False,
+        family: str = "",
+    ):
+        limiter = self.concurrency_limiter
+        started = limiter.acquire() if limiter else 0.0
+        status_code = None
+        try:
+            kwargs = dict(
+                params=params,
+                **_json_body(json, self._get_request_headers(token, headers)),
+            )
+            if stream:
+                # Returned once its headers are received, the body is read later
+                request = self.client.build_request(verb, path, **kwargs)
+                resp = self.client.send(request, stream=True)
+            else:
+                resp = self.client.request(verb, path, **kwargs)
+            status_code = resp.status_code
+            return resp
+        finally:
+            if limiter:
+                limiter.release(started, status_code, family)
+
+    def _send(
+        self,
+        name_parts: Sequence[str],
+        verb: str,
+        path: str,
+        params,
+        json,
+        headers,
+        stream: bool = False,
+    ):
+        """Send a request, refreshing the token once on a 401 response."""
+        if self.rate_limiter:
+            self.rate_limiter.acquire(verb, name_parts)
+        family = "/".join(name_parts)
+        token = self._get_token()
+        resp = self._request(verb, path, params, json, token, headers, stream, family)
+        if resp.status_code == 401 and self.token_manager:
+            # Token expired, fetch new token and retry!
+            resp.close()
+            self.token_manager.invalidate(token)
+            token = self._get_token()
+            resp = self._request(
+                verb, path, params, json, token, headers, stream, family
+            )
+        return resp
+
+    def _retry_delay(
+        self,
+        verb: str,
+        name_parts: Sequence[str],
+        attempt: int,
+        resp: Optional[Response],
+        err: Optional[TransportError],
+    ) -> Optional[float]:
+        """The time to wait before retrying a call, None to not retry it."""
+        policy = self.retry_policy
+        if policy:
+            retry = policy.should_retry(verb, name_parts, attempt, resp, err)
+            return policy.record("/".join(name_parts), attempt, resp, err, retry)
+        if (
+            resp is not None
+            and resp.status_code == 429
+            and self.rate_limiter
+            and attempt <= self.rate_limiter.max_throttle_retries
+        ):
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            return (
+                self.rate_limiter.default_pause if retry_after is None else retry_after
+            )
+        return None
 
     def _call(self, name_parts: Sequence[str], params: dict, json=None):
         """Construct the call"""
-        if not self.token and self.token_getter:
-            self.token, _ = self.token_getter()
         verb, path, params = self._get_verb_path_params(name_parts, params)
-        resp = self.client.request(
-            verb,
-            path,
-            params=params,
-            json=json,
-            headers={**self._extra_http_headers, **self._headers},
-        )
-        if resp.status_code == 401 and self.token_getter:
-            # Token expired, fetch new token and retry!
-            self.token, _ = self.token_getter()
-            resp = self.client.request(
-                verb,
-                path,
-                params=params,
-                json=json,
-                headers={**self._extra_http_headers, **self._headers},
-            )
+        call = partial(self._fetch, name_parts, verb, path, params, json)
+        if self.coalesce_reads and is_read_endpoint(verb, name_parts):
+            key = dumps([verb, path, params, json], sort_keys=True, default=str)
+            return self._singleflight.do(key, call)
+        return call()
+
+    @staticmethod
+    def _read(resp: Response):
         resp.raise_for_status()
         if not resp.content:
             return None
-        return resp.json()
+        return loads(resp.content)
+
+    def _fetch(
+        self, name_parts: Sequence[str], verb: str, path: str, params: dict, json
+    ):
+        """Get the result of a call, from the response cache when possible."""
+        cache = self.response_cache
+        if cache is None:
+            return self._read(
+                self._call_with_retries(name_parts, verb, path, params, json)
+            )
+        if not is_read_endpoint(verb, name_parts):
+            try:
+                return self._read(
+                    self._call_with_retries(name_parts, verb, path, params, json)
+                )
+            finally:
+                cache.invalidate(name_parts)
+        endpoint = "/".join(name_parts)
+        rule = cache.rule_for(endpoint)
+        if rule is None:
+            return self._read(
+                self._call_with_retries(name_parts, verb, path, params, json)
+            )
+        key = cache.key(endpoint, self._response_cache_scope(), params, json)
+        entry = cache.get(key)
+        headers = None
+        if entry is not None:
+            if entry["expires_at"] > time():
+                cache.hits += 1
+                return self._read_cached(entry, verb, path)
+            if entry.get("etag"):
+                headers = {"If-None-Match": entry["etag"]}
+        cache.misses += 1
+        resp = self._call_with_retries(name_parts, verb, path, params, json, headers)
+        if resp.status_code == 304 and entry is not None:
+            cache.refresh(key, rule, entry)
+            return self._read_cached(entry, verb, path)
+        if resp.status_code == 404 and rule.cache_not_found:
+            cache.set(key, rule, 404)
+        result = self._read(resp)
+        cache.set(key, rule, resp.status_code, result, resp.headers.get("ETag"))
+        return result
+
+    def _response_cache_scope(self) -> str:
+        """Who the cached responses of the client are for: the server, the
+        platform and the user, or the token when the user is not known."""
+        identity = self._cache_scope
+        if not identity:
+            token = self._get_token() or ""
+            identity = "token:" + sha256(token.encode()).hexdigest()
+        org = self._extra_http_headers.get("LumApps-Organization-Id", "")
+        return f"{self.base_url}|{org}|{identity}"
+
+    def _read_cached(self, entry: Dict[str, Any], verb: str, path: str):
+        if entry["status"] == 404:
+            # Fail like the call would have
+            request = Request(verb, self.client.base_url.join(path))
+            return self._read(Response(404, request=request))
+        return deepcopy(entry["body"])
+
+    def _call_with_retries(
+        self,
+        name_parts: Sequence[str],
+        verb: str,
+        path: str,
+        params: dict,
+        json,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+    ) -> Response:
+        attempt = 0
+        while True:
+            attempt += 1
+            resp, err = None, None
+            try:
+                resp = self._send(name_parts, verb, path, params, json, headers, stream)
+            except TransportError as e:
+                err = e
+            delay = self._retry_delay(verb, name_parts, attempt, resp, err)
+            if delay is None:
+                break
+            if resp is not None:
+                resp.close()
+            if resp is not None and resp.status_code == 429 and self.rate_limiter:
+                # Hold back all the calls sharing the bucket, not only this one
+                self.rate_limiter.throttle(verb, name_parts, delay)
+            elif self.retry_policy:
+                self.retry_policy.sleep(delay)
+        if err is not None:
+            raise err
+        return resp  # type: ignore
+
+    def _project(
+        self,
+        name_parts: Sequence[str],
+        params: dict,
+        body: Any,
+        needed_fields: Optional[Sequence[str]],
+        trie: Optional[PruneTrie],
+    ) -> None:
+        """Add the `fields` parameter of a call, unless the caller gave it."""
+        if "fields" in params or (isinstance(body, dict) and "fields" in body):
+            return
+        if not trie or not self.project_fields:
+            trie = None
+        if not needed_fields and not trie:
+            return
+        spec = self.discovery_index.get(tuple(name_parts))
+        shape = spec.response if spec else None
+        if shape is None:
+            shape = response_shape(self.discovery_doc, name_parts)
+        fields = select_fields(shape, needed_fields, trie)
+        if fields:
+            params["fields"] = fields
 
     @staticmethod
     def _pop_body(params: dict):
@@ -378,14 +1047,9 @@ class BaseClient(AbstractContextManager):
         body = loads(body) if isinstance(body, str) else body
         return body
 
-    def upload(self, file_content: FileContent, metadata: dict, *name_parts, **params):
-        name_parts = _parse_endpoint_parts(name_parts)
-        endpoint: Any = method_from_discovery(self.discovery_doc, name_parts)  # type: ignore  # noqa
-        if not endpoint.get("mediaUpload"):
-            raise BadCallError(
-                f"Endpoint {'.'.join(name_parts)} is not for uploads, "
-                f"use get_call or iter_call instead."
-            )
+    def _get_upload_request(
+        self, endpoint: dict, file_content: FileContent, metadata: dict, params: dict
+    ):
         verb = endpoint.get("httpMethod")
         upload_specs = endpoint["mediaUpload"]["protocols"]["simple"]
         path: Any = self.discovery_doc["rootUrl"].rstrip("/") + upload_specs["path"]  # type: ignore  # noqa
@@ -398,6 +1062,19 @@ class BaseClient(AbstractContextManager):
             ),
             "file": file_content,
         }
+        return verb, path, params, files
+
+    def upload(self, file_content: FileContent, metadata: dict, *name_parts, **params):
+        name_parts = _parse_endpoint_parts(name_parts)
+        endpoint: Any = method_from_discovery(self.discovery_doc, name_parts)  # type: ignore  # noqa
+        if not endpoint.get("mediaUpload"):
+            raise BadCallError(
+                f"Endpoint {'.'.join(name_parts)} is not for uploads, "
+                f"use get_call or iter_call instead."
+            )
+        verb, path, params, files = self._get_upload_request(
+            endpoint, file_content, metadata, params
+        )
         resp = self.client.request(verb, path, params=params, files=files)
         resp.raise_for_status()
         return resp.json()
@@ -409,16 +1086,30 @@ class BaseClient(AbstractContextManager):
             return self.upload(fh, metadata, *name_parts, **params)
 
     def get_call(
-        self, *name_parts, **params
-    ) -> Union[Dict[str, Any], List[Dict[str, Any]], None]:
+        self,
+        *name_parts,
+        needed_fields: Optional[Sequence[str]] = None,
+        max_items: Optional[int] = None,
+        page_size: Optional[int] = None,
+        on_page: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+        **params,
+    ) -> Union[Dict[str, Any], List[Dict[str, Any]], int, None]:
         """Generic function to call a lumapps endpoint
 
         Args:
             *name_parts: Endpoint, eg user/get or "user", "get"
+            needed_fields: The fields of the objects used by the caller, the
+                others are left out of the response, eg ["id", "slug"]
+            max_items: The maximum number of items of a listing to get, the
+                pages beyond them are not fetched
+            page_size: The number of items per page of a listing (maxResults)
+            on_page: What to call with the items of each page of a listing,
+                instead of returning all of them
             **params: Parameters of the call
 
         Returns:
-            Object or objects returned by the endpoint call.
+            Object or objects returned by the endpoint call. With on_page, the
+            number of items of the listing.
 
         Example:
             List feedtypes in LumApps:
@@ -428,46 +1119,143 @@ class BaseClient(AbstractContextManager):
 
                 >>> feedtypes = get_call("feedtype/list")
                 >>> print(feedtypes)
+
+            Count the contents of each type without holding them:
+
+                >>> counts = Counter()
+                >>> get_call(
+                ...     "content/list",
+                ...     body={"lang": "en"},
+                ...     on_page=lambda items: counts.update(i["type"] for i in items),
+                ... )
         """
         name_parts = _parse_endpoint_parts(name_parts)
         items: List[dict] = []
         self.cursor = cursor = params.pop("cursor", None)
         body = self._pop_body(params)
+        trie = compile_prune_filters(name_parts) if self.prune else None
+        self._project(name_parts, params, body, needed_fields, trie)
+        pager = _Pager(params, body, max_items, page_size)
         while True:
-            if cursor:
-                if body is not None:
-                    body["cursor"] = cursor
-                else:
-                    params["cursor"] = cursor
+            pager.prepare(cursor)
             response = self._call(name_parts, params, body)
             if response is None:
                 return None
 
             more = response.get("more")
             response_items = response.get("items")
-            if more:
-                if response_items:
-                    self.cursor = cursor = response["cursor"]
-                    items.extend(response_items)
-                else:
-                    # No results but a more field set to true ...
-                    # ie, the api return something wrong
-                    self.cursor = cursor = None
-                    return self._prune(name_parts, items)
+            if not response_items:
+                # No results, or no results but a more field set to true ...
+                # ie, the api return something wrong
+                self.cursor = None
+                if on_page:
+                    return pager.count
+                if items or more or more is False:
+                    return items
+                # Not a listing
+                return self._prune(name_parts, response, trie)
+
+            response_items = self._prune(name_parts, pager.take(response_items), trie)
+            if on_page:
+                on_page(response_items)
+            else:
+                items.extend(response_items)
+            if more and not pager.done:
+                self.cursor = cursor = response["cursor"]
             else:
                 # No more result to get
-                if response_items:
-                    self.cursor = cursor = None
-                    items.extend(response_items)
-                    return self._prune(name_parts, items)
-                else:
-                    # No results, return
-                    self.cursor = cursor = None
-                    # special case of
-                    return [] if more is False else self._prune(name_parts, response)
+                self.cursor = pager.next_cursor(response)
+                return pager.count if on_page else items
+
+    def _iter_pages(
+        self,
+        name_parts: Sequence[str],
+        params: dict,
+        body,
+        cursor: Optional[str],
+        pager: _Pager,
+    ) -> Generator[Tuple[Optional[str], List[Dict[str, Any]]], None, None]:
+        """Yield the items of each page along with the cursor of the next one."""
+        while True:
+            pager.prepare(cursor)
+            response = self._call(name_parts, params, body)
+            more = response.get("more")
+            items = response.get("items")
+
+            if not items:
+                # Either the last page or the api returned something wrong
+                # (no results but a more field set to true)
+                return
+            items = pager.take(items)
+            if more and not pager.done:
+                cursor = response["cursor"]
+                yield cursor, items
+            else:
+                yield pager.next_cursor(response), items
+                return
+
+    def _stream_items(
+        self,
+        name_parts: Sequence[str],
+        params: dict,
+        body,
+        trie: Optional[PruneTrie],
+        pager: _Pager,
+    ) -> Generator[Dict[str, Any], None, Tuple[Optional[Dict[str, Any]], int]]:
+        """Yield the items of a page as they are received.
+
+        Returns:
+            The page without its items and the number of items
+        """
+        verb, path, params = self._get_verb_path_params(name_parts, params)
+        resp = self._call_with_retries(
+            name_parts, verb, path, params, body, stream=True
+        )
+        try:
+            if resp.is_error:
+                resp.read()
+                resp.raise_for_status()
+            decoder = ListingDecoder()
+            for chunk in resp.iter_bytes():
+                for item in pager.take(decoder.feed(chunk)):
+                    if trie:
+                        apply_prune_trie(trie, item)
+                    yield item
+            return decoder.close(), decoder.count
+        finally:
+            resp.close()
+
+    def _iter_stream(
+        self,
+        name_parts: Sequence[str],
+        params: dict,
+        body,
+        cursor: Optional[str],
+        trie: Optional[PruneTrie],
+        pager: _Pager,
+    ) -> Generator[Dict[str, Any], None, None]:
+        while True:
+            pager.prepare(cursor)
+            response, count = yield from self._stream_items(
+                name_parts, params, body, trie, pager
+            )
+            if not response or not response.get("more") or not count:
+                self.cursor = None
+                return
+            if pager.done:
+                self.cursor = pager.next_cursor(response)
+                return
+            self.cursor = cursor = response["cursor"]
 
     def iter_call(
-        self, *name_parts, **params
+        self,
+        *name_parts,
+        prefetch: int = 0,
+        needed_fields: Optional[Sequence[str]] = None,
+        stream: bool = False,
+        max_items: Optional[int] = None,
+        page_size: Optional[int] = None,
+        **params,
     ) -> Generator[
         Union[Dict[str, Any], List[Dict[str, Any]]],
         Union[Dict[str, Any], List[Dict[str, Any]]],
@@ -476,6 +1264,17 @@ class BaseClient(AbstractContextManager):
         """
         Args:
             *name_parts: Endpoint, eg user/get or "user", "get"
+            prefetch: Number of pages to fetch in advance on a background thread
+                while the current page is being consumed, 0 to disable
+            needed_fields: The fields of the objects used by the caller, the
+                others are left out of the response, eg ["id", "slug"]
+            stream: Whether to decode the items of each page as they are
+                received rather than once the page is, so that a single item
+                is held in memory. The response cache and the coalescing of
+                reads are not used, prefetch cannot be used with it.
+            max_items: The maximum number of items to get, the pages beyond
+                them are not fetched
+            page_size: The number of items per page (maxResults)
             **params: Parameters of the call
 
         Yields:
@@ -494,41 +1293,66 @@ class BaseClient(AbstractContextManager):
         name_parts = _parse_endpoint_parts(name_parts)
         self.cursor = cursor = params.pop("cursor", None)
         body = self._pop_body(params)
-        while True:
-            if cursor:
-                if body is not None:
-                    body["cursor"] = cursor
-                else:
-                    params["cursor"] = cursor
+        trie = compile_prune_filters(name_parts) if self.prune else None
+        self._project(name_parts, params, body, needed_fields, trie)
+        pager = _Pager(params, body, max_items, page_size)
+        if stream:
+            if prefetch:
+                raise ValueError("prefetch cannot be used with stream")
+            yield from self._iter_stream(name_parts, params, body, cursor, trie, pager)
+            return
+        pages: Iterable = self._iter_pages(name_parts, params, body, cursor, pager)
+        if prefetch:
+            pages = prefetch_iter(pages, prefetch)
+        cursor = None
+        for cursor, items in pages:
+            self.cursor = cursor
+            if trie:
+                apply_prune_trie(trie, items)
+            yield from items
+        self.cursor = cursor
 
-            response = self._call(name_parts, params, body)
-            more = response.get("more")
-            items = response.get("items")
+    def gather(self, *calls: Callable[[], Any], max_concurrency: int = 10) -> List[Any]:
+        """Run independent calls concurrently over the shared connection pool.
 
-            if more:
-                if items:
-                    # Yield the results and continue the loop
-                    self.cursor = cursor = response["cursor"]
-                    for item in items:
-                        yield self._prune(name_parts, item)
-                else:
-                    # No results but a more field set to true ...
-                    # ie, the api return something wrong
-                    self.cursor = cursor = None
-                    return
-            else:
-                # No more result to get
-                if items:
-                    # Yield the last results and then return
-                    self.cursor = cursor = None
-                    for item in items:
-                        yield self._prune(name_parts, item)
-                    else:
-                        return
-                else:
-                    # No results, return
-                    self.cursor = cursor = None
-                    return
+        Args:
+            *calls: Callables without arguments, eg
+                `functools.partial(client.get_user, email)`
+            max_concurrency: The maximum number of calls in flight at once. The
+                concurrency_limiter of the client, if any, can lower it
+                according to the health of the server.
+
+        Returns:
+            The results in the order of the calls. When a call raises, its
+            exception is returned in place of its result and the other calls
+            are not interrupted.
+        """
+        return run_concurrently(calls, max_concurrency)
+
+    def map_calls(
+        self, endpoint: str, params_list: Iterable[dict], max_concurrency: int = 10
+    ) -> List[Any]:
+        """Call the same endpoint concurrently for each set of parameters
+
+        Args:
+            endpoint: Endpoint, eg user/get
+            params_list: The parameters of each call, as passed to `get_call`
+            max_concurrency: The maximum number of calls in flight at once
+
+        Returns:
+            The results of `get_call` in the order of `params_list`, with the
+            exception of a failed call in place of its result.
+
+        Example:
+            Get several users at once:
+
+                >>> emails = ["a@foo.com", "b@foo.com"]
+                >>> users = map_calls("user/get", [{"email": e} for e in emails])
+        """
+        return self.gather(
+            *(partial(self.get_call, endpoint, **params) for params in params_list),
+            max_concurrency=max_concurrency,
+        )
 
     def get_matching_endpoints(self, name_parts):
         # find exact matches of all parts up to but excluding last
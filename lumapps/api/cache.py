@@ -0,0 +1,409 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic, time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Tuple,
+)
+
+from lumapps.api.codec import dumps, loads
+from lumapps.api.utils import CACHE_MAX_AGE, _get_conn, sqlite_transaction
+
+
+def _json_size(value: Any) -> int:
+    """The approximate size of a value, the length of its JSON form."""
+    return len(dumps(value, default=str))
+
+
+class CacheBackend(Protocol):
+    """What a LumAppsClient cache provides.
+
+    A value set with `ex` is kept `ex` seconds at most. `get` raises a
+    KeyError with `raises=True` when the key is missing or expired, so that a
+    cached None can be told apart.
+    """
+
+    def get(self, key: str, raises: bool = False) -> Any: ...
+
+    def set(self, key: str, value: Any, ex: Optional[float] = None) -> None: ...
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]: ...
+
+    def set_many(
+        self, values: Mapping[str, Any], ex: Optional[float] = None
+    ) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+
+class _Entry(NamedTuple):
+    value: Any
+    expires_at: float
+    size: int
+
+
+class BoundedCache:
+    def __init__(
+        self,
+        max_entries: Optional[int] = 10000,
+        max_bytes: Optional[int] = None,
+        default_ttl: float = CACHE_MAX_AGE.total_seconds(),
+        sweep_interval: float = 60,
+        sizer: Callable[[Any], int] = _json_size,
+        clock: Callable[[], float] = monotonic,
+    ):
+        """An in memory cache bounded in entries and size, with a ttl per entry.
+
+        The least recently used entries are evicted beyond the bounds. The
+        expired entries are dropped when they are read, and all at once every
+        `sweep_interval` seconds when writing.
+
+        Args:
+            max_entries: The maximum number of entries, None for no limit
+            max_bytes: The maximum total size of the values, None for no limit
+            default_ttl: How long an entry is kept when set without `ex`, in
+                seconds
+            sweep_interval: How often the expired entries are dropped, in
+                seconds
+            sizer: What gives the size of a value, only used with max_bytes
+            clock: The monotonic clock to use, in seconds
+
+        Example:
+            >>> client = LumAppsClient(customer_id, None, cache=BoundedCache(5000))
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.sweep_interval = sweep_interval
+        self._sizer = sizer
+        self._clock = clock
+        self._lock = Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._next_sweep = clock() + sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _lookup(self, key: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= now:
+            self._pop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def get(self, key: str, raises: bool = False) -> Any:
+        """Get the value of a key.
+
+        Args:
+            key: The key
+            raises: Whether to raise a KeyError when the key is missing or
+                expired, to tell it apart from a cached None
+
+        Returns:
+            The value, or None when the key is missing or expired
+        """
+        with self._lock:
+            entry = self._lookup(key, self._clock())
+        if entry is None:
+            if raises:
+                raise KeyError(key)
+            return None
+        return entry.value
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Get the values of the keys that are cached, by key."""
+        with self._lock:
+            now = self._clock()
+            found = {}
+            for key in keys:
+                entry = self._lookup(key, now)
+                if entry is not None:
+                    found[key] = entry.value
+        return found
+
+    def _set(self, key: str, value: Any, expires_at: float) -> None:
+        size = self._sizer(value) if self.max_bytes is not None else 0
+        if key in self._entries:
+            self._pop(key)
+        self._entries[key] = _Entry(value, expires_at, size)
+        self._bytes += size
+
+    def set(self, key: str, value: Any, ex: Optional[float] = None) -> None:
+        """Set the value of a key.
+
+        Args:
+            key: The key
+            value: The value
+            ex: How long to keep the value, in seconds, defaults to default_ttl
+        """
+        self.set_many({key: value}, ex)
+
+    def set_many(self, values: Mapping[str, Any], ex: Optional[float] = None) -> None:
+        """Set the values of several keys, with the same ttl."""
+        with self._lock:
+            now = self._clock()
+            expires_at = now + (ex or self.default_ttl)
+            for key, value in values.items():
+                self._set(key, value, expires_at)
+            if now >= self._next_sweep:
+                self._sweep(now)
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _sweep(self, now: float) -> None:
+        expired = [k for k, e in self._entries.items() if e.expires_at <= now]
+        for key in expired:
+            self._pop(key)
+        self.expirations += len(expired)
+        self._next_sweep = now + self.sweep_interval
+
+    def _evict(self) -> None:
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._entries))
+            self._pop(key)
+            self.evictions += 1
+
+
+class SqliteCache:
+    # How often the expired entries are purged from the database, in seconds
+    PURGE_INTERVAL = 600
+
+    def __init__(
+        self,
+        db_file: Optional[str] = None,
+        namespace: str = "lumapps",
+        default_ttl: float = CACHE_MAX_AGE.total_seconds(),
+    ):
+        """A cache in the SDK SQLite database, shared by the processes of a
+        host. The values are stored as JSON, tuples are read back as lists.
+
+        Args:
+            db_file: The database file, defaults to the SDK configuration one
+            namespace: What the keys are prefixed with, to share a database
+                between unrelated caches
+            default_ttl: How long an entry is kept when set without `ex`, in
+                seconds
+        """
+        self.db_file = db_file
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self._next_purge = 0.0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str, raises: bool = False) -> Any:
+        found = self.get_many([key])
+        if key not in found:
+            if raises:
+                raise KeyError(key)
+            return None
+        return found[key]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        conn = _get_conn(self.db_file)
+        if not conn or not keys:
+            return {}
+        found = {}
+        # Keep under the SQLite limit of variables in a statement
+        for i in range(0, len(keys), 500):
+            chunk = {self._key(k): k for k in keys[i : i + 500]}
+            rows = conn.execute(
+                "SELECT key, content FROM kv_cache WHERE expires_at > ? AND key IN "
+                f"({','.join('?' * len(chunk))})",
+                (time(), *chunk),
+            )
+            for row in rows:
+                found[chunk[row["key"]]] = loads(row["content"])
+        return found
+
+    def set(self, key: str, value: Any, ex: Optional[float] = None) -> None:
+        self.set_many({key: value}, ex)
+
+    def set_many(self, values: Mapping[str, Any], ex: Optional[float] = None) -> None:
+        now = time()
+        expires_at = now + (ex or self.default_ttl)
+        with sqlite_transaction(self.db_file) as conn:
+            if not conn:
+                return
+            conn.executemany(
+                "INSERT OR REPLACE INTO kv_cache VALUES (?, ?, ?)",
+                [(self._key(k), expires_at, dumps(v)) for k, v in values.items()],
+            )
+            if now >= self._next_purge:
+                conn.execute("DELETE FROM kv_cache WHERE expires_at <= ?", (now,))
+                self._next_purge = now + self.PURGE_INTERVAL
+
+    def delete(self, key: str) -> None:
+        conn = _get_conn(self.db_file)
+        if conn:
+            conn.execute("DELETE FROM kv_cache WHERE key=?", (self._key(key),))
+
+
+class RedisCache:
+    def __init__(
+        self,
+        redis: Any,
+        namespace: str = "lumapps",
+        default_ttl: float = CACHE_MAX_AGE.total_seconds(),
+    ):
+        """A cache in a Redis server, shared by all the processes using it.
+        The values are stored as JSON, tuples are read back as lists.
+
+        Args:
+            redis: A client of the server, eg a redis.Redis. It needs the get,
+                set (with ex), mget, delete and pipeline methods.
+            namespace: What the keys are prefixed with
+            default_ttl: How long an entry is kept when set without `ex`, in
+                seconds
+
+        Example:
+            >>> cache = RedisCache(redis.Redis(host="cache.local"), "lumapps")
+            >>> client = LumAppsClient(customer_id, None, cache=cache)
+        """
+        self.redis = redis
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _ttl(self, ex: Optional[float]) -> int:
+        # Redis expiries are whole seconds
+        return max(1, int(ex or self.default_ttl))
+
+    def get(self, key: str, raises: bool = False) -> Any:
+        content = self.redis.get(self._key(key))
+        if content is None:
+            if raises:
+                raise KeyError(key)
+            return None
+        return loads(content)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        contents = self.redis.mget([self._key(k) for k in keys])
+        return {k: loads(c) for k, c in zip(keys, contents) if c is not None}
+
+    def set(self, key: str, value: Any, ex: Optional[float] = None) -> None:
+        self.redis.set(self._key(key), dumps(value), ex=self._ttl(ex))
+
+    def set_many(self, values: Mapping[str, Any], ex: Optional[float] = None) -> None:
+        # A single round trip for all the values
+        pipe = self.redis.pipeline()
+        for key, value in values.items():
+            pipe.set(self._key(key), dumps(value), ex=self._ttl(ex))
+        pipe.execute()
+
+    def delete(self, key: str) -> None:
+        self.redis.delete(self._key(key))
+
+
+class LocalRedis:
+    def __init__(self, clock: Callable[[], float] = monotonic):
+        """An in process stand-in for a Redis server, with the subset of the
+        redis.Redis methods used by RedisCache, for tests and development.
+        """
+        self._clock = clock
+        self._lock = Lock()
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+
+    def _get(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= self._clock():
+            del self._data[key]
+            return None
+        return item[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._get(key)
+
+    def mget(self, keys: Iterable[str]) -> List[Optional[bytes]]:
+        with self._lock:
+            return [self._get(k) for k in keys]
+
+    def set(self, key: str, value: Any, ex: Optional[int] = None) -> bool:
+        if isinstance(value, str):
+            value = value.encode()
+        expires_at = self._clock() + ex if ex is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(self._data.pop(k, None) is not None for k in keys)
+
+    def pipeline(self) -> "_LocalPipeline":
+        return _LocalPipeline(self)
+
+
+class _LocalPipeline:
+    def __init__(self, redis: LocalRedis):
+        self._redis = redis
+        self._commands: List[Tuple[str, tuple, dict]] = []
+
+    def set(self, *args, **kwargs) -> "_LocalPipeline":
+        self._commands.append(("set", args, kwargs))
+        return self
+
+    def delete(self, *args) -> "_LocalPipeline":
+        self._commands.append(("delete", args, {}))
+        return self
+
+    def execute(self) -> List[Any]:
+        commands, self._commands = self._commands, []
+        return [getattr(self._redis, c)(*a, **kw) for c, a, kw in commands]
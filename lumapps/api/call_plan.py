@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from string import Formatter
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from lumapps.api.discovery_index import DiscoveryIndex, EndpointSpec
+from lumapps.api.errors import BadCallError
+
+# The plans kept, the least recently used ones are dropped beyond, eg the ones
+# of the previous versions of a discovery document
+MAX_CALL_PLANS = 4096
+
+_plans: "OrderedDict[Tuple[str, str, Tuple[str, ...]], CallPlan]" = OrderedDict()
+_plans_lock = Lock()
+
+
+class CallPlan:
+    __slots__ = ("verb", "path", "required", "_required", "_segments", "_positions")
+
+    def __init__(self, spec: EndpointSpec, api_url: str):
+        """How to build the requests of an endpoint, compiled from its spec.
+
+        Args:
+            spec: The EndpointSpec of the endpoint
+            api_url: The url the endpoint paths are relative to
+        """
+        self.verb: Optional[str] = spec.verb
+        self.path = f"{api_url}/{spec.path}"
+        self.required = spec.required_params
+        self._required = frozenset(spec.required_params)
+        # The path split into its literal parts and placeholders, the
+        # positions are the indexes of the placeholders in the segments
+        self._segments: List[str] = []
+        self._positions: List[Tuple[int, str]] = []
+        if spec.path_params:
+            for literal, field, _, _ in Formatter().parse(self.path):
+                self._segments.append(literal)
+                if field is not None:
+                    self._positions.append((len(self._segments), field))
+                    self._segments.append("")
+
+    def build(self, params: dict) -> Tuple[Optional[str], str, dict]:
+        """Get the verb and path of a call, the path params are popped from
+        `params`.
+
+        Raises:
+            BadCallError: A required parameter is missing
+        """
+        if not self._required.issubset(params):
+            missing = next(p for p in self.required if p not in params)
+            raise BadCallError(f"Missing required parameter {missing}")
+        if not self._positions:
+            return self.verb, self.path, params
+        segments = self._segments.copy()
+        for position, param in self._positions:
+            segments[position] = str(params.pop(param))
+        return self.verb, "".join(segments), params
+
+
+def get_call_plan(
+    index: DiscoveryIndex, api_url: str, name_parts: Tuple[str, ...]
+) -> CallPlan:
+    """Get the plan of an endpoint from the process-wide registry, compiling it
+    the first time it is asked for a version of the discovery. The registry
+    keeps the MAX_CALL_PLANS plans used last.
+
+    Raises:
+        BadCallError: The endpoint does not exist or is for uploads
+    """
+    key = (index.digest, api_url, name_parts)
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+    spec = index.get(name_parts)
+    if not spec:
+        raise BadCallError(f"Endpoint {'.'.join(name_parts)} not found")
+    if spec.upload_path:
+        raise BadCallError(
+            f"Endpoint {'.'.join(name_parts)} is for uploads, "
+            f"use upload_call method instead of get_call or iter_call"
+        )
+    plan = CallPlan(spec, api_url)
+    with _plans_lock:
+        plan = _plans.setdefault(key, plan)
+        while len(_plans) > MAX_CALL_PLANS:
+            _plans.popitem(last=False)
+    return plan
+
+
+def clear_call_plans() -> None:
+    with _plans_lock:
+        _plans.clear()
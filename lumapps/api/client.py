@@ -1,18 +1,24 @@
 # -*- coding: utf-8 -*-
 from copy import deepcopy
-from functools import lru_cache, partial
+from functools import partial
 from io import FileIO
-from json import dumps, loads
 from logging import debug, exception, info, warning
 from re import findall
-from time import sleep
+from time import sleep, time
 from typing import Any, Callable, Dict, Generator, List, Optional, Sequence, Tuple
 
 from httpx import HTTPStatusError, put
 from slugify import slugify
 
 from lumapps.api.base_client import BaseClient, fetch_access_token
+from lumapps.api.cache import BoundedCache
+from lumapps.api.codec import dumps, loads
+from lumapps.api.concurrency import AdaptiveConcurrencyLimiter
 from lumapps.api.decorators import (
+    clear_memoized,
+    invalidates,
+    keys_of,
+    memoize,
     none_on_400_ALREADY_ARCHIVED,
     none_on_400_SUBSCRIPTION_ALREADY_EXISTS_OR_PINNED,
     none_on_404,
@@ -30,9 +36,39 @@ from lumapps.api.errors import (
     get_http_err_content,
 )
 from lumapps.api.helpers import content_is_template, new_lumapps_uuid
-from lumapps.api.utils import DiscoveryCacheDict
+from lumapps.api.rate_limit import RateLimiter
+from lumapps.api.response_cache import ResponseCache
+from lumapps.api.retry import RetryPolicy, retried_by_client, retry_call
+from lumapps.api.token_manager import TokenManager
+from lumapps.api.token_store import SqliteTokenStore
+
+to_json = partial(dumps, indent=True)
+
+
+def _summarize(obj: Any) -> str:
+    """The id, type and JSON size of an object, for the logs."""
+    size = len(dumps(obj, default=str))
+    if isinstance(obj, list):
+        return f"[{len(obj)} items, size={size}]"
+    fields = []
+    if isinstance(obj, dict):
+        fields = [f"{k}={obj[k]}" for k in ("id", "uid", "type") if obj.get(k)]
+    return "{" + ", ".join(fields + [f"size={size}"]) + "}"
+
+
+class _LogPayload:
+    """An object in a log message, formatted only if the message is emitted."""
+
+    __slots__ = ("obj", "full")
+
+    def __init__(self, obj: Any, full: bool):
+        self.obj = obj
+        self.full = full
+
+    def __str__(self) -> str:
+        return to_json(self.obj) if self.full else _summarize(self.obj)
+
 
-to_json = partial(dumps, indent=4)
 RESERVED_SLUGS = frozenset(["news", "admin", "content", "registration"])
 ApiClient = BaseClient
 
@@ -57,6 +93,14 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         no_verify: bool = False,
         proxy_info: Optional[Dict[str, Any]] = None,
         extra_http_headers: Optional[Dict] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        coalesce_reads: bool = True,
+        response_cache: Optional[ResponseCache] = None,
+        token_store: Optional[SqliteTokenStore] = None,
+        project_fields: bool = False,
+        log_payloads: bool = False,
     ):
         """Create a LumAppsClient associated to a particular LumApps platform and site
 
@@ -64,20 +108,33 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             customer_id: The id of the platform you target
             instance_id: The id of the site you target
             args: The args to pass to the BaseClient
-            cache: The cache to use
+            cache: The cache to use, defaults to a BoundedCache
             dry_run: Whether to run in dry_run mode or not. This will
                 avoid saving things when callings save endpoints
             kwargs: The kwargs to pass to the BaseClient
+            rate_limiter: The RateLimiter to use
+            concurrency_limiter: The AdaptiveConcurrencyLimiter to use
+            retry_policy: The RetryPolicy to use
+            coalesce_reads: Whether identical concurrent read calls share a
+                single request
+            response_cache: The ResponseCache to use
+            token_store: Where the tokens of the users are kept instead of
+                `cache`, eg a SqliteTokenStore shared by processes
+            project_fields: Whether to ask the api to leave out of the
+                responses the fields that prune drops
+            log_payloads: Whether the debug logs of the saves show the whole
+                objects saved rather than their id, type and size
         """
         if not customer_id:
             raise LumAppsClientConfError("customer_id required")
         self.customer_id = customer_id
         self.instance_id = instance_id
-        if cache:
-            self.cache = cache
-        else:
-            self.cache = DiscoveryCacheDict()
+        self.cache = cache if cache is not None else BoundedCache()
+        self.token_store = token_store
         self.dry_run = dry_run
+        self.log_payloads = log_payloads
+        # How save_group waits between its retries without a retry_policy
+        self.save_retry_policy = RetryPolicy(backoff_base=3, jitter=False)
         self._langs = None
         extra_http_headers = {
             **({"LumApps-Organization-Id": str(self.customer_id)}),
@@ -92,27 +149,63 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             no_verify=no_verify,
             proxy_info=proxy_info,
             extra_http_headers=extra_http_headers,
+            rate_limiter=rate_limiter,
+            concurrency_limiter=concurrency_limiter,
+            retry_policy=retry_policy,
+            coalesce_reads=coalesce_reads,
+            response_cache=response_cache,
+            project_fields=project_fields,
         )
         self._cached_metadata = {}
 
-    def get_token_getter(self, email: str):
+    def get_token_getter(self, email: str) -> TokenManager:
+        """Get the TokenManager handling the tokens of a user.
+
+        The tokens are shared through `self.token_store`, else `self.cache`,
+        and the same TokenManager is returned for an email, so that all the
+        clients of a user share its token.
+        """
         assert email
 
+        def fetch():
+            return fetch_access_token(
+                self.client, self.base_url, self._auth_info, self.customer_id, email
+            )
+
+        last_token = None
+
+        def from_store():
+            nonlocal last_token
+            # Asked again for the token given last, it was rejected
+            token, expiry = self.token_store.get(
+                self.customer_id, email, fetch, rejected=last_token
+            )
+            last_token = token
+            return token, expiry
+
         def f():
+            nonlocal last_token
             k = f"{self.customer_id}|TOKEN|{email}"
             vals = self.cache.get(k)
-            if vals:
-                return vals
-            token, expiry = fetch_access_token(
-                self.client, self.base_url, self._auth_info, self.customer_id, email
-            )
-            self.cache.set(k, (token, expiry), expiry - 10)
+            if vals and vals[0] == last_token:
+                # Asked again for the token given last, it was rejected or
+                # expires soon
+                self.cache.delete(k)
+            elif vals:
+                token, expires_at = vals
+                last_token = token
+                return token, int(expires_at - time())
+            token, expiry = fetch()
+            self.cache.set(k, (token, int(time()) + expiry), expiry - 10)
+            last_token = token
             return token, expiry
 
-        return f
+        return self._get_token_manager(
+            self.customer_id, email, from_store if self.token_store else f
+        )
 
     def get_user_api(self, email: str, prune: bool = True) -> "LumAppsClient":
-        return LumAppsClient(
+        client = LumAppsClient(
             self.customer_id,
             self.instance_id,
             cache=self.cache,
@@ -123,10 +216,29 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             auth_info=self._auth_info,
             no_verify=self.no_verify,
             proxy_info=self.proxy_info,
+            rate_limiter=self.rate_limiter,
+            concurrency_limiter=self.concurrency_limiter,
+            retry_policy=self.retry_policy,
+            coalesce_reads=self.coalesce_reads,
+            response_cache=self.response_cache,
+            token_store=self.token_store,
+            project_fields=self.project_fields,
+            log_payloads=self.log_payloads,
         )
+        client._cache_scope = f"{self.customer_id}|{email}"
+        self._share_resources(client)
+        return client
+
+    def close(self):
+        """Drop the memoized results and release the connection pool."""
+        clear_memoized(self)
+        super().close()
+
+    def _log_payload(self, obj: Any) -> _LogPayload:
+        return _LogPayload(obj, self.log_payloads)
 
     @property  # type: ignore
-    @lru_cache()
+    @memoize("instance")
     def langs(self) -> List[str]:
         if self._langs:
             return self._langs
@@ -142,7 +254,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         return langs
 
     @property  # type: ignore
-    @lru_cache()
+    @memoize("instance")
     def first_lang(self) -> str:
         return self.langs[0]  # type: ignore
 
@@ -284,7 +396,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             "content/get", instance=self.instance_id, slug=slug, **params
         )  # type: ignore
 
-    @lru_cache()
+    @memoize("template")
     def _get_template(self, template_id: str) -> Dict[str, Any]:
         return self.get_call("template/get", uid=template_id)  # type: ignore
 
@@ -354,7 +466,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         )
 
     def save_community_template(self, templ: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving community template: {to_json(templ)}")
+        debug("Saving community template: %s", self._log_payload(templ))
         if self.dry_run:
             return templ
         return self.get_call("communitytemplate/save", body=templ)
@@ -435,7 +547,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         yield from self.iter_call("customcontenttype/list", **args)
 
     def save_content_type(self, ct: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving content type: {to_json(ct)}")
+        debug("Saving content type: %s", self._log_payload(ct))
         if self.dry_run:
             return ct
         return self.get_call("customcontenttype/save", body=ct)
@@ -459,7 +571,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
 
     def mark_comment_as_relevant(self, comment_id: str) -> None:
         pl = {"uid": comment_id}
-        info(f"Marking comment as relevant: {to_json(pl)}")
+        info("Marking comment as relevant: %s", self._log_payload(pl))
         if self.dry_run:
             return
         self.get_call("comment/markRelevant", body=pl)
@@ -470,7 +582,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         comment["status"] = "HIDE"
         return self.get_call("comment/save", body=comment, sendNotifications=False)
 
-    @lru_cache()
+    @memoize("content", maxsize=10000)
     def get_content_slug_and_type(self, content_id: str) -> Tuple[str, str]:
         c = self.get_content(content_id, fields="slug,type", action=None)
         return (c["slug"], c["type"]) if c else ("", "")
@@ -485,7 +597,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
     ) -> Optional[Dict[str, Any]]:
         return self.get_call("comment/get", uid=comment_id, fields=fields)
 
-    @lru_cache()
+    @memoize("user", maxsize=10000)
     def get_user_url_path(self, user_email: str) -> Optional[str]:
         # https://foobar.com/home/ls/profile/5328742405898240
         inst_slug = self.get_instance_slug()
@@ -495,7 +607,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         user_id = u["id"]
         return f"/{inst_slug}/ls/profile/{user_id}"
 
-    @lru_cache()
+    @memoize("user", maxsize=10000)
     def get_user_id_and_link_for_md(
         self, user_email: str
     ) -> Tuple[Optional[str], Optional[str]]:
@@ -507,7 +619,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         name_slug = slugify(u["fullName"])
         return f"@[{name_slug}:{user_id}]", user_id
 
-    @lru_cache(maxsize=100000)
+    @memoize("post", maxsize=100000)
     def get_post_url_path(self, post_id: str, lang: str = None) -> str:
         post = self.get_post(post_id, fields="instance,externalKey")
         if not post:
@@ -518,7 +630,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         slug = slug_dict[lang or self.first_lang]
         return f"/{inst_slug}/ls/community/{slug}/post/{post_id}"
 
-    @lru_cache(maxsize=1000000)
+    @memoize("content", maxsize=100000)
     def get_content_url_path(self, content_id: str, lang: str = None) -> str:
         content = self.get_content(content_id, fields="instance,slug")
         if not content:
@@ -528,7 +640,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         content_slug = content["slug"][lang or self.first_lang]
         return f"/{inst_slug}/{content_slug}"
 
-    @lru_cache()
+    @memoize("community")
     def get_comunity_url_path(self, community_id: str) -> Optional[str]:
         inst_slug = self.get_instance_slug()
         slug_dict = self.get_community_slug(community_id)
@@ -552,7 +664,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         body.update(**kwargs)
         yield from self.iter_call("community/post/search", body=body)
 
-    @lru_cache()
+    @memoize("customer")
     @none_on_404
     def get_customer(self) -> Optional[Dict[str, Any]]:
         return self.get_call("customer/get", id=self.customer_id)
@@ -562,7 +674,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         return self.get_customer()["slug"]
 
     @property
-    @lru_cache()
+    @memoize("customer")
     def domain_to_idp_dict(self) -> Dict[str, Any]:
         return {
             idp["domain"]: idp
@@ -572,12 +684,12 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             if idp.get("domain")
         }
 
-    @lru_cache()
+    @memoize("community")
     def get_community_slug(self, community_id: str) -> Optional[str]:
         c = self.get_community(community_id)
         return c["slug"] if c else None
 
-    @lru_cache()
+    @memoize("instance")
     def get_instances(self) -> List[Dict[str, Any]]:
         lst = self.get_call("instance/list")
         return list(sorted(lst, key=lambda inst: inst.get("name", "")))
@@ -591,11 +703,11 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         else:
             return self.get_call("instance/get", uid=uid or self.instance_id, **kwargs)
 
-    @lru_cache()
+    @memoize("instance")
     def get_instance_dict(self) -> Dict[str, Any]:
         return {inst["id"]: inst for inst in self.get_instances()}
 
-    @lru_cache()
+    @memoize("instance")
     def get_instance_slug(self) -> str:
         return self.get_instance_dict()[self.instance_id]["slug"]
 
@@ -603,7 +715,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         return self.get_call("user/settings/get")
 
     def save_user_settings(self, settings: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving user settings: {to_json(settings)}")
+        debug("Saving user settings: %s", self._log_payload(settings))
         if self.dry_run:
             return settings
         return self.get_call("user/settings/save", body=settings)
@@ -627,6 +739,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
     ) -> Generator[Dict[str, Any], None, None]:
         yield from self.iter_call("user/list", **kwargs)
 
+    @invalidates("user", keys=keys_of("id", "email"))
     def save_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
         """Save a user
 
@@ -636,7 +749,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         Returns:
             The saved user
         """
-        debug(f"Saving user: {to_json(user)}")
+        debug("Saving user: %s", self._log_payload(user))
         if self.dry_run:
             return user
         return self.get_call("user/save", body=user)
@@ -646,7 +759,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             "social/subscription/list", instanceKey=self.instance_id
         )
 
-    @lru_cache()
+    @memoize("user", maxsize=10000)
     def get_user_forbidden_ok(self, id_or_email: str) -> Dict[str, Any]:
         k = f"{self.customer_id}|USER|{id_or_email}"
         try:
@@ -665,7 +778,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         else:
             return self.get_call("user/get", uid=id_or_email)
 
-    @lru_cache()
+    @memoize("user", maxsize=10000)
     def get_user(self, id_or_email: str) -> Dict[str, Any]:
         """Get a user from his id or email
 
@@ -692,7 +805,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         else:
             return self.get_call("user/get", uid=id_or_email)
 
-    @lru_cache()
+    @memoize("user", maxsize=10000)
     def user_exists(self, email: str, is_active: bool = False) -> bool:
         user = self.get_user(email)
         if not user:
@@ -703,7 +816,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         yield from self.iter_call("role/list", instance=self.instance_id, **kwargs)
 
     def save_role(self, role: Dict[str, Any]) -> Dict[str, Any]:
-        info(f"Saving role {to_json(role)}")
+        info("Saving role %s", self._log_payload(role))
         if not self.dry_run:
             return self.get_call("role/save", body=role)
 
@@ -751,7 +864,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             "shared": shared,
             "success": "/upload",
         }
-        debug(f"Getting upload URL: {to_json(pl)}")
+        debug("Getting upload URL: %s", self._log_payload(pl))
         if self.dry_run:
             return None
         upload_infos = self.get_call("document/uploadUrl/get", body=pl)
@@ -768,7 +881,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             "shared": False,
             "success": "/upload",
         }
-        debug(f"Getting upload URL: {to_json(pl)}")
+        debug("Getting upload URL: %s", self._log_payload(pl))
         if self.dry_run:
             return None
         upload_infos = self.get_call("document/uploadUrl/get", body=pl)
@@ -788,7 +901,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             "shared": False,
             "success": "/upload",
         }
-        debug(f"Getting upload URL: {to_json(pl)}")
+        debug("Getting upload URL: %s", self._log_payload(pl))
         if self.dry_run:
             return None
         upload_infos = self.get_call("document/uploadUrl/get", body=pl)
@@ -853,7 +966,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             except Exception as e:
                 raise FileUploadError(e)
             if resp.status_code in (200, 201):
-                return loads(resp.content.decode())
+                return loads(resp.content)
             if not (200 <= resp.status_code < 300):
                 json_resp = resp.json()
                 if json_resp:
@@ -883,7 +996,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
                 self.delete_document(f"provider=drive/resource={file_id}")
                 raise FileUploadError(e)
             if resp.status_code in (200, 201):
-                return loads(resp.content.decode())
+                return loads(resp.content)
             if not (200 <= resp.status_code < 300) and resp.status_code != 308:
                 json_resp = resp.json()
                 if json_resp:
@@ -975,13 +1088,13 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             raise FolderCreationError(err_msg)
 
     def save_folder(self, folder: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving folder: {to_json(folder)}")
+        debug("Saving folder: %s", self._log_payload(folder))
         if self.dry_run:
             return folder
         return self.get_call("document/folder/save", body=folder)
 
     def update_document(self, document: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Updating document: {to_json(document)}")
+        debug("Updating document: %s", self._log_payload(document))
         if self.dry_run:
             return document
         return self.get_call("document/update", body=document)
@@ -1060,7 +1173,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         yield from self.iter_call("tag/list", instance=self.instance_id, kind="media")
 
     def save_media_tag(self, tag: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving media tag: {to_json(tag)}")
+        debug("Saving media tag: %s", self._log_payload(tag))
         if self.dry_run:
             return tag
         return self.get_call("tag/save", body=tag)
@@ -1069,7 +1182,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         yield from self.iter_call("widget/list", instance=self.instance_id)
 
     def save_global_widget(self, widget: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving global widget: {to_json(widget)}")
+        debug("Saving global widget: %s", self._log_payload(widget))
         if self.dry_run:
             return widget
         return self.get_call("widget/save", body=widget)
@@ -1079,7 +1192,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         return self.get_call("media/get", uid=media_id)
 
     def save_media(self, media: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving media: {to_json(media)}")
+        debug("Saving media: %s", self._log_payload(media))
         if self.dry_run:
             return media
         return self.get_call("media/save", body=media)
@@ -1089,7 +1202,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         return self.get_call("header/get", uid=header_id)
 
     def save_header(self, header: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving header: {to_json(header)}")
+        debug("Saving header: %s", self._log_payload(header))
         if self.dry_run:
             return header
         return self.get_call("header/save", body=header)
@@ -1099,7 +1212,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         return self.get_call("style/get", uid=style_id)
 
     def save_style(self, style: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving style: {to_json(style)}")
+        debug("Saving style: %s", self._log_payload(style))
         if self.dry_run:
             return style
         return self.get_call("style/save", body=style)
@@ -1143,13 +1256,13 @@ class LumAppsClient(BaseClient):  # pragma: no cover
 
     def like_content(self, content_id: str):
         body = {"uid": content_id}
-        debug(f"Liking content: {to_json(body)}")
+        debug("Liking content: %s", self._log_payload(body))
         if not self.dry_run:
             return self.get_call("content/like", body=body, sendNotifications=False)
 
     def like_comment(self, comment_id: str):
         body = {"uid": comment_id}
-        debug(f"Liking comment: {to_json(body)}")
+        debug("Liking comment: %s", self._log_payload(body))
         if not self.dry_run:
             return self.get_call("comment/like", body=body, sendNotifications=False)
 
@@ -1209,35 +1322,39 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             "customerId": self.customer_id,
             "items": {"lang": lang, "items": menu_items},
         }
-        debug(f"Saving menu: {to_json(body)}")
+        debug("Saving menu: %s", self._log_payload(body))
         if self.dry_run:
             return body
         return self.get_call("content/menu/save", body=body)
 
+    @invalidates("content", keys=keys_of())
     def delete_content(self, content_id: str) -> None:
         debug(f"Deleting content: {content_id}")
         if not self.dry_run:
             self.get_call("content/delete", uid=content_id)
 
+    @invalidates("post", keys=keys_of())
     def delete_post(self, post_id: str) -> None:
         debug(f"Deleting post: {post_id}")
         if not self.dry_run:
             self.get_call("community/post/delete", uid=post_id)
 
+    @invalidates("community", keys=keys_of())
     def delete_community(self, community_id: str) -> None:
         debug(f"Deleting community: {community_id}")
         if not self.dry_run:
             self.get_call("community/delete", uid=community_id)
 
     def unarchive_content(self, content: Dict[str, Any]):
-        debug(f"Unarchiving content: {to_json(content)}")
+        debug("Unarchiving content: %s", self._log_payload(content))
         if self.dry_run:
             return content
         return self.get_call("content/unarchive", body=content)
 
+    @invalidates("content", keys=keys_of())
     @none_on_400_ALREADY_ARCHIVED
     def archive_content(self, content: Dict[str, Any]) -> Optional[Any]:
-        debug(f"Archiving content: {to_json(content)}")
+        debug("Archiving content: %s", self._log_payload(content))
         if self.dry_run:
             return content
         if content_is_template(content):
@@ -1245,32 +1362,36 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         return self.get_call("content/archive", body=content)
 
     def save_widget(self, widget: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving widget: {to_json(widget)}")
+        debug("Saving widget: %s", self._log_payload(widget))
         if self.dry_run:
             return widget
         return self.get_call("widget/save", body=widget)
 
+    @invalidates("instance")
     def save_instance(self, instance: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving instance: {to_json(instance)}")
+        debug("Saving instance: %s", self._log_payload(instance))
         if self.dry_run:
             return instance
         return self.get_call("instance/save", body=instance)
 
+    @invalidates("template")
     def save_template(self, template: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving template: {to_json(template)}")
+        debug("Saving template: %s", self._log_payload(template))
         if self.dry_run:
             return template
         assert content_is_template(template)
         return self.get_call("template/save", body=template)
 
+    @invalidates("content", keys=keys_of())
     @none_on_http_codes({503})
     def save_menu_content(self, content: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        debug(f"Saving menu content: {to_json(content)}")
+        debug("Saving menu content: %s", self._log_payload(content))
         if self.dry_run:
             return content
         assert content.get("type") == "menu"
         return self.get_call("content/save", body=content, sendNotifications=False)
 
+    @invalidates("content", keys=keys_of())
     @raise_known_save_errors
     def save_content(
         self, content: Dict[str, Any], cache: bool = False
@@ -1284,7 +1405,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         Returns:
             The saved content
         """
-        debug(f"Saving content: {to_json(content)}")
+        debug("Saving content: %s", self._log_payload(content))
         if self.dry_run:
             return content
         assert not content_is_template(content)
@@ -1313,22 +1434,29 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         except Exception:
             exception("re_save_post failed:")
 
+    @invalidates("post", keys=keys_of())
     def save_post(self, post: Dict[str, Any], cache: bool = False) -> Dict[str, Any]:
-        debug(f"Saving post: {to_json(post)}")
+        debug("Saving post: %s", self._log_payload(post))
         if self.dry_run:
             return post
         try:
-            dst = self.get_call(
-                "community/post/save", body=post, sendNotifications=False
+            dst = retry_call(
+                partial(
+                    self.get_call,
+                    "community/post/save",
+                    body=post,
+                    sendNotifications=False,
+                ),
+                lambda e: isinstance(e, HTTPStatusError)
+                and e.response.status_code == 400
+                and "CONTENT_NOT_UP_TO_DATE" in str(e),
+                2,
+                self.retry_policy,
+                "community/post/save",
             )
-        except HTTPStatusError as e:
-            if e.response.status_code == 400 and "CONTENT_NOT_UP_TO_DATE" in str(e):
-                dst = self.get_call(
-                    "community/post/save", body=post, sendNotifications=False
-                )
-            else:
-                exception("Error saving post:")
-                raise
+        except HTTPStatusError:
+            exception("Error saving post:")
+            raise
         if cache:
             self.cache.set(f"{self.customer_id}|POST|{dst['id']}", dst, 5 * 60 * 60)
         return dst
@@ -1337,7 +1465,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
     def get_community_by_slug(self, slug: str) -> Dict[str, Any]:
         return self.get_call("community/get", instance=self.instance_id, slug=slug)
 
-    @lru_cache()
+    @memoize("group")
     def get_all_group_id(self) -> str:
         k = f"{self.customer_id}|GROUP_ALL_ID"
         group_id = self.cache.get(k)
@@ -1358,7 +1486,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
                     return g["id"]
         raise Exception("Cannot find ALL group")
 
-    @lru_cache()
+    @memoize("group")
     def get_public_group_id(self, missing_ok: bool = False) -> Optional[str]:
         k = f"{self.customer_id}|GROUP_PUBLIC_ID"
         try:
@@ -1384,7 +1512,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             self.cache.set(k, None, 7200)
             return None
 
-    @lru_cache()
+    @memoize("group")
     def get_group(self, group_id: str) -> Dict[str, Any]:
         """Get a group by his id
 
@@ -1396,15 +1524,16 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         """
         return self.get_call("feed/get", uid=group_id)
 
-    @lru_cache()
+    @memoize("group")
     @none_on_http_codes({403})
     def get_group_forbidden_ok(self, group_id: str) -> Optional[Dict[str, Any]]:
         return self.get_call("feed/get", uid=group_id)
 
+    @invalidates("community", keys=keys_of())
     def save_community(
         self, community: Dict[str, Any], notuptodate_ok: bool = False
     ) -> Dict[str, Any]:
-        debug(f"Saving community: {to_json(community)}")
+        debug("Saving community: %s", self._log_payload(community))
         if self.dry_run:
             return community
         try:
@@ -1462,7 +1591,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
                 return metadata
         return self.save_metadata(new_md)
 
-    @lru_cache()
+    @memoize("metadata")
     def get_metadata_by_name(
         self, name: str, parent_id: str = None, create: bool = False
     ) -> Dict[str, Any]:
@@ -1481,11 +1610,11 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             )
         return self.add_metadata(name, parent_id)
 
-    @lru_cache()
+    @memoize("metadata")
     def get_metadata(self, metadata_id: str) -> Dict[str, Any]:
         return self.get_call("metadata/get", uid=metadata_id)
 
-    @lru_cache()
+    @memoize("metadata")
     @none_on_http_codes({403})
     def get_metadata_forbidden_ok(
         self, metadata_id: str
@@ -1519,8 +1648,9 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             return metadata
         return self.save_metadata(metadata)
 
+    @invalidates("metadata")
     def save_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving metadata: {to_json(metadata)}")
+        debug("Saving metadata: %s", self._log_payload(metadata))
         if int(metadata.get("sortOrder", 0)) < 0:
             metadata.pop("sortOrder")
         if self.dry_run:
@@ -1528,7 +1658,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         return self.get_call("metadata/save", body=metadata)
 
     def save_comment(self, comment: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving comment: {to_json(comment)}")
+        debug("Saving comment: %s", self._log_payload(comment))
         if self.dry_run:
             return comment
         while True:
@@ -1539,16 +1669,21 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             except HTTPStatusError as err:
                 if err.response.status_code == 400:
                     if "RATE_LIMIT_EXCEEDED" in err._get_reason():
-                        warning("RATE_LIMIT_EXCEEDED, sleeping 61 seconds")
-                        sleep(61)
+                        if self.rate_limiter:
+                            # Only hold back the calls sharing the comment bucket
+                            warning("RATE_LIMIT_EXCEEDED, pausing comments 61 seconds")
+                            self.rate_limiter.throttle("POST", ("comment", "save"), 61)
+                        else:
+                            warning("RATE_LIMIT_EXCEEDED, sleeping 61 seconds")
+                            sleep(61)
                         continue
                 raise
 
-    @lru_cache()
+    @memoize("group")
     def get_cached_groups(self) -> List[Dict[str, Any]]:
         return self.get_call("feed/list", instance=self.instance_id)
 
-    @lru_cache()
+    @memoize("group")
     def get_cached_group_id_by_name(
         self, name: str, feed_type_id: str = None
     ) -> Optional[Dict[str, Any]]:
@@ -1564,7 +1699,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             return group
         return None
 
-    @lru_cache()
+    @memoize("group")
     def get_cached_groups_dict_by_name(self) -> Dict[str, Any]:
         groups = self.get_cached_groups()
         return {g["name"].lower(): g for g in groups}
@@ -1580,7 +1715,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         self, feed_id: str, user_emails: List[str]
     ) -> Optional[Dict[str, Any]]:
         body = {"addedUsers": user_emails, "feed": feed_id, "removedUsers": []}
-        debug(f"Adding users to group: {to_json(body)}")
+        debug("Adding users to group: %s", self._log_payload(body))
         if self.dry_run:
             return body
         return self.get_call("feed/subscribers/save", body=body)
@@ -1600,7 +1735,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
                     if resp.status_code != 404:
                         exception("error adding users:")
                         raise
-                    msg = loads(resp.content.decode())["error"]["errors"][0]["message"]
+                    msg = loads(resp.content)["error"]["errors"][0]["message"]
                     # 'User not found: foo.bar@acme.org'
                     member = msg.split(": ")[1]
                     warning(f"Failed to add missing {member} to group {feed_id}")
@@ -1608,6 +1743,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
                     to_add = chunk[chunk.index(member) + 1 :]
         return missing
 
+    @invalidates("instance")
     def delete_instance(self):
         if self.dry_run:
             return
@@ -1654,42 +1790,43 @@ class LumAppsClient(BaseClient):  # pragma: no cover
                 yield gt
 
     def save_group_type(self, group_type: Dict[str, Any]) -> Dict[str, Any]:
-        info(f"Saving group type: {to_json(group_type)}")
+        info("Saving group type: %s", self._log_payload(group_type))
         if self.dry_run:
             return group_type
         return self.get_call("feedtype/save", body=group_type)
 
+    @invalidates("group", keys=keys_of())
     def delete_group(self, group_id: str) -> None:
         info(f"Deleting group {group_id}")
         if self.dry_run:
             return
         self.get_call("feed/delete", uid=group_id)
 
+    @invalidates("group", keys=keys_of("id", "name"))
     def save_group(self, group: Dict[str, Any], retries: int = 0) -> Dict[str, Any]:
         """Save a group
 
         Args:
             group: The group to save
-            retries: The number of retries on failure to do
+            retries: The number of retries on 503 errors, with an exponential
+                backoff starting at 3 seconds. When the client has a
+                retry_policy retrying the 503, it is the one retrying them.
 
         Returns:
             The saved group
         """
-        info(f"Saving group: {to_json(group)}")
+        info("Saving group: %s", self._log_payload(group))
         if self.dry_run:
             return group
-        attempt = 0
-        while True:
-            attempt += 1
-            try:
-                return self.get_call("feed/save", body=group)
-            except HTTPStatusError as e:
-                if e.response.status_code == 503 and attempt < 1 + retries:
-                    sleep_time = (attempt + 1) * 3
-                    warning(f"503 saving the feed, will retry in {sleep_time}s")
-                    sleep(sleep_time)
-                    continue
-                raise
+        return retry_call(
+            partial(self.get_call, "feed/save", body=group),
+            lambda e: isinstance(e, HTTPStatusError)
+            and e.response.status_code == 503
+            and not retried_by_client(self, e),
+            1 + retries,
+            self.retry_policy or self.save_retry_policy,
+            "feed/save",
+        )
 
     def add_global_group(
         self, grouptype_id: str, name: str, *, google_group_email: str = None
@@ -1701,6 +1838,8 @@ class LumAppsClient(BaseClient):  # pragma: no cover
     ) -> Dict[str, Any]:
         return self._add_group(grouptype_id, name, google_group_email, False)
 
+    # A new group only changes the results without arguments
+    @invalidates("group", keys=lambda *args, **kwargs: ())
     def _add_group(
         self, grouptype_id: str, name: str, google_group_email: str, global_group: bool
     ) -> Dict[str, Any]:
@@ -1717,14 +1856,10 @@ class LumAppsClient(BaseClient):  # pragma: no cover
             group["group"] = google_group_email
         if not global_group:
             group["instance"] = self.instance_id
-        info(f"Saving group {to_json(group)}")
+        info("Saving group %s", self._log_payload(group))
         if self.dry_run:
             return group
-        group = self.get_call("feed/save", body=group)
-        self.get_cached_groups.cache_clear()
-        self.get_cached_group_id_by_name.cache_clear()
-        self.get_cached_groups_dict_by_name.cache_clear()
-        return group
+        return self.get_call("feed/save", body=group)
 
     def sync_group(self, group_id: str):
         if self.dry_run:
@@ -1775,7 +1910,7 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         return self.get_call("directory/get", uid=uid)
 
     def save_directory(self, directory: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving directory: {to_json(directory)}")
+        debug("Saving directory: %s", self._log_payload(directory))
         if self.dry_run:
             return directory
         return self.get_call("directory/save", body=directory)
@@ -1805,13 +1940,13 @@ class LumAppsClient(BaseClient):  # pragma: no cover
                 yield dir_entry
 
     def save_directory_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving directory entry: {to_json(entry)}")
+        debug("Saving directory entry: %s", self._log_payload(entry))
         if self.dry_run:
             return entry
         return self.get_call("directory/entry/save", body=entry)
 
     def save_personal_directory_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving personal directory entry: {to_json(entry)}")
+        debug("Saving personal directory entry: %s", self._log_payload(entry))
         if self.dry_run:
             return entry
         return self.get_call("directory/entry/user/save", body=entry)
@@ -1836,13 +1971,13 @@ class LumAppsClient(BaseClient):  # pragma: no cover
         return self.get_call("newsletter/get", uid=uid)
 
     def save_tutorial(self, tutorial: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving tutorial: {to_json(tutorial)}")
+        debug("Saving tutorial: %s", self._log_payload(tutorial))
         if self.dry_run:
             return tutorial
         return self.get_call("tutorial/save", body=tutorial)
 
     def save_newsletter(self, newsletter: Dict[str, Any]) -> Dict[str, Any]:
-        debug(f"Saving newsletter: {to_json(newsletter)}")
+        debug("Saving newsletter: %s", self._log_payload(newsletter))
         if self.dry_run:
             return newsletter
         return self.get_call("newsletter/save", body=newsletter)
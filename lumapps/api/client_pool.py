@@ -0,0 +1,218 @@
+from collections import OrderedDict
+from contextlib import AbstractContextManager
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from lumapps.api.client import LumAppsClient
+
+PoolKey = Tuple[str, Optional[str], str]
+ParentKey = Tuple[str, Optional[str]]
+
+
+class _PooledClient(NamedTuple):
+    client: LumAppsClient
+    last_used: float
+
+
+class ClientPool(AbstractContextManager):
+    def __init__(
+        self,
+        client: LumAppsClient,
+        max_size: int = 1000,
+        max_idle: Optional[float] = 600,
+        prune: bool = True,
+        clock: Callable[[], float] = monotonic,
+    ):
+        """A bounded pool of the clients acting on behalf of users.
+
+        The clients are derived from `client` and share its connection pool,
+        its discovery data and its cache. A pooled client keeps its token and
+        its method caches warm between the requests of its user.
+
+        Args:
+            client: The client authenticated with the application credentials
+            max_size: The maximum number of clients kept, the least recently
+                used one is evicted beyond it
+            max_idle: How long a client is kept without being used, in seconds.
+                None to keep the clients until they are evicted by max_size.
+            prune: The prune setting of the pooled clients
+            clock: The monotonic clock to use, in seconds
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.client = client
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.prune = prune
+        self._clock = clock
+        self._lock = Lock()
+        self._clients: "OrderedDict[PoolKey, _PooledClient]" = OrderedDict()
+        # The clients of the other sites, kept while a pooled client uses them
+        self._parents: Dict[ParentKey, LumAppsClient] = {}
+        self._parent_refs: Dict[ParentKey, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._clients),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _new_parent(self, customer_id: str, instance_id: Optional[str]):
+        root = self.client
+        parent = LumAppsClient(
+            customer_id,
+            instance_id,
+            api_info=root.api_info,
+            cache=root.cache,
+            dry_run=root.dry_run,
+            auth_info=root._auth_info,
+            no_verify=root.no_verify,
+            proxy_info=root.proxy_info,
+            rate_limiter=root.rate_limiter,
+            concurrency_limiter=root.concurrency_limiter,
+            retry_policy=root.retry_policy,
+            coalesce_reads=root.coalesce_reads,
+            response_cache=root.response_cache,
+            token_store=root.token_store,
+            project_fields=root.project_fields,
+            log_payloads=root.log_payloads,
+        )
+        root._share_resources(parent)
+        return parent
+
+    def _use(self, key: PoolKey, now: float) -> Optional[LumAppsClient]:
+        pooled = self._clients.get(key)
+        if pooled is None:
+            return None
+        self.hits += 1
+        self._clients[key] = _PooledClient(pooled.client, now)
+        self._clients.move_to_end(key)
+        return pooled.client
+
+    def get(
+        self,
+        email: str,
+        customer_id: Optional[str] = None,
+        instance_id: Optional[str] = None,
+    ) -> LumAppsClient:
+        """Get the client of a user, creating it if it is not pooled.
+
+        Args:
+            email: The email of the user
+            customer_id: The id of the platform, defaults to the one of the
+                pool client
+            instance_id: The id of the site, defaults to the one of the pool
+                client
+
+        Returns:
+            A LumAppsClient acting on behalf of the user
+        """
+        root = self.client
+        customer_id = customer_id or root.customer_id
+        if instance_id is None:
+            instance_id = root.instance_id
+        key = (customer_id, instance_id, email)
+        parent_key = (customer_id, instance_id)
+        now = self._clock()
+        with self._lock:
+            to_close = self._evict_idle(now)
+            client = self._use(key, now)
+            parent = self._parents.get(parent_key)
+        if client is None:
+            # Created without holding the lock, other users are not held up
+            new_parent = None
+            if parent is None and parent_key != (root.customer_id, root.instance_id):
+                parent = new_parent = self._new_parent(customer_id, instance_id)
+            new = (parent or root).get_user_api(email, prune=self.prune)
+            with self._lock:
+                client = self._use(key, now)
+                if client is not None:
+                    # Pooled by another thread meanwhile
+                    to_close.append(new)
+                else:
+                    client = new
+                    self.misses += 1
+                    self._clients[key] = _PooledClient(new, now)
+                    if parent_key in self._parents:
+                        self._parent_refs[parent_key] += 1
+                    elif new_parent is not None:
+                        self._parents[parent_key] = new_parent
+                        self._parent_refs[parent_key] = 1
+                        new_parent = None
+                    while len(self._clients) > self.max_size:
+                        to_close += self._pop(next(iter(self._clients)))
+            if new_parent is not None:
+                to_close.append(new_parent)
+        for c in to_close:
+            c.close()
+        return client
+
+    def _pop(self, key: PoolKey) -> List[LumAppsClient]:
+        """Drop a pooled client, returns the clients to close. To be called with
+        the lock held."""
+        pooled = self._clients.pop(key)
+        self.evictions += 1
+        to_close = [pooled.client]
+        parent_key = key[:2]
+        parent = self._parents.get(parent_key, self.client)
+        # Its next client starts from a new token
+        parent._drop_token_manager(key[0], key[2])
+        if parent_key in self._parents:
+            self._parent_refs[parent_key] -= 1
+            if not self._parent_refs[parent_key]:
+                del self._parent_refs[parent_key]
+                to_close.append(self._parents.pop(parent_key))
+        return to_close
+
+    def _evict_idle(self, now: float) -> List[LumAppsClient]:
+        to_close: List[LumAppsClient] = []
+        if self.max_idle is None:
+            return to_close
+        # The clients are in order of use, the idle ones are at the start
+        while self._clients:
+            key, pooled = next(iter(self._clients.items()))
+            if now - pooled.last_used <= self.max_idle:
+                break
+            to_close += self._pop(key)
+        return to_close
+
+    def evict(self, email: str, customer_id=None, instance_id=None) -> bool:
+        """Drop the client of a user, eg when its access is revoked.
+
+        Returns:
+            Whether the user had a pooled client
+        """
+        customer_id = customer_id or self.client.customer_id
+        if instance_id is None:
+            instance_id = self.client.instance_id
+        key = (customer_id, instance_id, email)
+        with self._lock:
+            to_close = self._pop(key) if key in self._clients else []
+        for c in to_close:
+            c.close()
+        return bool(to_close)
+
+    def close(self) -> None:
+        """Close all the pooled clients."""
+        with self._lock:
+            clients = [p.client for p in self._clients.values()]
+            clients += list(self._parents.values())
+            self._clients.clear()
+            self._parents.clear()
+            self._parent_refs.clear()
+        for c in clients:
+            c.close()
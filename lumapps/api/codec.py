@@ -0,0 +1,114 @@
+import json
+from typing import Any, Callable, Optional, Protocol, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+class JsonCodec(Protocol):
+    """What encodes and decodes the JSON of the SDK.
+
+    `indent` gives a readable output, for logs and stored configurations.
+    `default` converts the objects that JSON does not support. All the codecs
+    give the same output: compact, or indented by 2 spaces, in UTF-8.
+    """
+
+    name: str
+
+    def loads(self, data: Union[bytes, str]) -> Any: ...
+
+    def dumps(
+        self,
+        obj: Any,
+        indent: bool = False,
+        sort_keys: bool = False,
+        default: Optional[Callable[[Any], Any]] = None,
+    ) -> str: ...
+
+
+class StdlibCodec:
+    name = "json"
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps(
+        self,
+        obj: Any,
+        indent: bool = False,
+        sort_keys: bool = False,
+        default: Optional[Callable[[Any], Any]] = None,
+    ) -> str:
+        # The output of orjson
+        return json.dumps(
+            obj,
+            indent=2 if indent else None,
+            separators=(",", ": ") if indent else (",", ":"),
+            ensure_ascii=False,
+            sort_keys=sort_keys,
+            default=default,
+        )
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def __init__(self):
+        """The codec backed by orjson, several times faster than the standard
+        library one. It decodes bytes without building a str first.
+
+        The objects orjson does not encode, eg integers beyond 64 bits, are
+        encoded by the standard library.
+        """
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+        self._fallback = StdlibCodec()
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(
+        self,
+        obj: Any,
+        indent: bool = False,
+        sort_keys: bool = False,
+        default: Optional[Callable[[Any], Any]] = None,
+    ) -> str:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode()
+        except TypeError:
+            return self._fallback.dumps(obj, indent, sort_keys, default)
+
+
+_codec: JsonCodec = OrjsonCodec() if orjson is not None else StdlibCodec()
+
+
+def get_codec() -> JsonCodec:
+    return _codec
+
+
+def set_codec(codec: JsonCodec) -> None:
+    """Set the codec used by the SDK, eg `StdlibCodec()` to not use orjson."""
+    global _codec
+    _codec = codec
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode JSON, from the bytes of a response preferably."""
+    return _codec.loads(data)
+
+
+def dumps(
+    obj: Any,
+    indent: bool = False,
+    sort_keys: bool = False,
+    default: Optional[Callable[[Any], Any]] = None,
+) -> str:
+    return _codec.dumps(obj, indent, sort_keys, default)
@@ -0,0 +1,250 @@
+from concurrent.futures import ThreadPoolExecutor
+from logging import debug
+from queue import Empty, Queue
+from threading import Condition, Event, Semaphore, Thread
+from time import monotonic
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+_DONE = object()
+_POLL_INTERVAL = 0.1
+
+
+def _acquire(slots: Semaphore, stop: Event) -> bool:
+    while not stop.is_set():
+        if slots.acquire(timeout=_POLL_INTERVAL):
+            return True
+    return False
+
+
+def prefetch_iter(iterable: Iterable[T], size: int) -> Iterator[T]:
+    """Consume an iterable on a background thread, keeping values ahead of the
+    caller.
+
+    At most `size` values are fetched ahead, the one being fetched included:
+    the background thread waits for the caller to take a value before
+    fetching the next one once `size` are buffered. An exception raised by
+    the iterable is re-raised to the caller only once all the values produced
+    before it have been consumed.
+
+    Args:
+        iterable: The iterable to consume, eg a generator of pages
+        size: The maximum number of values fetched in advance
+
+    Yields:
+        The values of the iterable, in order
+    """
+    if size < 1:
+        raise ValueError("size must be at least 1")
+    queue: Queue = Queue()
+    # The values fetched ahead, buffered or being fetched
+    slots = Semaphore(size)
+    stop = Event()
+
+    def worker():
+        try:
+            values = iter(iterable)
+            while _acquire(slots, stop):
+                value = next(values, _DONE)
+                queue.put((value, None))
+                if value is _DONE:
+                    return
+        except BaseException as err:  # noqa
+            queue.put((_DONE, err))
+
+    thread = Thread(target=worker, name="lumapps-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                value, err = queue.get(timeout=_POLL_INTERVAL)
+            except Empty:
+                if not thread.is_alive() and queue.empty():
+                    return
+                continue
+            if err is not None:
+                raise err
+            if value is _DONE:
+                return
+            slots.release()
+            yield value
+    finally:
+        # Unblock the producer if the caller stopped iterating early
+        stop.set()
+
+
+def _capture(call: Callable[[], Any]) -> Any:
+    try:
+        return call()
+    except Exception as err:
+        return err
+
+
+def run_concurrently(
+    calls: Iterable[Callable[[], Any]], max_concurrency: int
+) -> List[Any]:
+    """Run callables on a pool of threads.
+
+    Args:
+        calls: The callables to run, they take no arguments
+        max_concurrency: The maximum number of callables running at the same time
+
+    Returns:
+        The results in the order of the calls, a call that raised an exception
+        has the exception as result instead of aborting the others
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    calls = list(calls)
+    if not calls:
+        return []
+    workers = min(max_concurrency, len(calls))
+    with ThreadPoolExecutor(workers, thread_name_prefix="lumapps-call") as executor:
+        return list(executor.map(_capture, calls))
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(
+        self,
+        initial: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        backoff_ratio: float = 0.5,
+        latency_tolerance: Optional[float] = 2.0,
+        overload_codes: Sequence[int] = (429, 503),
+        clock: Callable[[], float] = monotonic,
+    ):
+        """Bound the number of requests in flight, adapting the bound with AIMD.
+
+        Every successful response raises the limit by `1 / limit`, ie by about
+        one per round of requests (additive increase). A response with one of
+        the `overload_codes`, a transport error or a latency above
+        `latency_tolerance` times the usual latency of its endpoint family
+        multiplies the limit by `backoff_ratio` (multiplicative decrease). The
+        usual latency is tracked per family so that slow endpoints, eg exports,
+        are not taken for an overload of the fast ones. The requests already in
+        flight when the limit is cut cannot cut it again, so that a wave of
+        503s only counts once.
+
+        Args:
+            initial: The initial limit
+            min_limit: The lowest limit
+            max_limit: The highest limit
+            backoff_ratio: The factor applied to the limit on overload
+            latency_tolerance: How many times the usual latency of its family a
+                response can take before it is considered as an overload sign,
+                None to only decrease the limit on errors
+            overload_codes: The HTTP status codes meaning that the server is
+                overloaded
+            clock: The monotonic clock to use, in seconds
+        """
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError("expected 1 <= min_limit <= initial <= max_limit")
+        if not 0 < backoff_ratio < 1:
+            raise ValueError("backoff_ratio must be between 0 and 1")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.overload_codes = frozenset(overload_codes)
+        self._clock = clock
+        self._cond = Condition()
+        self._limit = float(initial)
+        self._in_flight = 0
+        # The usual latency of each endpoint family
+        self._latencies: Dict[str, float] = {}
+        self._last_decrease = clock()
+        self._stats = {"increases": 0, "decreases": 0, "waits": 0}
+
+    @property
+    def limit(self) -> int:
+        """The current maximum number of requests in flight."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                **self._stats,
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "families": len(self._latencies),
+            }
+
+    def latency(self, family: str = "") -> Optional[float]:
+        """The usual latency of an endpoint family, None until it is known."""
+        with self._cond:
+            return self._latencies.get(family)
+
+    def acquire(self) -> float:
+        """Wait for a free slot.
+
+        Returns:
+            The start time of the request, to pass to `release`
+        """
+        with self._cond:
+            if self._in_flight >= self.limit:
+                self._stats["waits"] += 1
+                while self._in_flight >= self.limit:
+                    self._cond.wait()
+            self._in_flight += 1
+            return self._clock()
+
+    def release(
+        self, started: float, status_code: Optional[int] = None, family: str = ""
+    ) -> None:
+        """Free a slot and adapt the limit to the outcome of the request.
+
+        Args:
+            started: The value returned by `acquire`
+            status_code: The status code of the response, None when the
+                request failed without a response
+            family: The endpoint family of the request, eg user/list, its
+                latency is compared to the usual latency of the family only
+        """
+        now = self._clock()
+        latency = now - started
+        with self._cond:
+            self._in_flight -= 1
+            overloaded = status_code is None or status_code in self.overload_codes
+            usual = self._latencies.get(family)
+            if not overloaded and usual is not None and self.latency_tolerance:
+                overloaded = latency > usual * self.latency_tolerance
+            if overloaded:
+                if started >= self._last_decrease and self._limit > self.min_limit:
+                    self._decrease(now)
+            else:
+                self._observe_latency(family, latency)
+                if self._limit < self.max_limit:
+                    self._stats["increases"] += 1
+                    self._limit = min(self._limit + 1 / self._limit, self.max_limit)
+            self._cond.notify_all()
+
+    def _observe_latency(self, family: str, latency: float) -> None:
+        # Exponentially weighted moving average of the healthy latencies
+        usual = self._latencies.get(family)
+        if usual is None:
+            self._latencies[family] = latency
+        else:
+            self._latencies[family] = usual + (latency - usual) * 0.1
+
+    def _decrease(self, now: float) -> None:
+        self._stats["decreases"] += 1
+        self._last_decrease = now
+        self._limit = max(self._limit * self.backoff_ratio, float(self.min_limit))
+        debug(f"Overload detected, concurrency limit set to {self.limit}")
@@ -1,14 +1,15 @@
-from functools import wraps
-from logging import debug
-from typing import Sequence
+from functools import partial, wraps
+from typing import Any, Callable, Container, Dict, Iterable, Optional, Sequence
 
 from httpx import HTTPStatusError
 
+from lumapps.api.cache import BoundedCache
 from lumapps.api.errors import (
     FeedsRequiredError,
     UrlAlreadyExistsError,
     get_http_err_content,
 )
+from lumapps.api.retry import RetryPolicy, retried_by_client, retry_call
 
 
 def none_on_http_codes(codes=(404,)):
@@ -27,46 +28,57 @@ def none_on_http_codes(codes=(404,)):
     return decorator
 
 
-def retry_on_http_status_error(max_attempts=3):
+def _get_policy(policy: Optional[RetryPolicy], args) -> Optional[RetryPolicy]:
+    # On a client method, default to the retry policy of the client
+    if policy is None and args:
+        policy = getattr(args[0], "retry_policy", None)
+    return policy if isinstance(policy, RetryPolicy) else None
+
+
+def _retryable(args, codes: Optional[Container] = None) -> Callable:
+    # On a client method, the errors its calls already retried are not retried
+    client = args[0] if args else None
+
+    def retryable(e: Exception) -> bool:
+        if not isinstance(e, HTTPStatusError):
+            return False
+        if codes is not None and e.response.status_code not in codes:
+            return False
+        return not retried_by_client(client, e)
+
+    return retryable
+
+
+def retry_on_http_status_error(max_attempts=3, policy: Optional[RetryPolicy] = None):
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            attempts = 0
-            while True:
-                attempts += 1
-                try:
-                    return f(*args, **kwargs)
-                except HTTPStatusError as e:
-                    if attempts >= max_attempts:
-                        debug(f"Max attempts {max_attempts} reached")
-                        raise
-                    code = e.response.status_code
-                    debug(f"{attempts}/{max_attempts} failed: HTTP {code}")
-                    continue
+            return retry_call(
+                partial(f, *args, **kwargs),
+                _retryable(args),
+                max_attempts,
+                _get_policy(policy, args),
+                f.__name__,
+            )
 
         return wrapper
 
     return decorator
 
 
-def retry_on_http_codes(codes: Sequence = (), max_attempts=3):
+def retry_on_http_codes(
+    codes: Sequence = (), max_attempts=3, policy: Optional[RetryPolicy] = None
+):
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            attempts = 0
-            while True:
-                attempts += 1
-                try:
-                    return f(*args, **kwargs)
-                except HTTPStatusError as e:
-                    if attempts >= max_attempts:
-                        debug(f"Max attempts {max_attempts} reached")
-                        raise
-                    code = e.response.status_code
-                    if code in codes:
-                        debug(f"{attempts}/{max_attempts} failed: HTTP {code}")
-                        continue
-                    raise
+            return retry_call(
+                partial(f, *args, **kwargs),
+                _retryable(args, codes),
+                max_attempts,
+                _get_policy(policy, args),
+                f.__name__,
+            )
 
         return wrapper
 
@@ -193,3 +205,124 @@ def raise_known_save_errors(function):
             raise
 
     return wrapper
+
+
+# The memoization key of the methods called without arguments
+_NO_ARGS = ()
+
+
+def _memo_cache(obj, name: str, maxsize: int, ttl: float) -> BoundedCache:
+    caches = obj.__dict__.get("_memo_caches")
+    if caches is None:
+        caches = obj.__dict__.setdefault("_memo_caches", {})
+    cache = caches.get(name)
+    if cache is None:
+        cache = caches.setdefault(name, BoundedCache(maxsize, default_ttl=ttl))
+    return cache
+
+
+def memoize(namespace: str, maxsize: int = 1000, ttl: float = 3600):
+    """Memoize a method per instance, in a BoundedCache of at most `maxsize`
+    objects kept `ttl` seconds. The results are grouped by their first
+    argument, eg the id of an object, so that they can be dropped by object.
+    They are dropped when a method decorated with `invalidates(namespace)`
+    runs or the instance is closed.
+    """
+
+    def decorator(f):
+        name = f"{namespace}/{f.__name__}"
+
+        @wraps(f)
+        def wrapper(self, *args, **kwargs):
+            cache = _memo_cache(self, name, maxsize, ttl)
+            head = args[0] if args else _NO_ARGS
+            rest = (args[1:], tuple(sorted(kwargs.items()))) if kwargs else args[1:]
+            results = cache.get(head)
+            if results is not None and rest in results:
+                return results[rest]
+            result = f(self, *args, **kwargs)
+            if results is None:
+                results = {}
+                cache.set(head, results)
+            results[rest] = result
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def keys_of(*fields: str) -> Callable[..., Optional[Iterable[Any]]]:
+    """What gives the memoization keys of the object given to a method, for
+    `invalidates`: the values of its `fields`, or the argument itself when it
+    is an id. None when the object is not given positionally.
+    """
+    fields = fields or ("id",)
+
+    def keys(self, obj=None, *args, **kwargs) -> Optional[Iterable[Any]]:
+        if isinstance(obj, dict):
+            return [obj[k] for k in fields if obj.get(k) is not None]
+        return None if obj is None else [obj]
+
+    return keys
+
+
+def invalidates(
+    *namespaces: str, keys: Optional[Callable[..., Optional[Iterable[Any]]]] = None
+):
+    """Drop the memoized results of the namespaces once the method ran.
+
+    Args:
+        namespaces: The namespaces of the memoized methods
+        keys: What gives, from the arguments of the method, the keys of the
+            objects it changes, eg `keys_of("id")`. Only their results and the
+            ones of the methods without arguments are dropped then. By default,
+            or when it gives None, all the results of the namespaces are
+            dropped.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return f(self, *args, **kwargs)
+            finally:
+                changed = keys(self, *args, **kwargs) if keys else None
+                if changed is None:
+                    clear_memoized(self, *namespaces)
+                else:
+                    _drop_memoized(self, namespaces, changed)
+
+        return wrapper
+
+    return decorator
+
+
+def _drop_memoized(obj, namespaces: Sequence[str], keys: Iterable[Any]) -> None:
+    caches = obj.__dict__.get("_memo_caches")
+    if not caches:
+        return
+    keys = [_NO_ARGS, *keys]
+    prefixes = tuple(f"{ns}/" for ns in namespaces)
+    for name, cache in list(caches.items()):
+        if name.startswith(prefixes):
+            for key in keys:
+                cache.delete(key)
+
+
+def clear_memoized(obj, *namespaces: str) -> None:
+    """Drop the memoized results of an instance, all of them without
+    namespaces."""
+    caches = obj.__dict__.get("_memo_caches")
+    if not caches:
+        return
+    prefixes = tuple(f"{ns}/" for ns in namespaces)
+    for name in list(caches):
+        if not prefixes or name.startswith(prefixes):
+            caches.pop(name, None)
+
+
+def memo_stats(obj) -> Dict[str, Dict[str, int]]:
+    """The stats of the memoized methods of an instance, by namespace/method."""
+    caches = obj.__dict__.get("_memo_caches") or {}
+    return {name: cache.stats for name, cache in list(caches.items())}
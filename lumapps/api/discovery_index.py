@@ -0,0 +1,182 @@
+import marshal
+import os
+from hashlib import sha1, sha256
+from time import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from lumapps.api.codec import dumps
+from lumapps.api.projection import ResponseShape, response_shape
+from lumapps.api.utils import CACHE_MAX_AGE, get_conf_db_file, walk_endpoints
+
+# Bumped whenever the layout of the snapshots changes
+SNAPSHOT_VERSION = 2
+_MAGIC = b"LSDI"
+
+_DEFAULT_DIR: Any = object()
+_snapshot_dir: Any = _DEFAULT_DIR
+
+
+class EndpointSpec(NamedTuple):
+    """What is needed to call an endpoint, extracted from the discovery."""
+
+    verb: Optional[str]
+    # The path template, relative to the api url, eg user/get/{uid}
+    path: str
+    path_params: Tuple[str, ...]
+    required_params: Tuple[str, ...]
+    # The path of the simple upload protocol, for the media upload endpoints
+    upload_path: Optional[str]
+    # To project the responses without the discovery document, None when it
+    # is not known
+    response: Optional[ResponseShape] = None
+
+    @classmethod
+    def from_method(
+        cls, method: Dict[str, Any], response: Optional[ResponseShape] = None
+    ) -> "EndpointSpec":
+        params = method.get("parameters", {})
+        upload = method.get("mediaUpload")
+        return cls(
+            method.get("httpMethod"),
+            method.get("path", ""),
+            tuple(p for p, s in params.items() if s.get("location") == "path"),
+            tuple(p for p, s in params.items() if s.get("required") is True),
+            upload["protocols"]["simple"]["path"] if upload else None,
+            response,
+        )
+
+
+class DiscoveryIndex:
+    def __init__(
+        self, endpoints: Dict[Tuple[str, ...], EndpointSpec], root_url: str, digest: str
+    ):
+        """A flat table of the endpoints of a discovery document.
+
+        Args:
+            endpoints: The EndpointSpec of each endpoint, by name parts
+            root_url: The root url of the api
+            digest: The content hash of the discovery document
+        """
+        self.endpoints = endpoints
+        self.root_url = root_url
+        self.digest = digest
+
+    def get(self, name_parts: Tuple[str, ...]) -> Optional[EndpointSpec]:
+        return self.endpoints.get(name_parts)
+
+    @classmethod
+    def from_discovery(cls, discovery_doc: Dict[str, Any]) -> "DiscoveryIndex":
+        digest = sha256(dumps(discovery_doc, sort_keys=True).encode()).hexdigest()
+        endpoints = {
+            name_parts: EndpointSpec.from_method(
+                method, response_shape(discovery_doc, name_parts, method)
+            )
+            for name_parts, method in walk_endpoints(discovery_doc)
+        }
+        return cls(endpoints, discovery_doc.get("rootUrl", ""), digest)
+
+    def dumps(self) -> bytes:
+        """Serialize the index, with a checksum, in a compact binary format."""
+        payload = marshal.dumps(
+            (
+                SNAPSHOT_VERSION,
+                self.digest,
+                self.root_url,
+                tuple((k, tuple(v)) for k, v in self.endpoints.items()),
+            )
+        )
+        return _MAGIC + sha256(payload).digest() + payload
+
+    @classmethod
+    def loads(cls, data: bytes) -> "DiscoveryIndex":
+        """Load a serialized index.
+
+        Raises:
+            ValueError: The data is not a valid snapshot of this version
+        """
+        if data[:4] != _MAGIC:
+            raise ValueError("Not a discovery index snapshot")
+        checksum, payload = data[4:36], data[36:]
+        if sha256(payload).digest() != checksum:
+            raise ValueError("Corrupted discovery index snapshot")
+        version, digest, root_url, endpoints = marshal.loads(payload)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        return cls({k: EndpointSpec(*v) for k, v in endpoints}, root_url, digest)
+
+
+def set_index_snapshot_dir(directory: Optional[str]) -> None:
+    """Set where the index snapshots are stored, None disables them. They are
+    stored next to the SDK configuration database by default."""
+    global _snapshot_dir
+    _snapshot_dir = directory
+
+
+def index_snapshot_key(discovery_url: str, base_url: str, version: str) -> str:
+    """The key of the snapshot of a discovery document.
+
+    Args:
+        discovery_url: The url of the discovery document
+        base_url: The base url of the client, the root url of the index
+            depends on it
+        version: What identifies the content of the document, eg its ETag
+    """
+    return f"{discovery_url}|{base_url}|{version}"
+
+
+def _snapshot_path(key: str) -> Optional[str]:
+    directory = _snapshot_dir
+    if directory is _DEFAULT_DIR:
+        directory = os.path.dirname(get_conf_db_file())
+    if not directory:
+        return None
+    name = sha1(key.encode()).hexdigest()
+    return os.path.join(directory, f"lumapps-sdk-index-{name}.bin")
+
+
+def load_index_snapshot(key: str) -> Optional[Tuple[DiscoveryIndex, float]]:
+    """Load an index snapshot, if there is a fresh one.
+
+    Returns:
+        The index and the timestamp at which it expires
+    """
+    path = _snapshot_path(key)
+    if not path:
+        return None
+    try:
+        expires_at = os.path.getmtime(path) + CACHE_MAX_AGE.total_seconds()
+        if expires_at < time():
+            return None
+        with open(path, "rb") as fh:
+            return DiscoveryIndex.loads(fh.read()), expires_at
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+
+
+def remove_index_snapshot(key: str) -> None:
+    """Remove an index snapshot, eg once its document changed."""
+    path = _snapshot_path(key)
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def save_index_snapshot(key: str, index: DiscoveryIndex) -> None:
+    """Store an index snapshot, ignoring the write errors."""
+    path = _snapshot_path(key)
+    if not path:
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as fh:
+            fh.write(index.dumps())
+        # Atomic, concurrent processes never read a partial snapshot
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
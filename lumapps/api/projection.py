@@ -0,0 +1,93 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from lumapps.api.utils import PruneTrie, method_from_discovery
+
+# The fields of a listing response needed to get its next pages
+PAGINATION_FIELDS = ("more", "cursor")
+LISTING_METHODS = ("list", "search")
+
+# Whether a response is a listing, and the fields of the response or its items
+ResponseShape = Tuple[bool, Tuple[str, ...]]
+
+
+def _properties(discovery_doc: Dict[str, Any], ref: Optional[str]) -> Dict[str, Any]:
+    if not ref:
+        return {}
+    return discovery_doc.get("schemas", {}).get(ref, {}).get("properties", {})
+
+
+def response_shape(
+    discovery_doc: Dict[str, Any],
+    name_parts: Sequence[str],
+    method: Optional[Dict[str, Any]] = None,
+) -> ResponseShape:
+    """Get whether the response of an endpoint is a listing, and the fields of
+    the response, or of its items for a listing.
+
+    Args:
+        discovery_doc: The discovery document of the api
+        name_parts: The endpoint
+        method: The method of the endpoint in the document, when known
+    """
+    if method is None:
+        method = method_from_discovery(discovery_doc, name_parts) or {}
+    response = _properties(discovery_doc, method.get("response", {}).get("$ref"))
+    if response:
+        listing = "items" in response and "more" in response
+    else:
+        listing = name_parts[-1] in LISTING_METHODS
+    item = response
+    if listing:
+        item_ref = response.get("items", {}).get("items", {}).get("$ref")
+        item = _properties(discovery_doc, item_ref)
+    return listing, tuple(item)
+
+
+def select_fields(
+    shape: ResponseShape,
+    needed_fields: Optional[Sequence[str]] = None,
+    prune_trie: Optional[PruneTrie] = None,
+) -> Optional[str]:
+    """Build the `fields` parameter restricting a response to what is used.
+
+    The fields are the `needed_fields` when given, else the fields of the
+    response that the prune rules do not drop entirely. For a listing they
+    select the fields of the items and keep the pagination fields, eg
+    `items(id,slug),more,cursor`.
+
+    Args:
+        shape: The response_shape of the endpoint
+        needed_fields: The fields used by the caller, a sub-field is selected
+            with a slash, eg author/email
+        prune_trie: The compiled prune rules of the endpoint
+
+    Returns:
+        The fields, None when the response would not be restricted
+    """
+    listing, item = shape
+    selected: List[str]
+    if needed_fields:
+        selected = list(dict.fromkeys(needed_fields))
+    elif prune_trie and item:
+        # Only the fields dropped entirely can be left out of the response, the
+        # ones pruned partially are still pruned locally
+        selected = [f for f in item if f not in prune_trie or prune_trie[f]]
+        if len(selected) == len(item):
+            return None
+    else:
+        return None
+    if not listing:
+        return ",".join(selected)
+    return f"items({','.join(selected)})," + ",".join(PAGINATION_FIELDS)
+
+
+def build_fields(
+    discovery_doc: Dict[str, Any],
+    name_parts: Sequence[str],
+    needed_fields: Optional[Sequence[str]] = None,
+    prune_trie: Optional[PruneTrie] = None,
+) -> Optional[str]:
+    """Build the `fields` parameter of an endpoint from the discovery document,
+    see `select_fields`."""
+    shape = response_shape(discovery_doc, name_parts)
+    return select_fields(shape, needed_fields, prune_trie)
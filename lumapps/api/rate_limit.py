@@ -0,0 +1,178 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from logging import debug
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable, Dict, Optional, Sequence
+
+from lumapps.api.utils import is_read_endpoint
+
+READS = "reads"
+WRITES = "writes"
+
+# Tolerance on the token count, float refills never land exactly on 1
+_EPSILON = 1e-9
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header, either a number of seconds or an HTTP date.
+
+    Returns:
+        The number of seconds to wait or None if the value is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max((date - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = monotonic,
+        sleeper: Callable[[float], None] = sleep,
+    ):
+        """A thread-safe token bucket.
+
+        Args:
+            rate: The number of tokens added per second, ie the sustained
+                number of calls per second
+            capacity: The maximum number of tokens, ie the allowed burst.
+                Defaults to `rate` (at least 1).
+            clock: The monotonic clock to use, in seconds
+            sleeper: The function used to wait
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._clock = clock
+        self._sleep = sleeper
+        self._lock = Lock()
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self.waited = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Take tokens from the bucket, waiting for them if needed.
+
+        Returns:
+            The number of seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens + _EPSILON >= tokens:
+                    self._tokens -= tokens
+                    self.waited += waited
+                    return waited
+                else:
+                    wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for a while, eg after a 429 response."""
+        with self._lock:
+            now = self._clock()
+            self._paused_until = max(self._paused_until, now + seconds)
+            # Restart slowly once the pause is over instead of bursting
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        reads: Optional[TokenBucket] = None,
+        writes: Optional[TokenBucket] = None,
+        endpoints: Optional[Dict[str, TokenBucket]] = None,
+        default_pause: float = 1.0,
+        max_throttle_retries: int = 3,
+    ):
+        """Client-side rate limiter, one token bucket per endpoint family.
+
+        The buckets are shared by all the threads using the client, and the
+        clients derived from it.
+
+        Args:
+            reads: The bucket of the read endpoints (GET, READ_POST_ENDPOINTS)
+            writes: The bucket of the other endpoints
+            endpoints: Dedicated buckets, by endpoint or endpoint prefix,
+                eg {"comment/save": TokenBucket(1)}
+            default_pause: How long to pause a bucket after a 429 response
+                without a Retry-After header
+            max_throttle_retries: How many times a throttled call is retried
+        """
+        self.families: Dict[str, Optional[TokenBucket]] = {
+            READS: reads,
+            WRITES: writes,
+        }
+        self.endpoints = {tuple(k.split("/")): v for k, v in (endpoints or {}).items()}
+        self.default_pause = default_pause
+        self.max_throttle_retries = max_throttle_retries
+        self.throttled = 0
+        self._lock = Lock()
+
+    def bucket_for(
+        self, verb: Optional[str], name_parts: Sequence[str]
+    ) -> Optional[TokenBucket]:
+        name_parts = tuple(name_parts)
+        for i in range(len(name_parts), 0, -1):
+            bucket = self.endpoints.get(name_parts[:i])
+            if bucket:
+                return bucket
+        family = READS if is_read_endpoint(verb, name_parts) else WRITES
+        return self.families[family]
+
+    def acquire(self, verb: Optional[str], name_parts: Sequence[str]) -> float:
+        """Wait for the bucket of an endpoint, returns the time spent waiting."""
+        bucket = self.bucket_for(verb, name_parts)
+        return bucket.acquire() if bucket else 0.0
+
+    def throttle(
+        self,
+        verb: Optional[str],
+        name_parts: Sequence[str],
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """Pause the bucket of an endpoint after the server throttled a call."""
+        with self._lock:
+            self.throttled += 1
+        pause = self.default_pause if retry_after is None else retry_after
+        bucket = self.bucket_for(verb, name_parts)
+        debug(f"Throttled on {'/'.join(name_parts)}, pausing for {pause}s")
+        if bucket:
+            bucket.pause(pause)
+        else:
+            sleep(pause)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        stats: Dict[str, float] = {"throttled": self.throttled}
+        for family, bucket in self.families.items():
+            if bucket:
+                stats[f"{family}_waited"] = bucket.waited
+        return stats
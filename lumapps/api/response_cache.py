@@ -0,0 +1,286 @@
+from collections import OrderedDict
+from copy import deepcopy
+from hashlib import sha1
+from threading import Lock
+from time import time
+from typing import Any, Dict, NamedTuple, Optional, Sequence
+
+from lumapps.api.codec import dumps, loads
+from lumapps.api.utils import _get_conn, sqlite_transaction
+
+# The methods after which the cached responses of a resource are dropped
+INVALIDATING_METHODS = ("save", "delete", "archive")
+
+
+class CacheRule(NamedTuple):
+    """How the responses of an endpoint are cached."""
+
+    # How long a response is served without asking the server, in seconds
+    ttl: float
+    # Whether a 404 is cached, so that missing objects are not asked again
+    cache_not_found: bool = False
+    # How long a 404 is cached, defaults to ttl
+    not_found_ttl: Optional[float] = None
+    # The maximum number of responses cached for the endpoint
+    max_size: Optional[int] = None
+
+
+# Rules for the LumApps objects that are read often and seldom modified
+LUMAPPS_CACHE_RULES = {
+    "content/get": CacheRule(ttl=300, cache_not_found=True, max_size=1000),
+    "community/get": CacheRule(ttl=300, cache_not_found=True, max_size=1000),
+    "community/post/get": CacheRule(ttl=300, cache_not_found=True, max_size=1000),
+    "media/get": CacheRule(ttl=300, cache_not_found=True, max_size=1000),
+    "customcontenttype/get": CacheRule(ttl=3600, max_size=100),
+    "instance/get": CacheRule(ttl=3600, max_size=100),
+}
+
+
+def _endpoint(key: str) -> str:
+    return key.split("|", 1)[0]
+
+
+class MemoryResponseCacheBackend:
+    def __init__(self, max_entries: int = 10000):
+        """Keep the responses in memory, dropping the least recently used ones.
+
+        Args:
+            max_entries: The maximum number of responses kept
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # The keys of each endpoint, least recently set first
+        self._keys: Dict[str, "OrderedDict[str, None]"] = {}
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _pop(self, key: str) -> None:
+        self._entries.pop(key, None)
+        keys = self._keys.get(_endpoint(key))
+        if keys is not None:
+            keys.pop(key, None)
+
+    def set(
+        self, key: str, entry: Dict[str, Any], max_size: Optional[int] = None
+    ) -> None:
+        """Store the entry of a key.
+
+        Args:
+            key: The key, starting with the endpoint
+            entry: The entry
+            max_size: The maximum number of entries of the endpoint
+        """
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            keys = self._keys.setdefault(_endpoint(key), OrderedDict())
+            keys[key] = None
+            keys.move_to_end(key)
+            while max_size and len(keys) > max_size:
+                self._pop(next(iter(keys)))
+            while len(self._entries) > self.max_entries:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._pop(key)
+
+
+class SqliteResponseCacheBackend:
+    # How often the expired responses are purged from the database, in seconds
+    PURGE_INTERVAL = 600
+
+    def __init__(
+        self,
+        db_file: Optional[str] = None,
+        max_entries: int = 100000,
+        stale_ttl: float = 3600,
+    ):
+        """Keep the responses in the SDK SQLite database, shared by the
+        processes of a host.
+
+        The expired responses are deleted when they are read, and all at once
+        every PURGE_INTERVAL seconds when storing.
+
+        Args:
+            db_file: The database file, defaults to the SDK configuration one
+            max_entries: The maximum number of responses kept, the oldest ones
+                are dropped beyond it when purging
+            stale_ttl: How long a response with an ETag is kept after its ttl,
+                to be revalidated, in seconds
+        """
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self._next_purge = 0.0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        conn = _get_conn(self.db_file)
+        if not conn:
+            return None
+        row = conn.execute(
+            "SELECT content, purge_at FROM responses WHERE key=?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        if row["purge_at"] <= time():
+            conn.execute(
+                "DELETE FROM responses WHERE key=? AND purge_at<=?", (key, time())
+            )
+            return None
+        return loads(row["content"])
+
+    def set(
+        self, key: str, entry: Dict[str, Any], max_size: Optional[int] = None
+    ) -> None:
+        """Store the entry of a key.
+
+        Args:
+            key: The key, starting with the endpoint
+            entry: The entry
+            max_size: The maximum number of entries of the endpoint
+        """
+        now = time()
+        purge_at = entry["expires_at"] + (self.stale_ttl if entry.get("etag") else 0)
+        endpoint = _endpoint(key)
+        with sqlite_transaction(self.db_file) as conn:
+            if not conn:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, endpoint, purge_at, now, dumps(entry)),
+            )
+            if max_size:
+                conn.execute(
+                    "DELETE FROM responses WHERE endpoint=? AND key NOT IN "
+                    "(SELECT key FROM responses WHERE endpoint=? "
+                    "ORDER BY stored_at DESC LIMIT ?)",
+                    (endpoint, endpoint, max_size),
+                )
+            if now >= self._next_purge:
+                self._purge(conn, now)
+
+    def _purge(self, conn, now: float) -> None:
+        conn.execute("DELETE FROM responses WHERE purge_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY stored_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self._next_purge = now + self.PURGE_INTERVAL
+
+    def delete(self, key: str) -> None:
+        conn = _get_conn(self.db_file)
+        if conn:
+            conn.execute("DELETE FROM responses WHERE key=?", (key,))
+
+    def delete_prefix(self, prefix: str) -> None:
+        conn = _get_conn(self.db_file)
+        if conn:
+            conn.execute(
+                "DELETE FROM responses WHERE substr(key, 1, ?)=?",
+                (len(prefix), prefix),
+            )
+
+
+class ResponseCache:
+    def __init__(self, rules: Dict[str, CacheRule], backend: Any = None):
+        """Cache the responses of read endpoints.
+
+        The responses are served from the cache during the ttl of their rule.
+        Past it, a response with an ETag is revalidated with If-None-Match.
+        Calling a save, delete or archive endpoint drops the cached responses
+        of its resource, eg content/save drops the content/get and content/list
+        ones.
+
+        Args:
+            rules: The CacheRule of each endpoint to cache, by endpoint (eg
+                content/get) or by resource (eg content/*)
+            backend: Where the responses are stored, defaults to a
+                MemoryResponseCacheBackend
+
+        Example:
+            >>> cache = ResponseCache({
+            ...     "content/get": CacheRule(ttl=300, cache_not_found=True),
+            ...     "user/*": CacheRule(ttl=3600, max_size=1000),
+            ... })
+            >>> client = BaseClient(api_info, token=token, response_cache=cache)
+        """
+        self.rules = dict(rules)
+        self.backend = backend or MemoryResponseCacheBackend()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def rule_for(self, endpoint: str) -> Optional[CacheRule]:
+        rule = self.rules.get(endpoint)
+        if rule is None:
+            rule = self.rules.get(endpoint.rsplit("/", 1)[0] + "/*")
+        return rule
+
+    @staticmethod
+    def key(endpoint: str, scope: str, params: dict, body: Any) -> str:
+        """The key of a call.
+
+        Args:
+            endpoint: The endpoint, eg content/get
+            scope: Who the response is for, the server, the platform and the
+                authenticated identity of the call
+            params: The parameters of the call
+            body: The body of the call
+        """
+        digest = sha1(
+            dumps([params, body], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        return f"{endpoint}|{scope}|{digest}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get the entry of a key, fresh or not.
+
+        Returns:
+            None or a dict with the `status`, `body`, `etag` and `expires_at`
+            of the cached response
+        """
+        return self.backend.get(key)
+
+    def set(
+        self,
+        key: str,
+        rule: CacheRule,
+        status: int,
+        body: Any = None,
+        etag: Optional[str] = None,
+    ) -> None:
+        ttl = rule.ttl
+        if status == 404 and rule.not_found_ttl is not None:
+            ttl = rule.not_found_ttl
+        entry = {
+            "status": status,
+            "body": deepcopy(body),
+            "etag": etag,
+            "expires_at": time() + ttl,
+        }
+        self.backend.set(key, entry, rule.max_size)
+
+    def refresh(self, key: str, rule: CacheRule, entry: Dict[str, Any]) -> None:
+        """Extend a revalidated entry for another ttl."""
+        self.revalidations += 1
+        self.set(key, rule, entry["status"], entry["body"], entry.get("etag"))
+
+    def invalidate(self, name_parts: Sequence[str]) -> None:
+        """Drop the cached responses made stale by a call to an endpoint."""
+        if len(name_parts) < 2 or name_parts[-1] not in INVALIDATING_METHODS:
+            return
+        prefix = "/".join(name_parts[:-1]) + "/"
+        self.backend.delete_prefix(prefix)
@@ -0,0 +1,241 @@
+from logging import debug
+from random import random
+from threading import Lock
+from time import sleep
+from typing import Any, Callable, NamedTuple, Optional, Sequence
+
+from httpx import ConnectError, ConnectTimeout, PoolTimeout, Response, TransportError
+
+from lumapps.api.rate_limit import parse_retry_after
+from lumapps.api.utils import is_read_endpoint
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Errors raised before the request reached the server, any call can be retried
+_NOT_SENT_ERRORS = (ConnectError, ConnectTimeout, PoolTimeout)
+
+
+class RetryAttempt(NamedTuple):
+    """What happened during an attempt, as given to the `on_attempt` hook."""
+
+    endpoint: str
+    attempt: int
+    status_code: Optional[int]
+    error: Optional[BaseException]
+    # The time to wait before the next attempt, None when there is none
+    delay: Optional[float]
+
+
+class RetryBudget:
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10):
+        """Limit the retries to a ratio of the calls.
+
+        Every call deposits `ratio` token, every retry withdraws one, so that
+        a degraded backend sees at most `1 + ratio` times the normal traffic
+        instead of a retry storm. The budget starts full.
+
+        Args:
+            ratio: The number of retries allowed per call
+            max_tokens: The maximum number of retries saved up
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = Lock()
+        self.exhausted = 0
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self) -> bool:
+        """Take a retry from the budget, returns False when it is empty."""
+        with self._lock:
+            if self._tokens < 1:
+                self.exhausted += 1
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        jitter: bool = True,
+        retry_statuses: Sequence[int] = RETRY_STATUSES,
+        retry_transport_errors: bool = True,
+        retry_writes: bool = False,
+        respect_retry_after: bool = True,
+        budget: Optional[RetryBudget] = None,
+        on_attempt: Optional[Callable[[RetryAttempt], Any]] = None,
+        sleeper: Callable[[float], None] = sleep,
+    ):
+        """How the calls are retried.
+
+        By default only the read endpoints are retried (GET verbs, and the
+        listings of READ_POST_ENDPOINTS). The writes are retried only when the
+        request did not reach the server (connection errors) or was rejected
+        with a 429, unless `retry_writes` is set.
+
+        The statuses of `retry_statuses` are retried by the calls of a client
+        only, the retries of its methods (eg `retry_on_http_codes`) leave them
+        out so that the attempts do not multiply.
+
+        Args:
+            max_attempts: The maximum number of attempts of a call, retries
+                included
+            backoff_base: The delay before the first retry, it doubles with
+                every retry
+            backoff_max: The maximum delay between two attempts
+            jitter: Whether to wait a random delay between 0 and the backoff
+                (full jitter) to spread the retries of concurrent calls
+            retry_statuses: The HTTP status codes to retry
+            retry_transport_errors: Whether to retry connection errors and
+                timeouts
+            retry_writes: Whether to retry the write endpoints too
+            respect_retry_after: Whether to wait for the delay given by the
+                Retry-After header of a response, when there is one
+            budget: A RetryBudget shared by the calls using this policy
+            on_attempt: A function called with a RetryAttempt after every
+                attempt
+            sleeper: The function used to wait
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_transport_errors = retry_transport_errors
+        self.retry_writes = retry_writes
+        self.respect_retry_after = respect_retry_after
+        self.budget = budget
+        self.on_attempt = on_attempt
+        self.sleep = sleeper
+
+    def should_retry(
+        self,
+        verb: Optional[str],
+        name_parts: Sequence[str],
+        attempt: int,
+        response: Optional[Response] = None,
+        error: Optional[BaseException] = None,
+    ) -> bool:
+        """Whether a call should be retried after the given attempt."""
+        if attempt >= self.max_attempts:
+            return False
+        safe = self.retry_writes or is_read_endpoint(verb, name_parts)
+        if error is not None:
+            if not self.retry_transport_errors:
+                return False
+            if isinstance(error, _NOT_SENT_ERRORS):
+                return True
+            return safe and isinstance(error, TransportError)
+        if response is None or response.status_code not in self.retry_statuses:
+            return False
+        return safe or response.status_code == 429
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """The time to wait after the given attempt."""
+        if retry_after is not None and self.respect_retry_after:
+            return retry_after
+        delay = min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max)
+        return delay * random() if self.jitter else delay
+
+    def record(
+        self,
+        endpoint: str,
+        attempt: int,
+        response: Optional[Response] = None,
+        error: Optional[BaseException] = None,
+        retry: bool = False,
+    ) -> Optional[float]:
+        """Record an attempt, to be called after every attempt of a call.
+
+        Args:
+            endpoint: The endpoint called, eg user/get
+            attempt: The number of the attempt, starting at 1
+            response: The response, if any
+            error: The error raised, if any
+            retry: Whether the call should be retried
+
+        Returns:
+            The time to wait before retrying or None when the call must not be
+            retried, either because `retry` is False or because the retry
+            budget is exhausted.
+        """
+        if self.budget and attempt == 1:
+            self.budget.deposit()
+        delay = None
+        if retry and (not self.budget or self.budget.withdraw()):
+            retry_after = None
+            if response is not None:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            delay = self.backoff(attempt, retry_after)
+        status_code = response.status_code if response is not None else None
+        if delay is not None:
+            debug(f"Attempt {attempt} of {endpoint} failed, retrying in {delay:.2f}s")
+        if self.on_attempt:
+            self.on_attempt(RetryAttempt(endpoint, attempt, status_code, error, delay))
+        return delay
+
+
+def retry_call(
+    f: Callable[[], Any],
+    retryable: Callable[[Exception], bool],
+    max_attempts: int,
+    policy: Optional[RetryPolicy] = None,
+    endpoint: str = "",
+) -> Any:
+    """Call a function, retrying it when it raises a retryable exception.
+
+    Args:
+        f: The function to call, without arguments
+        retryable: Whether an exception raised by `f` can be retried
+        max_attempts: The maximum number of attempts
+        policy: The RetryPolicy giving the delay between the attempts, the
+            budget and the hook. Without it the retries are immediate.
+        endpoint: The name of the call, for the logs and the hook
+
+    Returns:
+        The result of `f`
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            result = f()
+        except Exception as err:
+            retry = attempt < max_attempts and retryable(err)
+            if not retry and attempt >= max_attempts:
+                debug(f"Max attempts {max_attempts} reached")
+            delay: Optional[float] = 0.0 if retry else None
+            if policy:
+                response = getattr(err, "response", None)
+                delay = policy.record(endpoint, attempt, response, err, retry)
+            if delay is None:
+                raise
+            debug(f"{attempt}/{max_attempts} failed: {err}")
+            if delay:
+                (policy.sleep if policy else sleep)(delay)
+            continue
+        if policy:
+            policy.record(endpoint, attempt)
+        return result
+
+
+def retried_by_client(client: Any, error: BaseException) -> bool:
+    """Whether the calls of a client already retry an HTTP error, in which case
+    the methods of the client must not retry it again."""
+    response = getattr(error, "response", None)
+    if not isinstance(response, Response):
+        return False
+    policy = getattr(client, "retry_policy", None)
+    if isinstance(policy, RetryPolicy):
+        return response.status_code in policy.retry_statuses
+    # Without a policy, the rate limiter retries the 429
+    rate_limiter = getattr(client, "rate_limiter", None)
+    return response.status_code == 429 and rate_limiter is not None
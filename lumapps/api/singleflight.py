@@ -0,0 +1,63 @@
+from copy import deepcopy
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        """Coalesce identical calls running at the same time.
+
+        The first caller of a key (the leader) runs the call, the callers
+        arriving with the same key before it is done (the followers) wait for
+        its outcome instead of running the call again. Each caller gets its own
+        deep copy of the result so that they can modify it freely.
+        """
+        self._lock = Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.coalesced = 0
+
+    def do(self, key: Hashable, f: Callable[[], Any]) -> Any:
+        """Run `f` unless a call with the same key is in flight.
+
+        Args:
+            key: What identifies identical calls
+            f: The call, without arguments
+
+        Returns:
+            The result of `f`, an exception raised by `f` is raised to all the
+            callers
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return deepcopy(flight.result)
+        try:
+            flight.result = f()
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        # The followers copy the result concurrently, keep it untouched
+        return deepcopy(flight.result) if flight.followers else flight.result
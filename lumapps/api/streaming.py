@@ -0,0 +1,138 @@
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from lumapps.api.codec import loads
+
+# What changes the structure of a JSON document, outside and inside strings
+_STRUCTURE = re.compile(rb'["{}\[\],]')
+_STRING_END = re.compile(rb'["\\]')
+_OPENING = frozenset(b"{[")
+_CLOSING = frozenset(b"}]")
+
+
+class ListingDecoder:
+    def __init__(self, decode_item: Callable[[bytes], Any] = loads):
+        """Split a listing response into its items while it is received.
+
+        The bytes of the `items` array are cut into one buffer per item, each
+        item is decoded on its own as soon as it is complete. Only the item
+        being received is held in memory, the rest of the response, eg the
+        `more` and `cursor` fields, is decoded once it is all received.
+
+        Args:
+            decode_item: What decodes the bytes of an item
+
+        Example:
+            >>> decoder = ListingDecoder()
+            >>> for chunk in resp.iter_bytes():
+            ...     for item in decoder.feed(chunk):
+            ...         print(item["id"])
+            >>> cursor = decoder.close().get("cursor")
+        """
+        self._decode_item = decode_item
+        self._buf = bytearray()
+        # The parts of the response other than the items
+        self._rest = bytearray()
+        self._pos = 0
+        self._mark = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = 0
+        self._items_key = False
+        self._in_items = False
+        self._item_start = 0
+        self.count = 0
+
+    def _emit(self, end: int, items: List[Any]) -> None:
+        raw = bytes(self._buf[self._item_start : end]).strip()
+        if raw:
+            items.append(self._decode_item(raw))
+            self.count += 1
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """Add a chunk of the response.
+
+        Returns:
+            The items completed by the chunk
+        """
+        buf = self._buf
+        buf += chunk
+        items: List[Any] = []
+        pos = self._pos
+        while True:
+            if self._in_string:
+                m = _STRING_END.search(buf, pos)
+                if m is None:
+                    pos = len(buf)
+                    break
+                if buf[m.start()] == 0x5C:  # a backslash, skip what it escapes
+                    if m.end() >= len(buf):
+                        pos = m.start()
+                        break
+                    pos = m.end() + 1
+                    continue
+                pos = m.end()
+                self._in_string = False
+                if self._depth == 1:
+                    self._items_key = buf[self._string_start : pos] == b'"items"'
+                continue
+            m = _STRUCTURE.search(buf, pos)
+            if m is None:
+                pos = len(buf)
+                break
+            i, pos = m.start(), m.end()
+            c = buf[i]
+            if c == 0x22:  # a quote
+                self._in_string = True
+                self._string_start = i
+                continue
+            if c in _OPENING:
+                if self._items_key and self._depth == 1 and c == 0x5B:
+                    # The start of the items array
+                    self._rest += buf[self._mark : pos]
+                    self._in_items = True
+                    self._item_start = pos
+                self._depth += 1
+            elif c in _CLOSING:
+                self._depth -= 1
+                if self._in_items and self._depth == 1:
+                    self._emit(i, items)
+                    self._in_items = False
+                    self._mark = i
+            elif self._in_items and self._depth == 2:
+                self._emit(i, items)
+                self._item_start = pos
+            self._items_key = False
+        self._compact(pos)
+        return items
+
+    def _compact(self, pos: int) -> None:
+        """Drop the bytes that are no longer needed from the buffer."""
+        if self._in_items:
+            keep = self._item_start
+        else:
+            keep = self._string_start if self._in_string else pos
+            self._rest += self._buf[self._mark : keep]
+            self._mark = keep
+        del self._buf[:keep]
+        self._pos = pos - keep
+        self._mark -= keep
+        self._item_start -= keep
+        self._string_start -= keep
+
+    def close(self) -> Optional[Dict[str, Any]]:
+        """End the response.
+
+        Returns:
+            The response without its items, None when it is empty
+
+        Raises:
+            ValueError: The response is truncated or is not JSON
+        """
+        if self._depth or self._in_string or self._in_items:
+            raise ValueError("Truncated JSON response")
+        self._rest += self._buf[self._mark :]
+        self._buf.clear()
+        if not self._rest.strip():
+            return None
+        return loads(bytes(self._rest))
@@ -0,0 +1,197 @@
+import asyncio
+from inspect import isawaitable
+from logging import debug
+from threading import Lock
+from time import monotonic
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+TokenGetter = Callable[[], Tuple[str, int]]
+AsyncTokenGetter = Callable[[], Union[Tuple[str, int], Awaitable[Tuple[str, int]]]]
+
+
+class TokenManager:
+    def __init__(
+        self,
+        token_getter: TokenGetter,
+        refresh_margin: float = 60,
+        clock: Callable[[], float] = monotonic,
+    ):
+        """Thread-safe holder of a bearer token obtained through a token getter.
+
+        The token is refreshed `refresh_margin` seconds ahead of its expiry by
+        the first caller that notices it, the other callers keep using the
+        still valid token meanwhile. Once a token is expired, the callers wait
+        for a single refresh, whatever their number.
+
+        A TokenManager is itself a token getter, it can be passed as the
+        `token_getter` of several clients so that they share the same token.
+
+        Args:
+            token_getter: A function returning a `(token, expires_in)` tuple,
+                `expires_in` being a number of seconds. When it is falsy the
+                token is considered valid until it is invalidated.
+            refresh_margin: How long before the expiry to refresh the token.
+            clock: The monotonic clock to use, in seconds.
+        """
+        self._token_getter = token_getter
+        self.refresh_margin = refresh_margin
+        self._clock = clock
+        self._lock = Lock()
+        # (token, expires_at), swapped at once so that readers never see a
+        # token along with the expiry of another one
+        self._state: Tuple[Optional[str], float] = (None, 0.0)
+        self._stats = {
+            "refreshes": 0,
+            "proactive_refreshes": 0,
+            "refresh_failures": 0,
+            "invalidations": 0,
+            "waits": 0,
+        }
+
+    def __call__(self) -> Tuple[str, int]:
+        token = self.get_token()
+        expires_at = self._state[1]
+        if expires_at == float("inf"):
+            return token, 0
+        return token, max(int(expires_at - self._clock()), 0)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Counters about the token refreshes."""
+        return dict(self._stats)
+
+    def _is_valid(self, state: Tuple[Optional[str], float], margin: float = 0) -> bool:
+        token, expires_at = state
+        return bool(token) and self._clock() < expires_at - margin
+
+    def _refresh(self) -> str:
+        try:
+            token, expires_in = self._token_getter()
+        except Exception:
+            self._stats["refresh_failures"] += 1
+            raise
+        return self._store(token, expires_in)
+
+    def _store(self, token: str, expires_in: int) -> str:
+        self._stats["refreshes"] += 1
+        expires_at = self._clock() + expires_in if expires_in else float("inf")
+        self._state = (token, expires_at)
+        debug(f"Token refreshed, expires in {expires_in}s")
+        return token
+
+    def get_token(self) -> str:
+        """Get a valid token, refreshing it if needed."""
+        state = self._state
+        if self._is_valid(state, self.refresh_margin):
+            return state[0]  # type: ignore
+        if self._is_valid(state):
+            # Expires soon: refresh it unless someone else already does
+            if not self._lock.acquire(blocking=False):
+                return state[0]  # type: ignore
+            try:
+                if self._state is not state:
+                    return self._state[0]  # type: ignore
+                self._stats["proactive_refreshes"] += 1
+                try:
+                    return self._refresh()
+                except Exception:
+                    return state[0]  # type: ignore
+            finally:
+                self._lock.release()
+        if not self._lock.acquire(blocking=False):
+            self._lock.acquire()
+            self._stats["waits"] += 1
+        try:
+            if self._is_valid(self._state):
+                return self._state[0]  # type: ignore
+            return self._refresh()
+        finally:
+            self._lock.release()
+
+    def seed(self, token: str, expires_in: int = 0) -> None:
+        """Use an already obtained token, unless the manager holds one already.
+
+        Args:
+            token: The bearer token
+            expires_in: Its lifetime in seconds, 0 when unknown
+        """
+        with self._lock:
+            if self._state[0] is None:
+                expires_at = self._clock() + expires_in if expires_in else float("inf")
+                self._state = (token, expires_at)
+
+    def invalidate(self, token: Optional[str] = None) -> None:
+        """Mark a token as expired, eg after a 401 response.
+
+        Args:
+            token: The rejected token, nothing is done if it was already
+                replaced by a new one. Defaults to the current token.
+        """
+        with self._lock:
+            current = self._state[0]
+            if token is None or token == current:
+                self._stats["invalidations"] += 1
+                self._state = (current, 0.0)
+
+
+class AsyncTokenManager(TokenManager):
+    def __init__(
+        self,
+        token_getter: AsyncTokenGetter,
+        refresh_margin: float = 60,
+        clock: Callable[[], float] = monotonic,
+    ):
+        """Asyncio flavour of the TokenManager, for the AsyncBaseClient.
+
+        The token getter can return the `(token, expires_in)` tuple or an
+        awaitable of it. The refreshes are made by a single task, the other
+        tasks keep using the still valid token or wait for the refresh.
+        """
+        super().__init__(token_getter, refresh_margin, clock)  # type: ignore
+        self._refresh_lock: Optional[asyncio.Lock] = None
+
+    async def __call__(self) -> Tuple[str, int]:  # type: ignore
+        token = await self.get_token()
+        expires_at = self._state[1]
+        if expires_at == float("inf"):
+            return token, 0
+        return token, max(int(expires_at - self._clock()), 0)
+
+    async def _refresh(self) -> str:  # type: ignore
+        try:
+            result = self._token_getter()
+            if isawaitable(result):
+                result = await result
+            token, expires_in = result
+        except Exception:
+            self._stats["refresh_failures"] += 1
+            raise
+        return self._store(token, expires_in)
+
+    async def get_token(self) -> str:  # type: ignore
+        """Get a valid token, refreshing it if needed."""
+        state = self._state
+        if self._is_valid(state, self.refresh_margin):
+            return state[0]  # type: ignore
+        if self._refresh_lock is None:
+            # Created in the event loop that uses it
+            self._refresh_lock = asyncio.Lock()
+        lock = self._refresh_lock
+        if self._is_valid(state):
+            # Expires soon: refresh it unless another task already does
+            if lock.locked():
+                return state[0]  # type: ignore
+            async with lock:
+                if self._state is not state:
+                    return self._state[0]  # type: ignore
+                self._stats["proactive_refreshes"] += 1
+                try:
+                    return await self._refresh()
+                except Exception:
+                    return state[0]  # type: ignore
+        if lock.locked():
+            self._stats["waits"] += 1
+        async with lock:
+            if self._is_valid(self._state):
+                return self._state[0]  # type: ignore
+            return await self._refresh()
@@ -0,0 +1,156 @@
+import os
+import stat
+from logging import debug
+from time import sleep, time
+from typing import Optional, Tuple, Union
+
+from lumapps.api.token_manager import TokenGetter
+from lumapps.api.utils import _get_conn, get_conf_db_file, sqlite_transaction
+
+
+def get_token_db_file() -> str:
+    """The token database, next to the SDK configuration database."""
+    return os.path.join(os.path.dirname(get_conf_db_file()), "lumapps-sdk-tokens.db")
+
+
+def _secure_file(path: str) -> None:
+    """Create the file readable by its owner only, or restrict it if needed."""
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_WRONLY, 0o600)
+        os.close(fd)
+        if stat.S_IMODE(os.stat(path).st_mode) & 0o077:
+            os.chmod(path, 0o600)
+    except OSError:
+        pass
+
+
+class SqliteTokenStore:
+    def __init__(
+        self,
+        db_file: Optional[str] = None,
+        refresh_margin: float = 60,
+        lease_timeout: float = 30,
+        poll_interval: float = 0.1,
+    ):
+        """The tokens of the users, in a SQLite database shared by the
+        processes of a host.
+
+        When a token must be refreshed, a single process fetches it while the
+        others wait for it in the database, the fetching process holds a lease
+        of `lease_timeout` seconds on the token. The database is only readable
+        by its owner.
+
+        Args:
+            db_file: The database file, defaults to get_token_db_file()
+            refresh_margin: How long before its expiry a token is refreshed, in
+                seconds
+            lease_timeout: How long a process may take to fetch a token before
+                another one takes over, in seconds
+            poll_interval: How often the waiting processes look for the token,
+                in seconds
+
+        Example:
+            >>> client = LumAppsClient(
+            ...     customer_id, None, auth_info=auth, token_store=SqliteTokenStore()
+            ... )
+        """
+        self.db_file = db_file or get_token_db_file()
+        self.refresh_margin = refresh_margin
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self._secured = False
+
+    def _conn(self):
+        if not self._secured:
+            _secure_file(self.db_file)
+            self._secured = True
+        return _get_conn(self.db_file)
+
+    def _read(self, key: str, rejected: Optional[str]) -> Optional[Tuple[str, int]]:
+        row = (
+            self._conn()
+            .execute("SELECT token, expires_at FROM tokens WHERE key=?", (key,))
+            .fetchone()
+        )
+        if not row or not row["token"] or row["token"] == rejected:
+            return None
+        expires_in = row["expires_at"] - time()
+        if expires_in <= self.refresh_margin:
+            return None
+        return row["token"], int(expires_in)
+
+    def _take_lease(
+        self, key: str, rejected: Optional[str]
+    ) -> Union[Tuple[str, int], bool]:
+        """Returns the valid token, else whether the lease was taken."""
+        now = time()
+        with sqlite_transaction(self.db_file) as conn:
+            found = self._read(key, rejected)
+            if found:
+                return found
+            row = conn.execute(
+                "SELECT lease_until FROM tokens WHERE key=?", (key,)
+            ).fetchone()
+            if row and row["lease_until"] > now:
+                return False
+            conn.execute(
+                "INSERT INTO tokens VALUES (?, NULL, 0, ?) ON CONFLICT(key) "
+                "DO UPDATE SET lease_until=excluded.lease_until",
+                (key, now + self.lease_timeout),
+            )
+            return True
+
+    def _fetch(self, key: str, token_getter: TokenGetter) -> Tuple[str, int]:
+        try:
+            token, expires_in = token_getter()
+        except Exception:
+            self._conn().execute("UPDATE tokens SET lease_until=0 WHERE key=?", (key,))
+            raise
+        self._conn().execute(
+            "UPDATE tokens SET token=?, expires_at=?, lease_until=0 WHERE key=?",
+            (token, time() + expires_in, key),
+        )
+        debug(f"Token of {key} stored, expires in {expires_in}s")
+        return token, expires_in
+
+    def get(
+        self,
+        customer_id: str,
+        email: str,
+        token_getter: TokenGetter,
+        rejected: Optional[str] = None,
+    ) -> Tuple[str, int]:
+        """Get the token of a user, fetching it with `token_getter` when there
+        is no valid one in the store.
+
+        Args:
+            customer_id: The id of the platform
+            email: The email of the user
+            token_getter: What fetches a `(token, expires_in)` tuple
+            rejected: A token refused by the server, refetched even if it is
+                not expired
+
+        Returns:
+            A `(token, expires_in)` tuple
+        """
+        key = f"{customer_id}|{email}"
+        if not self._conn():
+            return token_getter()
+        found = self._read(key, rejected)
+        if found:
+            return found
+        deadline = time() + self.lease_timeout
+        while time() < deadline:
+            lease = self._take_lease(key, rejected)
+            if lease is True:
+                return self._fetch(key, token_getter)
+            if lease:
+                return lease
+            # Another process is fetching the token
+            sleep(self.poll_interval)
+        return self._fetch(key, token_getter)
+
+    def delete(self, customer_id: str, email: str) -> None:
+        conn = self._conn()
+        if conn:
+            conn.execute("DELETE FROM tokens WHERE key=?", (f"{customer_id}|{email}",))
@@ -1,8 +1,10 @@
 import os
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from json import dumps, loads
-from typing import Any, Dict, Optional, Sequence
+from threading import local
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
 
+from lumapps.api.codec import dumps, loads
 from lumapps.api.conf import __pypi_packagename__
 
 if not os.getenv("GAE_ENV"):  # noqa
@@ -14,7 +16,51 @@ else:
 
 
 CACHE_MAX_AGE = timedelta(seconds=60 * 60 * 24)  # 1 day
+# How long an expired discovery document is served while it is refreshed
+DISCOVERY_MAX_STALE = timedelta(days=7)
 GOOGLE_APIS = ("drive", "admin", "groupssettings")
+# LumApps exposes most of its listings as POST (eg content/list), these are
+# the POST endpoints that only read. A name is not enough, eg the POST
+# document/uploadUrl/get and user/device/token/get create what they return.
+READ_POST_ENDPOINTS = frozenset(
+    (
+        "cloudsearch/customfields/list",
+        "cloudsearch/search",
+        "community/list",
+        "community/post/report/list",
+        "community/post/search",
+        "community/user/list",
+        "content/interest/list",
+        "content/list",
+        "custom/gsite/media/search",
+        "custom/gsite/pages/search",
+        "customer/list",
+        "directory/entry/list",
+        "document/getMulti",
+        "document/list",
+        "favorite/list_targets",
+        "feed/getMulti",
+        "feed/search",
+        "gamification/goal/list",
+        "gamification/leaderboard/list",
+        "gamification/leaderboard/season/list",
+        "gamification/quest/list",
+        "gamification/reward/list",
+        "gamification/usergoalresult/list",
+        "gamification/userreward/list",
+        "instance/metadata/list",
+        "instance/search",
+        "media/fsitems/list",
+        "notification/list",
+        "social/activity/list",
+        "stream/configuration/list",
+        "stream/content/list",
+        "stream/list",
+        "user/directory/list",
+        "user/directory/search",
+        "webhook/list",
+    )
+)
 FILTERS = {
     # content/get, content/list, ...
     "content/*": [
@@ -75,6 +121,61 @@ def pop_matches(dpath, d):
     d.pop(dpath.rpartition("/")[2], None)
 
 
+# The keys to pop from an object: a key maps to None to pop it, or to the
+# trie of the keys to pop from its value
+PruneTrie = Dict[str, Any]
+
+
+def compile_prune_filters(
+    name_parts: Sequence[str], filters: Optional[Dict[str, List[str]]] = None
+) -> PruneTrie:
+    """Merge the paths of the filters matching an endpoint into a trie.
+
+    Args:
+        name_parts: The endpoint, eg ["content", "list"]
+        filters: The filters, by endpoint pattern, defaults to FILTERS
+    """
+    trie: PruneTrie = {}
+    for ep_filter, paths in (FILTERS if filters is None else filters).items():
+        ep_filter_parts = ep_filter.split("/")
+        if len(ep_filter_parts) != len(name_parts) or any(
+            f not in ("*", p) for f, p in zip(ep_filter_parts, name_parts)
+        ):
+            continue
+        for pth in paths:
+            if not pth:
+                continue
+            *parents, leaf = pth.split("/")
+            node = trie
+            for key in parents:
+                child = node.setdefault(key, {})
+                if child is None:
+                    # Nothing to do below a key that is popped
+                    break
+                node = child
+            else:
+                node[leaf] = None
+    return trie
+
+
+def apply_prune_trie(trie: PruneTrie, obj: Any) -> None:
+    """Pop the keys of a trie from an object, in place. The trie is applied to
+    each element of the lists met on its paths."""
+    if isinstance(obj, list):
+        for o in obj:
+            apply_prune_trie(trie, o)
+        return
+    if not isinstance(obj, dict):
+        return
+    for key, sub_trie in trie.items():
+        if sub_trie is None:
+            obj.pop(key, None)
+        else:
+            value = obj.get(key)
+            if value is not None:
+                apply_prune_trie(sub_trie, value)
+
+
 def get_conf_db_file() -> str:
     if "APPDATA" in os.environ:
         d = os.environ["APPDATA"]
@@ -94,33 +195,127 @@ def _set_sqlite_ok(ok):
     _sqlite_ok = ok
 
 
+# How long to wait for a database locked by another process, in seconds
+SQLITE_BUSY_TIMEOUT = 10.0
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS discovery_cache (
+        url TEXT NOT NULL,
+        expiry TEXT NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (url)
+    )""",
+    """CREATE TABLE IF NOT EXISTS config (
+        name TEXT NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (name)
+    )""",
+    """CREATE TABLE IF NOT EXISTS responses (
+        key TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        purge_at REAL NOT NULL,
+        stored_at REAL NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (key)
+    )""",
+    """CREATE INDEX IF NOT EXISTS responses_endpoint
+        ON responses (endpoint, stored_at)""",
+    """CREATE TABLE IF NOT EXISTS kv_cache (
+        key TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (key)
+    )""",
+    """CREATE TABLE IF NOT EXISTS tokens (
+        key TEXT NOT NULL,
+        token TEXT,
+        expires_at REAL NOT NULL,
+        lease_until REAL NOT NULL,
+        PRIMARY KEY (key)
+    )""",
+)
+
+
+class _Connections(local):
+    def __init__(self):
+        # The connections of the thread, by database file
+        self.conns: Dict[str, Any] = {}
+
+
+_connections = _Connections()
+# The database files whose schema is prepared in this process
+_prepared: Set[str] = set()
+# The connections inherited through a fork, kept open since closing them would
+# disturb the parent process that still uses them
+_forked_conns: List[Any] = []
+
+
+def _reset_connections() -> None:
+    """Drop the connections inherited from the parent process, after a fork."""
+    global _connections
+    _forked_conns.extend(_connections.conns.values())
+    _connections = _Connections()
+
+
+if hasattr(os, "register_at_fork"):  # Not on Windows
+    os.register_at_fork(after_in_child=_reset_connections)
+
+
+def _connect(db_file: str):
+    conn = sqlite3.connect(db_file, timeout=SQLITE_BUSY_TIMEOUT)
+    conn.isolation_level = None
+    conn.row_factory = sqlite3.Row
+    if db_file not in _prepared:
+        # The journal mode is persistent, it is set once per database
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        if db_file != ":memory:":
+            _prepared.add(db_file)
+    return conn
+
+
 def _get_conn(db_file=None):
+    """Get the connection of the thread to the SDK database, opening it and
+    preparing the schema the first time.
+
+    A :memory: database only lives in its connection, a new one is opened at
+    each call.
+    """
     if not _get_sqlite_ok():
         return None
-    try:
-        conn = sqlite3.connect(db_file or get_conf_db_file())
-        conn.isolation_level = None
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA journal_mode=WAL")
-        conn.execute(
-            """CREATE TABLE IF NOT EXISTS discovery_cache (
-                url TEXT NOT NULL,
-                expiry TEXT NOT NULL,
-                content TEXT NOT NULL,
-                PRIMARY KEY (url)
-            )"""
-        )
-        conn.execute(
-            """CREATE TABLE IF NOT EXISTS config (
-                name TEXT NOT NULL,
-                content TEXT NOT NULL,
-                PRIMARY KEY (name)
-            )"""
-        )
+    db_file = db_file or get_conf_db_file()
+    conn = _connections.conns.get(db_file)
+    if conn is not None:
         return conn
+    try:
+        conn = _connect(db_file)
     except sqlite3.OperationalError:
         _set_sqlite_ok(False)
         return None
+    if db_file != ":memory:":
+        _connections.conns[db_file] = conn
+    return conn
+
+
+@contextmanager
+def sqlite_transaction(db_file=None) -> Iterator[Any]:
+    """Make the writes to the SDK database done in the block in a single
+    transaction. The block is part of the outer transaction when nested.
+
+    Yields:
+        The connection of the thread, None without SQLite
+    """
+    conn = _get_conn(db_file)
+    if conn is None or conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
 
 
 class ConfigStore:
@@ -148,7 +343,7 @@ class ConfigStore:
             return
         conn.execute(
             "INSERT OR REPLACE INTO config VALUES (?, ?)",
-            (name, dumps(content, indent=4)),
+            (name, dumps(content, indent=True)),
         )
 
 
@@ -165,6 +360,13 @@ class DiscoveryCacheDict:
             return None
         return cached["value"]
 
+    def get_entry(self, key):
+        """Get the value of a key and its expiry, even if it is expired."""
+        cached = self._cache.get(key)
+        if not cached:
+            return None
+        return cached["value"], cached["expiry"]
+
     def set(self, key, value, ex=None):
         if ex:
             expiry = datetime.now() + timedelta(seconds=ex)
@@ -177,6 +379,11 @@ _DiscoveryCacheDict = DiscoveryCacheDict()
 
 
 class DiscoveryCacheSqlite:
+    @staticmethod
+    def transaction():
+        """Group the writes made in the block in a single transaction."""
+        return sqlite_transaction()
+
     def get(self, url):
         conn = _get_conn()
         if not conn:
@@ -191,6 +398,19 @@ class DiscoveryCacheSqlite:
             return None
         return loads(cached["content"])
 
+    def get_entry(self, url):
+        """Get the content of a url and its expiry, even if it is expired."""
+        conn = _get_conn()
+        if not conn:
+            return _DiscoveryCacheDict.get_entry(url)
+        cached = conn.execute(
+            "SELECT * FROM discovery_cache WHERE url=?", (url,)
+        ).fetchone()
+        if not cached:
+            return None
+        expiry_dt = datetime.strptime(cached["expiry"][:19], "%Y-%m-%dT%H:%M:%S")
+        return loads(cached["content"]), expiry_dt
+
     def set(self, url, content):
         conn = _get_conn()
         if not conn:
@@ -257,3 +477,11 @@ def walk_endpoints(resource, parents=()):
 
 def get_endpoints(discovery_doc):
     return {n: m for n, m in walk_endpoints(discovery_doc)}
+
+
+def is_read_endpoint(verb: Optional[str], name_parts: Sequence[str]) -> bool:
+    """Whether an endpoint only reads data: a GET one or one of the
+    READ_POST_ENDPOINTS."""
+    if verb == "GET":
+        return True
+    return "/".join(name_parts) in READ_POST_ENDPOINTS
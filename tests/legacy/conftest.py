@@ -1,6 +1,14 @@
 import pytest
 
+from lumapps.api.discovery_index import set_index_snapshot_dir
+
 
 @pytest.fixture
 def api_info() -> dict:
     return {"base_url": "https://go-cell-001.api.lumapps.com"}
+
+
+@pytest.fixture(autouse=True)
+def no_index_snapshots():
+    # Tests must not reuse indexes built by other runs from other documents
+    set_index_snapshot_dir(None)
@@ -0,0 +1,262 @@
+from asyncio import run
+from json import load
+from time import time
+
+from httpx import AsyncClient, HTTPStatusError, MockTransport, Response
+from pytest import fixture, raises
+
+from lumapps.api.async_base_client import AsyncBaseClient
+from lumapps.api.async_client import AsyncLumAppsClient
+from lumapps.api.base_client import _validators_key, get_discovery_stats
+from lumapps.api.discovery_index import (
+    DiscoveryIndex,
+    save_index_snapshot,
+    set_index_snapshot_dir,
+)
+from lumapps.api.errors import BadCallError, BaseClientError
+from lumapps.api.utils import _DiscoveryCacheDict, _set_sqlite_ok, get_discovery_cache
+
+
+@fixture(autouse=True)
+def reset_env():
+    _DiscoveryCacheDict._cache.clear()
+    _set_sqlite_ok(True)
+
+
+@fixture
+def discovery_doc() -> dict:
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        return load(fh)
+
+
+def make_client(api_info, discovery_doc, handler, **kwargs) -> AsyncBaseClient:
+    c = AsyncBaseClient(api_info, **kwargs)
+    get_discovery_cache().set(c._discovery_url, discovery_doc)
+    c._client = AsyncClient(base_url=c.base_url, transport=MockTransport(handler))
+    return c
+
+
+def test_discovery_not_loaded(api_info):
+    c = AsyncBaseClient(api_info, token="foobar")
+    c._discovery_url = "https://nowhere.invalid/discovery.json"
+    with raises(BaseClientError):
+        c.discovery_doc
+
+
+def test_close(api_info):
+    c = AsyncBaseClient(api_info, token="foobar")
+    client = c.client
+    c.close()
+    assert client.is_closed
+    c.close()
+
+    async def main():
+        c = AsyncBaseClient(api_info, token="foobar")
+        client = c.client
+        c.close()
+        await c._closing
+        return client
+
+    assert run(main()).is_closed
+
+
+def test_load_discovery_doc_from_network(api_info, discovery_doc):
+    def handler(request):
+        return Response(200, json=discovery_doc)
+
+    c = make_client(api_info, discovery_doc, handler, token="foobar")
+    _DiscoveryCacheDict._cache.clear()
+    c._discovery_url = "https://example.com/discovery.json"
+    _set_sqlite_ok(False)
+
+    doc = run(c.load_discovery_doc())
+    assert doc["rootUrl"].startswith("https://go-cell-001.api.lumapps.com")
+    assert ("user", "get") in c.endpoints
+
+
+def test_get_call(api_info, discovery_doc):
+    def handler(request):
+        assert request.headers["authorization"] == "Bearer foobar"
+        assert request.url.params["email"] == "foo@bar.com"
+        return Response(200, json={"id": "123"})
+
+    c = make_client(api_info, discovery_doc, handler, token="foobar")
+    assert run(c.get_call("user/get", email="foo@bar.com")) == {"id": "123"}
+
+
+def test_refresh_stale_snapshot(tmp_path, api_info, discovery_doc):
+    set_index_snapshot_dir(str(tmp_path))
+    discovery_requests = []
+
+    def handler(request):
+        if "api-discovery" in request.url.path:
+            discovery_requests.append(request)
+            return Response(304)
+        return Response(200, json={"id": "123"})
+
+    c = make_client(api_info, discovery_doc, handler, token="foobar")
+    get_discovery_cache().set(_validators_key(c._discovery_url), {"etag": "v1"})
+    save_index_snapshot(
+        c._index_snapshot_key(), DiscoveryIndex.from_discovery(discovery_doc)
+    )
+    before = get_discovery_stats()
+
+    async def main():
+        await c.get_call("user/get", email="foo@bar.com")
+        assert c._shared.discovery_expires_at > time()
+        # The snapshot went stale
+        c._shared.discovery_expires_at = time() - 1
+        await c.get_call("user/get", email="foo@bar.com")
+        await c._shared.refresh_task
+
+    run(main())
+    after = get_discovery_stats()
+    assert [r.headers["If-None-Match"] for r in discovery_requests] == ["v1"]
+    assert after["not_modified"] == before["not_modified"] + 1
+    assert after["refresh_errors"] == before["refresh_errors"]
+    assert c._shared.discovery_expires_at > time()
+
+
+def test_get_call_bad_endpoint(api_info, discovery_doc):
+    c = make_client(api_info, discovery_doc, None, token="foobar")
+    with raises(BadCallError):
+        run(c.get_call("user/bla"))
+
+
+def test_get_call_pages(api_info, discovery_doc):
+    with open("tests/legacy/test_data/instance_list_more_1.json") as fh:
+        ret1 = load(fh)
+    with open("tests/legacy/test_data/instance_list_more_2.json") as fh:
+        ret2 = load(fh)
+
+    def handler(request):
+        return Response(200, json=ret2 if "cursor" in request.url.params else ret1)
+
+    c = make_client(api_info, discovery_doc, handler, token="foobar")
+    lst = run(c.get_call("instance/list"))
+    assert len(lst) == 4
+    assert c.cursor is None
+
+
+def test_iter_call(api_info, discovery_doc):
+    with open("tests/legacy/test_data/instance_list_more_1.json") as fh:
+        ret1 = load(fh)
+    with open("tests/legacy/test_data/instance_list_more_2.json") as fh:
+        ret2 = load(fh)
+
+    def handler(request):
+        return Response(200, json=ret2 if "cursor" in request.url.params else ret1)
+
+    c = make_client(api_info, discovery_doc, handler, token="foobar")
+
+    async def collect():
+        cursors = []
+        items = []
+        async for item in c.iter_call("instance/list"):
+            items.append(item)
+            cursors.append(c.cursor)
+        return items, cursors
+
+    items, cursors = run(collect())
+    assert len(items) == 4
+    assert cursors == ["foo_cursor", "foo_cursor", None, None]
+
+
+def test_token_refresh_on_401(api_info, discovery_doc):
+    calls = []
+
+    async def token_getter():
+        calls.append(1)
+        return f"token{len(calls)}", 3600
+
+    def handler(request):
+        if request.headers["authorization"] == "Bearer token1":
+            return Response(401)
+        return Response(200, json={"id": "123"})
+
+    c = make_client(
+        api_info, discovery_doc, handler, token_getter=token_getter, auth_info={"a": 1}
+    )
+    assert run(c.get_call("user/get", email="foo@bar.com")) == {"id": "123"}
+    assert c.token == "token2"
+    assert len(calls) == 2
+
+
+def test_http_error(api_info, discovery_doc):
+    def handler(request):
+        return Response(404)
+
+    c = make_client(api_info, discovery_doc, handler, token="foobar")
+    with raises(HTTPStatusError):
+        run(c.get_call("user/get", email="foo@bar.com"))
+
+
+def test_upload():
+    def handler(request):
+        assert request.method == "POST"
+        assert request.url.path == "/upload/drive/v3/files"
+        assert b"file-content" in request.read()
+        return Response(200, json={"id": "media"})
+
+    with open("tests/legacy/test_data/drive_v3_discovery.json") as fh:
+        doc = load(fh)
+    api_info = {"base_url": "https://www.googleapis.com", "name": "drive"}
+    c = make_client(api_info, doc, handler, token="foobar")
+    with raises(BadCallError):
+        run(c.upload(b"file-content", {}, "files/list"))
+    ret = run(c.upload(b"file-content", {"name": "foo"}, "files/create"))
+    assert ret == {"id": "media"}
+
+
+def test_get_new_client_as(api_info, discovery_doc):
+    def handler(request):
+        if request.url.path.endswith("/application-token"):
+            return Response(200, json={"access_token": "user-token", "expires_in": 60})
+        assert request.headers["authorization"] == "Bearer user-token"
+        return Response(200, json={"id": "123"})
+
+    parent = make_client(
+        api_info,
+        discovery_doc,
+        handler,
+        auth_info={"client_id": "id", "client_secret": "secret"},
+    )
+    c = parent.get_new_client_as("foo@bar.com", "customer")
+    c._client = parent._client
+    assert run(c.get_call("user/get", email="foo@bar.com")) == {"id": "123"}
+
+
+def test_get_user_api(api_info):
+    async def main():
+        parent = AsyncLumAppsClient(
+            "customer", "instance", api_info, auth_info={"client_id": "id"}
+        )
+        pool = parent.client
+        user = parent.get_user_api("foo@bar.com")
+        assert user.client is pool
+        assert user._cache_scope == "customer|foo@bar.com"
+        # The pool is closed once the derived client released it too
+        await parent.aclose()
+        assert not pool.is_closed
+        await user.aclose()
+        assert pool.is_closed
+
+    run(main())
+
+
+def test_map_calls(api_info, discovery_doc):
+    def handler(request):
+        email = request.url.params["email"]
+        if email == "missing@bar.com":
+            return Response(404)
+        return Response(200, json={"email": email})
+
+    c = make_client(api_info, discovery_doc, handler, token="foobar")
+    emails = [f"user{i}@bar.com" for i in range(10)] + ["missing@bar.com"]
+    results = run(
+        c.map_calls("user/get", [{"email": e} for e in emails], max_concurrency=3)
+    )
+    assert [r["email"] for r in results[:-1]] == emails[:-1]
+    assert isinstance(results[-1], HTTPStatusError)
+    with raises(ValueError):
+        run(c.gather(max_concurrency=0))
@@ -1,20 +1,29 @@
+from datetime import datetime, timedelta
 from typing import Dict, Optional
 from json import load, loads
 from typing import Sequence
 from unittest.mock import PropertyMock
 from lumapps.api import __version__
-from httpx import HTTPStatusError
-from pytest import fixture, raises, mark
-
-from lumapps.api.base_client import BaseClient, fetch_access_token
+from httpx import Client, HTTPStatusError, MockTransport, Response
+from pytest import fixture, importorskip, raises, mark
+
+from lumapps.api import base_client, codec
+from lumapps.api.base_client import (
+    BaseClient,
+    fetch_access_token,
+    get_discovery_stats,
+)
 from lumapps.api.client import LumAppsClient
+from lumapps.api.codec import OrjsonCodec, StdlibCodec
 from lumapps.api.errors import BadCallError, BaseClientError
 from lumapps.api.utils import (
     FILTERS,
+    DiscoveryCacheDict,
     _DiscoveryCacheDict,
     _get_conn,
     _set_sqlite_ok,
     get_discovery_cache,
+    set_discovery_cache,
 )
 
 
@@ -257,6 +266,26 @@ def test_iter_call_4(mocker, cli: BaseClient):
     assert cli.cursor is None
 
 
+def test_iter_call_prune(mocker, cli: BaseClient):
+    with open("tests/legacy/test_data/instance_list_more_1.json") as fh:
+        ret1 = load(fh)
+    with open("tests/legacy/test_data/instance_list_more_2.json") as fh:
+        ret2 = load(fh)
+
+    def _call(name_parts: Sequence[str], params: dict, json=None):
+        return ret2 if "cursor" in params else ret1
+
+    mocker.patch("lumapps.api.client.BaseClient._call", side_effect=_call)
+    mocker.patch.dict(FILTERS, {"instance/list": ["status"]})
+    compile_filters = mocker.spy(base_client, "compile_prune_filters")
+    cli.prune = True
+    lst = list(cli.iter_call("instance/list"))
+    assert len(lst) == 4
+    assert all("status" not in inst for inst in lst)
+    # Compiled once for all the pages
+    assert compile_filters.call_count == 1
+
+
 def test_iter_call_5(mocker, cli: BaseClient):
     with open("tests/legacy/test_data/instance_list_more_1.json") as fh:
         ret1 = load(fh)
@@ -353,8 +382,11 @@ def test_discovery_doc(mocker, cli: BaseClient):
     mocker.patch("lumapps.api.utils._get_conn", return_value=_get_conn(":memory:"))
 
     class DummyResp:
+        headers: dict = {}
+
         def __init__(self, text):
             self.text = text
+            self.content = text.encode()
 
         def json(self):
             return loads(self.text)
@@ -415,3 +447,263 @@ def test_create_client(cell: str, api_info: Dict[str, str], expected_exception:
         "authorization": "Bearer None"
     }
     assert client.base_url == api_info["base_url"].rstrip("/")
+
+
+def test_iter_call_prefetch(mocker, cli: BaseClient):
+    with open("tests/legacy/test_data/instance_list_more_1.json") as fh:
+        ret1 = load(fh)
+    with open("tests/legacy/test_data/instance_list_more_2.json") as fh:
+        ret2 = load(fh)
+
+    def _call(name_parts: Sequence[str], params: dict, json=None):
+        if "cursor" in params:
+            return ret2
+        else:
+            return ret1
+
+    mocker.patch("lumapps.api.client.BaseClient._call", side_effect=_call)
+    cursors = []
+    lst = []
+    for i in cli.iter_call("instance/list", prefetch=2):
+        lst.append(i)
+        cursors.append(cli.cursor)
+    assert len(lst) == 4
+    assert cursors == ["foo_cursor", "foo_cursor", None, None]
+    assert cli.cursor is None
+
+
+def test_iter_call_prefetch_error(mocker, cli: BaseClient):
+    with open("tests/legacy/test_data/instance_list_more_1.json") as fh:
+        ret1 = load(fh)
+
+    def _call(name_parts: Sequence[str], params: dict, json=None):
+        if "cursor" in params:
+            raise ValueError("page 2")
+        return ret1
+
+    mocker.patch("lumapps.api.client.BaseClient._call", side_effect=_call)
+    lst = []
+    with raises(ValueError):
+        for i in cli.iter_call("instance/list", prefetch=1):
+            lst.append(i)
+    assert len(lst) == 2
+    assert cli.cursor == "foo_cursor"
+
+
+def test_map_calls(api_info):
+    tokens = []
+
+    def token_getter():
+        tokens.append(f"token{len(tokens) + 1}")
+        return tokens[-1], 3600
+
+    def handler(request):
+        if request.headers["authorization"] == "Bearer token1":
+            return Response(401)
+        email = request.url.params["email"]
+        if email == "missing@bar.com":
+            return Response(404)
+        return Response(200, json={"email": email})
+
+    c = BaseClient(api_info, token_getter=token_getter, auth_info={"a": "b"})
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        get_discovery_cache().set(c._discovery_url, load(fh))
+    c._client = Client(base_url=c.base_url, transport=MockTransport(handler))
+    emails = [f"user{i}@bar.com" for i in range(20)] + ["missing@bar.com"]
+    results = c.map_calls(
+        "user/get", [{"email": e} for e in emails], max_concurrency=5
+    )
+    assert [r["email"] for r in results[:-1]] == emails[:-1]
+    assert isinstance(results[-1], HTTPStatusError)
+    assert c.token != "token1"
+
+
+def test_get_new_client_as_shares_pool(api_info):
+    parent = BaseClient(api_info, auth_info={"client_id": "a", "client_secret": "b"})
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        get_discovery_cache().set(parent._discovery_url, load(fh))
+    child = parent.get_new_client_as("foo@bar.com", "123")
+    other = parent.get_new_client_as("bar@bar.com", "123")
+    assert child.client is parent.client
+    assert other.endpoints is parent.endpoints
+    assert child.discovery_doc is parent.discovery_doc
+    pool = parent.client
+    parent.close()
+    child.close()
+    child.close()
+    assert not pool.is_closed
+    assert other.client is pool
+    other.close()
+    assert pool.is_closed
+    # A closed client reopens a pool when used again
+    assert other.client is not pool
+
+
+@fixture
+def discovery_cache():
+    cache = DiscoveryCacheDict()
+    previous = get_discovery_cache()
+    set_discovery_cache(cache)
+    yield cache
+    set_discovery_cache(previous)
+
+
+def make_stale_client(api_info, cache, handler, age=timedelta(hours=1)):
+    c = BaseClient(api_info, token="foobar")
+    c._client = Client(transport=MockTransport(handler))
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        doc = load(fh)
+    cache._cache[c._discovery_url] = {"value": doc, "expiry": datetime.now() - age}
+    cache.set(
+        f"{c._discovery_url}#validators",
+        {"etag": '"v1"', "last_modified": None, "digest": "d1"},
+    )
+    return c
+
+
+def test_discovery_doc_stale_not_modified(api_info, discovery_cache):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("If-None-Match"))
+        return Response(304)
+
+    c = make_stale_client(api_info, discovery_cache, handler)
+    before = get_discovery_stats()
+    index = c.discovery_index
+    c._shared.refresh_thread.join()
+    after = get_discovery_stats()
+    assert seen == ['"v1"']
+    assert after["stale_served"] == before["stale_served"] + 1
+    assert after["not_modified"] == before["not_modified"] + 1
+    assert after["blocking_fetches"] == before["blocking_fetches"]
+    assert c.discovery_index is index
+    assert discovery_cache.get(c._discovery_url) is not None
+
+
+def test_discovery_doc_stale_changed(api_info, discovery_cache):
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        new_doc = load(fh)
+    new_doc["resources"]["user"]["methods"]["get"]["path"] = "user/get2"
+
+    def handler(request):
+        return Response(200, json=new_doc, headers={"ETag": '"v2"'})
+
+    c = make_stale_client(api_info, discovery_cache, handler)
+    index = c.discovery_index
+    c._shared.refresh_thread.join()
+    assert c.discovery_index is not index
+    assert c.discovery_index.get(("user", "get")).path == "user/get2"
+    assert c.discovery_doc["resources"]["user"]["methods"]["get"]["path"] == (
+        "user/get2"
+    )
+    validators = discovery_cache.get(f"{c._discovery_url}#validators")
+    assert validators["etag"] == '"v2"'
+
+
+def test_discovery_doc_too_old_blocks(api_info, discovery_cache):
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        doc = load(fh)
+
+    def handler(request):
+        assert "If-None-Match" not in request.headers
+        return Response(200, json=doc)
+
+    c = make_stale_client(api_info, discovery_cache, handler, age=timedelta(days=30))
+    before = get_discovery_stats()
+    assert c.discovery_doc
+    after = get_discovery_stats()
+    assert after["blocking_fetches"] == before["blocking_fetches"] + 1
+    assert (
+        after["expired_blocking_fetches"] == before["expired_blocking_fetches"] + 1
+    )
+    assert c._shared.refresh_thread is None
+
+
+def paged_call(calls, total=10, default_size=4):
+    def _call(name_parts: Sequence[str], params: dict, json=None):
+        args = json if json is not None else params
+        calls.append(dict(args))
+        start = int(args.get("cursor", 0))
+        end = min(total, start + int(args.get("maxResults", default_size)))
+        page = {"items": [{"id": i} for i in range(start, end)], "more": end < total}
+        if end < total:
+            page["cursor"] = str(end)
+        return page
+
+    return _call
+
+
+def test_get_call_max_items(mocker, cli: BaseClient):
+    calls = []
+    mocker.patch("lumapps.api.client.BaseClient._call", side_effect=paged_call(calls))
+    assert cli.get_call("instance/list", max_items=6) == [{"id": i} for i in range(6)]
+    # The page size is learnt from the first page, the last one is shrunk
+    assert [c.get("maxResults") for c in calls] == [None, 2]
+    assert cli.cursor == "6"
+    calls.clear()
+    items = cli.get_call("instance/list", body={}, max_items=5, page_size=3)
+    assert [i["id"] for i in items] == [0, 1, 2, 3, 4]
+    assert [c["maxResults"] for c in calls] == [3, 2]
+    calls.clear()
+    assert len(cli.get_call("instance/list", max_items=50, page_size=3)) == 10
+    assert len(calls) == 4 and cli.cursor is None
+    with raises(ValueError):
+        cli.get_call("instance/list", max_items=0)
+
+
+def test_get_call_max_items_truncates(mocker, cli: BaseClient):
+    calls = []
+    call = paged_call(calls, default_size=8)
+
+    def _call(name_parts: Sequence[str], params: dict, json=None):
+        # The server ignores maxResults
+        return call(name_parts, {**params, "maxResults": 8})
+
+    mocker.patch("lumapps.api.client.BaseClient._call", side_effect=_call)
+    assert len(cli.get_call("instance/list", max_items=3)) == 3
+    # Resuming from the cursor would skip the items dropped
+    assert cli.cursor is None
+
+
+def test_get_call_on_page(mocker, cli: BaseClient):
+    calls = []
+    mocker.patch("lumapps.api.client.BaseClient._call", side_effect=paged_call(calls))
+    pages = []
+    assert cli.get_call("instance/list", on_page=pages.append) == 10
+    assert [len(p) for p in pages] == [4, 4, 2]
+    pages.clear()
+    assert cli.get_call("instance/list", on_page=pages.append, max_items=5) == 5
+    assert [len(p) for p in pages] == [4, 1]
+
+
+def test_iter_call_max_items(mocker, cli: BaseClient):
+    calls = []
+    mocker.patch("lumapps.api.client.BaseClient._call", side_effect=paged_call(calls))
+    items = list(cli.iter_call("instance/list", max_items=7, page_size=5))
+    assert [i["id"] for i in items] == list(range(7))
+    assert [c["maxResults"] for c in calls] == [5, 2]
+    assert cli.cursor == "7"
+    calls.clear()
+    assert len(list(cli.iter_call("instance/list", max_items=20))) == 10
+    assert len(calls) == 3 and cli.cursor is None
+
+
+def test_body_same_for_both_codecs(api_info, mocker):
+    importorskip("orjson")
+    bodies = []
+
+    def handler(request):
+        assert request.headers["Content-Type"] == "application/json"
+        bodies.append(request.content)
+        return Response(200, json={})
+
+    c = BaseClient(api_info, token="foo")
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        get_discovery_cache().set(c._discovery_url, load(fh))
+    c._client = Client(base_url=c.base_url, transport=MockTransport(handler))
+    body = {"title": {"fr": "é\n"}, "n": 2**40, "tags": [1.5, None, True]}
+    for json_codec in (StdlibCodec(), OrjsonCodec()):
+        mocker.patch.object(codec, "_codec", json_codec)
+        c.get_call("content/save", body=body)
+    assert bodies[0] == bodies[1] == codec.dumps(body).encode()
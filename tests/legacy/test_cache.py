@@ -0,0 +1,161 @@
+import sqlite3
+
+from pytest import fixture, mark, raises
+
+from lumapps.api.cache import (
+    BoundedCache,
+    CacheBackend,
+    LocalRedis,
+    RedisCache,
+    SqliteCache,
+)
+from lumapps.api.client import LumAppsClient
+from lumapps.api.utils import _set_sqlite_ok
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_set():
+    cache = BoundedCache()
+    assert cache.get("a") is None
+    with raises(KeyError):
+        cache.get("a", raises=True)
+    cache.set("a", None)
+    assert cache.get("a", raises=True) is None
+    cache.set("b", {"id": "b"}, 60)
+    assert cache.get("b") == {"id": "b"}
+    assert cache.stats["hits"] == 2
+    assert cache.stats["misses"] == 2
+
+
+def test_expiry():
+    clock = FakeClock()
+    cache = BoundedCache(default_ttl=100, sweep_interval=1000, clock=clock)
+    cache.set("a", 1, 10)
+    cache.set("b", 2)
+    clock.now = 50
+    with raises(KeyError):
+        cache.get("a", raises=True)
+    assert cache.get("b") == 2
+    assert cache.stats["expirations"] == 1
+    assert len(cache) == 1
+
+
+def test_periodic_sweep():
+    clock = FakeClock()
+    cache = BoundedCache(sweep_interval=60, clock=clock)
+    cache.set_many({f"k{i}": i for i in range(10)}, ex=10)
+    clock.now = 61
+    cache.set("other", 1)
+    assert len(cache) == 1
+    assert cache.stats["expirations"] == 10
+
+
+def test_lru_eviction():
+    cache = BoundedCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+    assert cache.stats["evictions"] == 1
+
+
+def test_max_bytes():
+    cache = BoundedCache(max_entries=None, max_bytes=10)
+    cache.set("a", "12345")
+    cache.set("b", "1234")
+    assert cache.get("a") is None
+    assert cache.stats["bytes"] == 6
+    assert cache.get("b") == "1234"
+    cache.set("b", "1")
+    assert cache.stats["bytes"] == 3
+
+
+def test_default_client_cache(api_info):
+    cli = LumAppsClient("a", "b", api_info, token="foo")
+    assert isinstance(cli.cache, BoundedCache)
+    # An empty cache is still used
+    cache = BoundedCache()
+    assert LumAppsClient("a", "b", api_info, token="foo", cache=cache).cache is cache
+
+
+@fixture
+def sqlite_cache(tmp_path):
+    _set_sqlite_ok(True)
+    return SqliteCache(str(tmp_path / "sdk.db"))
+
+
+@fixture(params=["bounded", "sqlite", "redis"])
+def backend(request, tmp_path) -> CacheBackend:
+    if request.param == "bounded":
+        return BoundedCache()
+    if request.param == "sqlite":
+        _set_sqlite_ok(True)
+        return SqliteCache(str(tmp_path / "sdk.db"))
+    return RedisCache(LocalRedis())
+
+
+def test_backend_contract(backend: CacheBackend):
+    assert backend.get("a") is None
+    with raises(KeyError):
+        backend.get("a", raises=True)
+    backend.set("a", None, 60)
+    assert backend.get("a", raises=True) is None
+    backend.set_many({"b": {"id": "b"}, "c": [1, 2]})
+    assert backend.get_many(["a", "b", "c", "d"]) == {
+        "a": None,
+        "b": {"id": "b"},
+        "c": [1, 2],
+    }
+    backend.delete("b")
+    assert backend.get("b") is None
+
+
+def test_sqlite_cache_shared_and_namespaced(sqlite_cache, tmp_path):
+    other = SqliteCache(sqlite_cache.db_file)
+    sqlite_cache.set("a|TOKEN|foo@bar.com", ("token", 123))
+    assert other.get("a|TOKEN|foo@bar.com") == ["token", 123]
+    assert SqliteCache(sqlite_cache.db_file, namespace="x").get("a|TOKEN|x") is None
+
+
+def test_sqlite_cache_expiry(sqlite_cache, mocker):
+    sqlite_cache.set("a", 1, 10)
+    mocker.patch("lumapps.api.cache.time", return_value=10**12)
+    assert sqlite_cache.get("a") is None
+    # Writing purges the expired entries
+    sqlite_cache.set("b", 1)
+    conn = sqlite3.connect(sqlite_cache.db_file)
+    assert conn.execute("SELECT key FROM kv_cache").fetchall() == [("lumapps:b",)]
+
+
+def test_redis_cache_expiry():
+    clock = FakeClock()
+    redis = LocalRedis(clock)
+    cache = RedisCache(redis, namespace="ns")
+    cache.set("a", 1, 0.5)
+    assert redis.get("ns:a") == b"1"
+    clock.now = 1
+    assert cache.get("a") is None
+
+
+@mark.parametrize("shared", ["sqlite", "redis"])
+def test_client_shares_tokens(mocker, api_info, tmp_path, shared):
+    if shared == "sqlite":
+        _set_sqlite_ok(True)
+        cache = SqliteCache(str(tmp_path / "sdk.db"))
+        other_process_cache = SqliteCache(cache.db_file)
+    else:
+        cache = RedisCache(LocalRedis())
+        other_process_cache = RedisCache(cache.redis)
+    mocker.patch("lumapps.api.client.fetch_access_token", return_value=("tok", 3600))
+    cli = LumAppsClient("a", "b", api_info, token="foo", cache=cache)
+    assert cli.get_token_getter("foo@bar.com").get_token() == "tok"
+    token, expires_at = other_process_cache.get("a|TOKEN|foo@bar.com")
+    assert token == "tok"
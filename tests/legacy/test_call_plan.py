@@ -0,0 +1,66 @@
+from json import load
+
+from pytest import fixture, raises
+
+from lumapps.api import call_plan
+from lumapps.api.call_plan import CallPlan, clear_call_plans, get_call_plan
+from lumapps.api.discovery_index import DiscoveryIndex, EndpointSpec
+from lumapps.api.errors import BadCallError
+
+
+@fixture
+def index() -> DiscoveryIndex:
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        return DiscoveryIndex.from_discovery(load(fh))
+
+
+def test_build_without_path_params():
+    plan = CallPlan(EndpointSpec("GET", "user/get", (), ("email",), None), "/api")
+    params = {"email": "a", "fields": "id"}
+    assert plan.build(params) == ("GET", "/api/user/get", params)
+    with raises(BadCallError, match="email"):
+        plan.build({})
+
+
+def test_build_with_path_params():
+    spec = EndpointSpec(
+        "GET", "files/{fileId}/comments/{commentId}", ("fileId", "commentId"), (), None
+    )
+    plan = CallPlan(spec, "/drive/v3")
+    verb, path, params = plan.build({"fileId": 1, "commentId": "b", "q": "x"})
+    assert path == "/drive/v3/files/1/comments/b"
+    assert params == {"q": "x"}
+    # The plan is not altered by a build
+    assert (
+        plan.build({"fileId": 2, "commentId": "c"})[1] == "/drive/v3/files/2/comments/c"
+    )
+
+
+def test_registry(index):
+    clear_call_plans()
+    plan = get_call_plan(index, "/api", ("user", "get"))
+    assert get_call_plan(index, "/api", ("user", "get")) is plan
+    assert get_call_plan(index, "/other", ("user", "get")) is not plan
+    with raises(BadCallError):
+        get_call_plan(index, "/api", ("user", "nope"))
+
+
+def test_registry_bounded(index, mocker):
+    clear_call_plans()
+    mocker.patch.object(call_plan, "MAX_CALL_PLANS", 2)
+    plan = get_call_plan(index, "/api", ("user", "get"))
+    other = get_call_plan(index, "/api", ("user", "list"))
+    assert get_call_plan(index, "/api", ("user", "get")) is plan
+    get_call_plan(index, "/api", ("content", "get"))
+    # The least recently used plan is dropped
+    assert len(call_plan._plans) == 2
+    assert get_call_plan(index, "/api", ("user", "get")) is plan
+    assert get_call_plan(index, "/api", ("user", "list")) is not other
+    clear_call_plans()
+
+
+def test_upload_endpoint():
+    with open("tests/legacy/test_data/drive_v3_discovery.json") as fh:
+        index = DiscoveryIndex.from_discovery(load(fh))
+    with raises(BadCallError, match="upload"):
+        get_call_plan(index, "/drive/v3", ("files", "create"))
@@ -1,7 +1,10 @@
+from logging import DEBUG, INFO
+
 from pytest import fixture
 
 from lumapps.api import LumAppsClient
 from lumapps.api.client import chunks
+from lumapps.api.codec import dumps as codec_dumps
 
 
 def test_chunks():
@@ -36,3 +39,52 @@ def test_get_available_slug(mocker, cli: LumAppsClient):
     slug = "first-project-items-are-due-1-goals-and-deliverables-2-project-members-3-due-dates-if-you-need"
     new_slug = cli.get_available_slug(slug)
     assert new_slug == slug + "-10"
+
+
+def test_get_token_getter(mocker, cli: LumAppsClient):
+    fetch = mocker.patch(
+        "lumapps.api.client.fetch_access_token",
+        side_effect=[("tok", 3600), ("tok2", 3600)],
+    )
+    getter = cli.get_token_getter("foo@bar.com")
+    assert getter is cli.get_token_getter("foo@bar.com")
+    assert cli.get_user_api("foo@bar.com").token_manager is getter
+    assert getter.get_token() == "tok"
+    token, expires_at = cli.cache.get("a|TOKEN|foo@bar.com")
+    assert token == "tok"
+    assert expires_at > 3600
+    assert getter.get_token() == "tok"
+    assert fetch.call_count == 1
+    # Rejected by the server, the cached token is not given again
+    getter.invalidate()
+    assert getter.get_token() == "tok2"
+    assert fetch.call_count == 2
+    assert cli.cache.get("a|TOKEN|foo@bar.com")[0] == "tok2"
+
+
+def test_close_drops_memoized(mocker, cli: LumAppsClient):
+    get_call = mocker.patch(
+        "lumapps.api.client.LumAppsClient.get_call", return_value={"id": "g"}
+    )
+    assert cli.get_group("g") == {"id": "g"}
+    cli.get_group("g")
+    assert get_call.call_count == 1
+    cli.close()
+    cli.get_group("g")
+    assert get_call.call_count == 2
+
+
+def test_save_logs_summary(mocker, caplog, api_info):
+    dumps = mocker.patch("lumapps.api.client.dumps", wraps=codec_dumps)
+    cli = LumAppsClient("a", "b", api_info, token="FAKE", dry_run=True)
+    content = {"id": "c1", "type": "news", "template": {"components": []}}
+    caplog.set_level(INFO)
+    cli.save_content(content)
+    # Not formatted when the log level discards the message
+    assert not caplog.records and not dumps.called
+    caplog.set_level(DEBUG)
+    cli.save_content(content)
+    assert caplog.messages[-1].startswith("Saving content: {id=c1, type=news, size=")
+    cli.log_payloads = True
+    cli.save_content(content)
+    assert '"components": []' in caplog.messages[-1]
@@ -0,0 +1,100 @@
+from pytest import fixture, raises
+
+from lumapps.api.client import LumAppsClient
+from lumapps.api.client_pool import ClientPool
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@fixture
+def client(api_info) -> LumAppsClient:
+    return LumAppsClient(
+        "customer",
+        "instance",
+        api_info=api_info,
+        auth_info={"client_id": "a", "client_secret": "b"},
+    )
+
+
+def test_get_reuses_clients(client):
+    pool = ClientPool(client)
+    c1 = pool.get("a@foo.com")
+    assert pool.get("a@foo.com") is c1
+    assert pool.get("b@foo.com") is not c1
+    assert (c1.customer_id, c1.instance_id) == ("customer", "instance")
+    assert pool.stats == {"size": 2, "hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_other_site(client):
+    pool = ClientPool(client)
+    c1 = pool.get("a@foo.com", instance_id="other")
+    assert c1.instance_id == "other"
+    assert c1 is not pool.get("a@foo.com")
+    assert c1 is pool.get("a@foo.com", "customer", "other")
+    assert c1.client is client.client
+
+
+def test_lru_eviction(client):
+    pool = ClientPool(client, max_size=2)
+    a = pool.get("a@foo.com")
+    pool.get("b@foo.com")
+    pool.get("a@foo.com")
+    pool.get("c@foo.com")
+    assert len(pool) == 2
+    assert pool.get("a@foo.com") is a
+    assert pool.stats["evictions"] == 1
+    assert pool.get("b@foo.com") is not None
+    assert pool.stats["misses"] == 4
+
+
+def test_idle_eviction(client):
+    clock = Clock()
+    pool = ClientPool(client, max_idle=10, clock=clock)
+    a = pool.get("a@foo.com")
+    clock.now = 5
+    pool.get("b@foo.com")
+    clock.now = 12
+    assert pool.get("b@foo.com")
+    assert len(pool) == 1
+    assert pool.get("a@foo.com") is not a
+
+
+def test_evict_and_close(client):
+    pool = ClientPool(client)
+    a = pool.get("a@foo.com")
+    http_client = a.client
+    assert pool.evict("a@foo.com")
+    assert not pool.evict("a@foo.com")
+    pool.get("b@foo.com")
+    with pool:
+        pass
+    assert len(pool) == 0
+    # The pool clients share the connections of the client, still open
+    assert not http_client.is_closed
+    client.close()
+    assert http_client.is_closed
+    with raises(ValueError):
+        ClientPool(client, max_size=0)
+
+
+def test_eviction_drops_parents_and_token_managers(client):
+    pool = ClientPool(client, max_size=2)
+    a = pool.get("a@foo.com", instance_id="other")
+    b = pool.get("b@foo.com", instance_id="other")
+    parent = pool._parents[("customer", "other")]
+    assert a.token_manager is parent.get_token_getter("a@foo.com")
+    pool.evict("a@foo.com", instance_id="other")
+    assert a.token_manager is not parent.get_token_getter("a@foo.com")
+    assert pool._parents
+    pool.get("c@foo.com")
+    pool.get("d@foo.com")
+    assert not pool._parents
+    assert not pool._parent_refs
+    assert b.client is client.client
+    assert not client.client.is_closed
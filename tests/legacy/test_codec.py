@@ -0,0 +1,48 @@
+from json import JSONDecodeError, loads
+
+from pytest import fixture, importorskip, raises
+
+from lumapps.api import codec
+from lumapps.api.codec import OrjsonCodec, StdlibCodec, get_codec, set_codec
+
+
+@fixture(params=["json", "orjson"])
+def json_codec(request):
+    if request.param == "orjson":
+        importorskip("orjson")
+        return OrjsonCodec()
+    return StdlibCodec()
+
+
+def test_codec_roundtrip(json_codec):
+    obj = {"b": [1, 2.5, None, True], "a": {"é": 'x"y'}, "c": (1, 2)}
+    assert json_codec.loads(json_codec.dumps(obj)) == {**obj, "c": [1, 2]}
+    assert json_codec.loads(json_codec.dumps(obj).encode()) == {**obj, "c": [1, 2]}
+    assert json_codec.dumps({"b": 1, "a": 2}, sort_keys=True).index('"a"') < 5
+    assert "\n" in json_codec.dumps(obj, indent=True)
+    assert loads(json_codec.dumps({"d": {1}}, default=list)) == {"d": [1]}
+    with raises(JSONDecodeError):
+        json_codec.loads(b"{")
+
+
+def test_codecs_same_output():
+    importorskip("orjson")
+    obj = {"b": [1, 2.5, None, True, {}, []], "a": {"é": 'x"y\n'}, "c": 2**40}
+    for kwargs in ({}, {"indent": True}, {"sort_keys": True, "indent": True}):
+        assert StdlibCodec().dumps(obj, **kwargs) == OrjsonCodec().dumps(obj, **kwargs)
+
+
+def test_orjson_codec_fallback():
+    importorskip("orjson")
+    json_codec = OrjsonCodec()
+    # Beyond 64 bits, not supported by orjson
+    assert json_codec.loads(json_codec.dumps({"n": 2**70})) == {"n": 2**70}
+    assert json_codec.loads(json_codec.dumps({1: "a"})) == {"1": "a"}
+
+
+def test_set_codec(mocker):
+    mocker.patch.object(codec, "_codec", get_codec())
+    set_codec(StdlibCodec())
+    assert get_codec().name == "json"
+    assert codec.dumps({"a": 1}, indent=True) == '{\n  "a": 1\n}'
+    assert codec.loads(b'{"a": 1}') == {"a": 1}
@@ -0,0 +1,225 @@
+from threading import Lock, active_count
+from time import sleep
+
+from pytest import approx, raises
+
+from httpx import Client, MockTransport, Response
+
+from lumapps.api.base_client import BaseClient
+from lumapps.api.concurrency import (
+    AdaptiveConcurrencyLimiter,
+    prefetch_iter,
+    run_concurrently,
+)
+
+
+def test_prefetch_iter():
+    assert list(prefetch_iter(range(10), 2)) == list(range(10))
+    assert list(prefetch_iter([], 2)) == []
+
+
+def test_prefetch_iter_invalid_size():
+    with raises(ValueError):
+        list(prefetch_iter(range(10), 0))
+
+
+def test_prefetch_iter_bounded():
+    produced = []
+
+    def gen():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    it = prefetch_iter(gen(), 3)
+    assert next(it) == 0
+    sleep(0.2)
+    # 1 consumed and 3 fetched ahead
+    assert len(produced) == 4
+    assert next(it) == 1
+    sleep(0.2)
+    assert len(produced) == 5
+    it.close()
+
+
+def test_prefetch_iter_error_order():
+    def gen():
+        yield 1
+        yield 2
+        raise KeyError("boom")
+
+    it = prefetch_iter(gen(), 5)
+    assert next(it) == 1
+    assert next(it) == 2
+    with raises(KeyError):
+        next(it)
+
+
+def test_prefetch_iter_stops_producer():
+    def gen():
+        i = 0
+        while True:
+            yield i
+            i += 1
+
+    threads = active_count()
+    it = prefetch_iter(gen(), 1)
+    assert next(it) == 0
+    it.close()
+    sleep(0.3)
+    assert active_count() == threads
+    assert list(it) == []
+
+
+def test_run_concurrently():
+    def fail():
+        raise KeyError("boom")
+
+    calls = [lambda: 1, fail, lambda: 3]
+    results = run_concurrently(calls, 2)
+    assert results[0] == 1
+    assert isinstance(results[1], KeyError)
+    assert results[2] == 3
+    assert run_concurrently([], 2) == []
+    with raises(ValueError):
+        run_concurrently(calls, 0)
+
+
+def test_run_concurrently_max_concurrency():
+    lock = Lock()
+    running = []
+    peak = []
+
+    def call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        sleep(0.01)
+        with lock:
+            running.pop()
+
+    run_concurrently([call] * 20, 3)
+    assert max(peak) <= 3
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_adaptive_limiter_additive_increase():
+    clock = Clock()
+    limiter = AdaptiveConcurrencyLimiter(initial=2, max_limit=4, clock=clock)
+    for _ in range(20):
+        started = limiter.acquire()
+        clock.now += 0.1
+        limiter.release(started, 200)
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+
+def test_adaptive_limiter_multiplicative_decrease():
+    clock = Clock()
+    limiter = AdaptiveConcurrencyLimiter(initial=8, clock=clock)
+    wave = [limiter.acquire() for _ in range(4)]
+    clock.now += 0.1
+    for started in wave:
+        limiter.release(started, 503)
+    # A single wave of errors only cuts the limit once
+    assert limiter.limit == 4
+    started = limiter.acquire()
+    limiter.release(started, 429)
+    assert limiter.limit == 2
+    started = limiter.acquire()
+    limiter.release(started, None)
+    started = limiter.acquire()
+    limiter.release(started, None)
+    assert limiter.limit == 1
+    assert limiter.stats["decreases"] == 3
+
+
+def test_adaptive_limiter_latency_spike():
+    clock = Clock()
+    limiter = AdaptiveConcurrencyLimiter(initial=10, clock=clock)
+    for _ in range(5):
+        started = limiter.acquire()
+        clock.now += 0.1
+        limiter.release(started, 200)
+    assert limiter.limit == 10
+    started = limiter.acquire()
+    clock.now += 1
+    limiter.release(started, 200)
+    assert limiter.limit == 5
+
+
+def test_adaptive_limiter_latency_per_family():
+    clock = Clock()
+    limiter = AdaptiveConcurrencyLimiter(initial=10, clock=clock)
+    for _ in range(5):
+        started = limiter.acquire()
+        clock.now += 0.1
+        limiter.release(started, 200, "user/get")
+    # A slow endpoint is not an overload of the fast ones
+    started = limiter.acquire()
+    clock.now += 5
+    limiter.release(started, 200, "content/export")
+    started = limiter.acquire()
+    clock.now += 5
+    limiter.release(started, 200, "content/export")
+    assert limiter.limit == 10
+    assert limiter.latency("user/get") == approx(0.1)
+    assert limiter.latency("content/export") == 5
+    assert limiter.stats["families"] == 2
+
+
+def test_adaptive_limiter_without_latency():
+    clock = Clock()
+    limiter = AdaptiveConcurrencyLimiter(
+        initial=10, latency_tolerance=None, clock=clock
+    )
+    for latency in (0.1, 1):
+        started = limiter.acquire()
+        clock.now += latency
+        limiter.release(started, 200)
+    assert limiter.limit == 10
+    started = limiter.acquire()
+    limiter.release(started, 503)
+    assert limiter.limit == 5
+
+
+def test_adaptive_limiter_bounds_in_flight():
+    limiter = AdaptiveConcurrencyLimiter(initial=2, max_limit=2)
+    lock = Lock()
+    running = []
+    peak = []
+
+    def call():
+        started = limiter.acquire()
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        sleep(0.01)
+        with lock:
+            running.pop()
+        limiter.release(started, 200)
+
+    run_concurrently([call] * 10, 10)
+    assert max(peak) <= 2
+    assert limiter.stats["waits"] > 0
+    with raises(ValueError):
+        AdaptiveConcurrencyLimiter(initial=0)
+
+
+def test_base_client_concurrency_limiter(api_info):
+    limiter = AdaptiveConcurrencyLimiter(initial=4)
+    c = BaseClient(api_info, token="foo", concurrency_limiter=limiter)
+    c._client = Client(
+        base_url=c.base_url, transport=MockTransport(lambda r: Response(503))
+    )
+    assert c._request("GET", "/foo", {}, None, "foo").status_code == 503
+    assert limiter.limit == 2
+    assert limiter.in_flight == 0
+    assert c.get_new_client_as("foo@bar.com", "123").concurrency_limiter is limiter
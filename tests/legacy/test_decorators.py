@@ -3,6 +3,11 @@ import pytest
 from pytest_httpx import HTTPXMock
 
 from lumapps.api.decorators import (
+    clear_memoized,
+    invalidates,
+    keys_of,
+    memo_stats,
+    memoize,
     none_on_http_codes,
     retry_on_http_codes,
     none_on_404,
@@ -224,3 +229,91 @@ def test_raise_known_save_errors_2(httpx_mock: HTTPXMock):
         fake_request_with_raise_known_save_errors()
 
     assert httpx_mock.get_requests()
+
+
+### Memoize
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = 0
+
+    @memoize("group", maxsize=2)
+    def get_group(self, group_id, fields=None):
+        self.calls += 1
+        return {"id": group_id, "fields": fields}
+
+    @memoize("user")
+    def get_user(self, email):
+        self.calls += 1
+        return None
+
+    @invalidates("group")
+    def save_group(self):
+        pass
+
+    @invalidates("group", keys=keys_of())
+    def update_group(self, group):
+        pass
+
+    @memoize("group")
+    def get_all_group_id(self):
+        self.calls += 1
+        return "all"
+
+
+def test_memoize_per_instance():
+    c1, c2 = FakeClient(), FakeClient()
+    assert c1.get_group("a") == {"id": "a", "fields": None}
+    c1.get_group("a")
+    c1.get_group("a", fields="id")
+    assert c1.calls == 2
+    c2.get_group("a")
+    assert c2.calls == 1
+    # A memoized None is not called again
+    c1.get_user("a")
+    c1.get_user("a")
+    assert c1.calls == 3
+    c1.get_group("b")
+    stats = memo_stats(c1)
+    # The results are grouped by their first argument
+    assert stats["group/get_group"]["hits"] == 2
+    assert stats["group/get_group"]["size"] == 2
+    c1.get_group("c")
+    assert memo_stats(c1)["group/get_group"]["evictions"] == 1
+
+
+def test_invalidates():
+    c = FakeClient()
+    c.get_group("a")
+    c.get_user("a")
+    c.save_group()
+    c.get_group("a")
+    c.get_user("a")
+    assert c.calls == 3
+    clear_memoized(c)
+    assert memo_stats(c) == {}
+
+
+def test_invalidates_keys():
+    c = FakeClient()
+    c.get_group("a")
+    c.get_group("a", fields="id")
+    c.get_group("b")
+    c.get_all_group_id()
+    c.get_user("a")
+    assert c.calls == 5
+    c.update_group({"id": "a", "name": "A"})
+    # Only the saved group and the results without arguments are dropped
+    c.get_group("b")
+    c.get_user("a")
+    assert c.calls == 5
+    c.get_group("a")
+    c.get_group("a", fields="id")
+    c.get_all_group_id()
+    assert c.calls == 8
+    # Without the object, the whole namespace is dropped
+    c.update_group(group={"id": "a"})
+    c.get_group("b")
+    assert c.calls == 9
+
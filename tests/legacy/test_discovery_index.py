@@ -0,0 +1,144 @@
+from json import load
+from os import utime
+from time import time
+from unittest.mock import PropertyMock
+
+from pytest import fixture, raises
+
+from lumapps.api.base_client import BaseClient, _validators_key
+from lumapps.api.discovery_index import (
+    DiscoveryIndex,
+    EndpointSpec,
+    index_snapshot_key,
+    load_index_snapshot,
+    remove_index_snapshot,
+    save_index_snapshot,
+    set_index_snapshot_dir,
+)
+from lumapps.api.errors import BadCallError
+from lumapps.api.utils import get_discovery_cache
+
+
+@fixture
+def discovery_doc() -> dict:
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        return load(fh)
+
+
+def test_from_discovery(discovery_doc):
+    index = DiscoveryIndex.from_discovery(discovery_doc)
+    spec = index.get(("user", "get"))
+    assert spec.verb == "GET"
+    assert spec.path == "user/get"
+    assert spec.upload_path is None
+    listing, fields = index.get(("content", "list")).response
+    assert listing and "slug" in fields
+    assert index.get(("user", "nope")) is None
+    assert index.digest == DiscoveryIndex.from_discovery(discovery_doc).digest
+
+
+def test_endpoint_spec():
+    spec = EndpointSpec.from_method(
+        {
+            "httpMethod": "POST",
+            "path": "files/{fileId}",
+            "parameters": {
+                "fileId": {"location": "path", "required": True},
+                "fields": {"location": "query"},
+            },
+            "mediaUpload": {"protocols": {"simple": {"path": "/upload/files"}}},
+        }
+    )
+    assert spec == EndpointSpec(
+        "POST", "files/{fileId}", ("fileId",), ("fileId",), "/upload/files"
+    )
+
+
+def test_dumps_loads(discovery_doc):
+    index = DiscoveryIndex.from_discovery(discovery_doc)
+    data = index.dumps()
+    loaded = DiscoveryIndex.loads(data)
+    assert loaded.endpoints == index.endpoints
+    assert (loaded.digest, loaded.root_url) == (index.digest, index.root_url)
+    with raises(ValueError):
+        DiscoveryIndex.loads(b"nope" + data[4:])
+    with raises(ValueError):
+        DiscoveryIndex.loads(data[:-1] + b"x")
+
+
+def test_snapshots(tmp_path, discovery_doc):
+    index = DiscoveryIndex.from_discovery(discovery_doc)
+    key = index_snapshot_key("https://foo.com", "https://bar.com", "etag")
+    assert load_index_snapshot(key) is None
+    save_index_snapshot(key, index)
+    set_index_snapshot_dir(str(tmp_path))
+    assert load_index_snapshot(key) is None
+    save_index_snapshot(key, index)
+    loaded, expires_at = load_index_snapshot(key)
+    assert loaded.endpoints == index.endpoints
+    assert expires_at > time()
+    assert load_index_snapshot(key.replace("bar", "baz")) is None
+    # Expired snapshot
+    (path,) = tmp_path.iterdir()
+    utime(path, (0, 0))
+    assert load_index_snapshot(key) is None
+    remove_index_snapshot(key)
+    assert not list(tmp_path.iterdir())
+
+
+def set_discovery(c: BaseClient, discovery_doc: dict, etag: str) -> None:
+    get_discovery_cache().set(c._discovery_url, discovery_doc)
+    get_discovery_cache().set(_validators_key(c._discovery_url), {"etag": etag})
+
+
+def test_client_uses_snapshot(tmp_path, api_info, discovery_doc):
+    set_index_snapshot_dir(str(tmp_path))
+    c = BaseClient(api_info, token="foo")
+    set_discovery(c, discovery_doc, "v1")
+    assert c._get_verb_path_params(("user", "get"), {"email": "a"})[0] == "GET"
+    assert len(list(tmp_path.iterdir())) == 1
+
+    c = BaseClient(api_info, token="foo")
+    c._discovery_url = "https://nowhere.invalid/discovery"
+    get_discovery_cache().set(_validators_key(c._discovery_url), {"etag": "v1"})
+    index = DiscoveryIndex.from_discovery(discovery_doc)
+    save_index_snapshot(c._index_snapshot_key(), index)
+    # The discovery document is not needed anymore
+    verb, path, params = c._get_verb_path_params(("user", "get"), {"email": "a"})
+    assert (verb, params) == ("GET", {"email": "a"})
+    with raises(BadCallError):
+        c._get_verb_path_params(("user", "nope"), {})
+    # Revalidated once the snapshot expires
+    assert c._shared.discovery_expires_at > time()
+
+
+def test_project_from_snapshot(tmp_path, mocker, api_info, discovery_doc):
+    set_index_snapshot_dir(str(tmp_path))
+    c = BaseClient(api_info, token="foo")
+    get_discovery_cache().set(_validators_key(c._discovery_url), {"etag": "v1"})
+    index = DiscoveryIndex.from_discovery(discovery_doc)
+    save_index_snapshot(c._index_snapshot_key(), index)
+    doc = mocker.patch.object(
+        BaseClient, "discovery_doc", new_callable=PropertyMock, return_value={}
+    )
+    params = {}
+    c._project(("content", "list"), params, None, ["id"], None)
+    assert params == {"fields": "items(id),more,cursor"}
+    # The fields of the response are in the snapshot
+    assert not doc.called
+
+
+def test_snapshot_key(tmp_path, api_info, discovery_doc):
+    set_index_snapshot_dir(str(tmp_path))
+    c = BaseClient(api_info, token="foo")
+    set_discovery(c, discovery_doc, "v1")
+    key = c._index_snapshot_key()
+    other = BaseClient(
+        {**api_info, "base_url": "https://go-cell-003.api.lumapps.com"}, token="foo"
+    )
+    other._discovery_url = c._discovery_url
+    assert other._index_snapshot_key() != key
+    set_discovery(c, discovery_doc, "v2")
+    assert c._index_snapshot_key() != key
+    get_discovery_cache().set(_validators_key(c._discovery_url), {})
+    assert c._index_snapshot_key() is None
@@ -0,0 +1,76 @@
+from json import load
+
+from httpx import Client, MockTransport, Response
+from pytest import fixture
+
+from lumapps.api.base_client import BaseClient
+from lumapps.api.projection import build_fields
+from lumapps.api.utils import FILTERS, compile_prune_filters, get_discovery_cache
+
+
+@fixture(scope="module")
+def discovery_doc():
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        return load(fh)
+
+
+def test_build_fields_needed(discovery_doc):
+    fields = build_fields(discovery_doc, ("content", "list"), ["id", "slug", "id"])
+    assert fields == "items(id,slug),more,cursor"
+    assert build_fields(discovery_doc, ("content", "get"), ["id"]) == "id"
+    assert build_fields(discovery_doc, ("foo", "list"), ["id"]) == (
+        "items(id),more,cursor"
+    )
+    assert build_fields(discovery_doc, ("content", "get")) is None
+
+
+def test_build_fields_prune(discovery_doc):
+    trie = compile_prune_filters(("content", "list"))
+    fields = build_fields(discovery_doc, ("content", "list"), prune_trie=trie)
+    assert fields.startswith("items(") and fields.endswith("),more,cursor")
+    selected = fields[6:-13].split(",")
+    assert "id" in selected and "slug" in selected
+    # Pruned partially, still asked for
+    assert "properties" in selected
+    for pruned in ("lastRevision", "authorDetails", "excerpt"):
+        assert pruned not in selected
+    # Nothing pruned, nothing to project
+    trie = compile_prune_filters(("user", "get"))
+    assert build_fields(discovery_doc, ("user", "get"), prune_trie=trie) is None
+
+
+def make_client(api_info, discovery_doc, requests, **kwargs) -> BaseClient:
+    def handler(request):
+        requests.append(request)
+        return Response(200, json={"items": [{"id": "1", "lastRevision": 1}]})
+
+    c = BaseClient(api_info, token="foo", **kwargs)
+    get_discovery_cache().set(c._discovery_url, discovery_doc)
+    c._client = Client(base_url=c.base_url, transport=MockTransport(handler))
+    return c
+
+
+def test_get_call_needed_fields(api_info, discovery_doc):
+    requests = []
+    c = make_client(api_info, discovery_doc, requests)
+    assert c.get_call("instance/list", needed_fields=["id"]) == [
+        {"id": "1", "lastRevision": 1}
+    ]
+    assert requests[-1].url.params["fields"] == "items(id),more,cursor"
+    # The fields given by the caller are kept
+    c.get_call("instance/list", fields="items(name)", needed_fields=["id"])
+    assert requests[-1].url.params["fields"] == "items(name)"
+    c.get_call("instance/list")
+    assert "fields" not in requests[-1].url.params
+
+
+def test_iter_call_project_fields(mocker, api_info, discovery_doc):
+    mocker.patch.dict(FILTERS, {"content/*": ["lastRevision", "properties/foo"]})
+    requests = []
+    c = make_client(api_info, discovery_doc, requests, prune=True)
+    assert list(c.iter_call("content/list", body={})) == [{"id": "1"}]
+    assert "fields" not in requests[-1].url.params
+    c.project_fields = True
+    assert list(c.iter_call("content/list", body={})) == [{"id": "1"}]
+    fields = requests[-1].url.params["fields"]
+    assert "lastRevision" not in fields and "properties" in fields
@@ -0,0 +1,131 @@
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from json import load
+
+from httpx import Client, HTTPStatusError, MockTransport, Response
+from pytest import fixture, raises
+
+from lumapps.api.base_client import BaseClient
+from lumapps.api.rate_limit import (
+    RateLimiter,
+    TokenBucket,
+    parse_retry_after,
+)
+from lumapps.api.utils import get_discovery_cache, is_read_endpoint
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@fixture
+def fake_time() -> FakeTime:
+    return FakeTime()
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("12") == 12
+    assert parse_retry_after("-1") == 0
+    assert parse_retry_after("not a date") is None
+    date = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < parse_retry_after(format_datetime(date, usegmt=True)) <= 30
+
+
+def test_is_read_endpoint():
+    assert is_read_endpoint("GET", ("user", "get"))
+    assert is_read_endpoint("POST", ("content", "list"))
+    assert is_read_endpoint("POST", ("community", "post", "search"))
+    assert not is_read_endpoint("POST", ("content", "save"))
+    assert not is_read_endpoint("DELETE", ("content", "delete"))
+    assert not is_read_endpoint("POST", ("document", "uploadUrl", "get"))
+    assert not is_read_endpoint("POST", ("user", "device", "token", "get"))
+    assert not is_read_endpoint("POST", ("translate", "get"))
+
+
+def test_token_bucket(fake_time):
+    bucket = TokenBucket(2, capacity=2, clock=fake_time.clock, sleeper=fake_time.sleep)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0.5
+    fake_time.now += 10
+    assert bucket.acquire() == 0
+    assert bucket.waited == 0.5
+    with raises(ValueError):
+        TokenBucket(0)
+
+
+def test_token_bucket_pause(fake_time):
+    bucket = TokenBucket(1, clock=fake_time.clock, sleeper=fake_time.sleep)
+    bucket.pause(5)
+    assert bucket.acquire() == 6
+    assert fake_time.now == 6
+
+
+def test_rate_limiter_buckets(fake_time):
+    reads = TokenBucket(10, clock=fake_time.clock, sleeper=fake_time.sleep)
+    writes = TokenBucket(1, clock=fake_time.clock, sleeper=fake_time.sleep)
+    comments = TokenBucket(1, clock=fake_time.clock, sleeper=fake_time.sleep)
+    limiter = RateLimiter(reads, writes, endpoints={"comment/save": comments})
+    assert limiter.bucket_for("GET", ("user", "get")) is reads
+    assert limiter.bucket_for("POST", ("content", "list")) is reads
+    assert limiter.bucket_for("POST", ("content", "save")) is writes
+    assert limiter.bucket_for("POST", ("comment", "save")) is comments
+    assert RateLimiter(reads).bucket_for("POST", ("content", "save")) is None
+    assert RateLimiter(reads).acquire("POST", ("content", "save")) == 0
+
+
+def test_rate_limiter_throttle_pauses_only_the_bucket(fake_time):
+    reads = TokenBucket(10, clock=fake_time.clock, sleeper=fake_time.sleep)
+    writes = TokenBucket(10, clock=fake_time.clock, sleeper=fake_time.sleep)
+    limiter = RateLimiter(reads, writes)
+    limiter.throttle("POST", ("content", "save"), 30)
+    assert limiter.acquire("GET", ("user", "get")) == 0
+    assert limiter.acquire("POST", ("content", "save")) >= 30
+    assert limiter.stats["throttled"] == 1
+
+
+def test_call_retries_on_429(api_info, fake_time):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        if len(calls) == 1:
+            return Response(429, headers={"Retry-After": "7"})
+        return Response(200, json={"id": "123"})
+
+    writes = TokenBucket(10, clock=fake_time.clock, sleeper=fake_time.sleep)
+    reads = TokenBucket(10, clock=fake_time.clock, sleeper=fake_time.sleep)
+    c = BaseClient(api_info, token="foo", rate_limiter=RateLimiter(reads, writes))
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        get_discovery_cache().set(c._discovery_url, load(fh))
+    c._client = Client(base_url=c.base_url, transport=MockTransport(handler))
+    assert c.get_call("user/get", email="foo@bar.com") == {"id": "123"}
+    assert len(calls) == 2
+    assert fake_time.sleeps[0] == 7
+
+
+def test_call_gives_up_on_429(api_info, fake_time):
+    def handler(request):
+        return Response(429)
+
+    reads = TokenBucket(10, clock=fake_time.clock, sleeper=fake_time.sleep)
+    limiter = RateLimiter(reads, max_throttle_retries=2)
+    c = BaseClient(api_info, token="foo", rate_limiter=limiter)
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        get_discovery_cache().set(c._discovery_url, load(fh))
+    c._client = Client(base_url=c.base_url, transport=MockTransport(handler))
+    with raises(HTTPStatusError):
+        c.get_call("user/get", email="foo@bar.com")
+    assert limiter.stats["throttled"] == 2
+    assert c.get_new_client_as("foo@bar.com", "123").rate_limiter is limiter
@@ -0,0 +1,172 @@
+from json import load
+from time import time
+
+from httpx import Client, HTTPStatusError, MockTransport, Response
+from pytest import fixture, raises
+
+from lumapps.api.base_client import BaseClient
+from lumapps.api.response_cache import (
+    CacheRule,
+    MemoryResponseCacheBackend,
+    ResponseCache,
+    SqliteResponseCacheBackend,
+)
+from lumapps.api.utils import _get_conn, _set_sqlite_ok, get_discovery_cache
+
+
+@fixture
+def requests():
+    return []
+
+
+def make_client(api_info, cache, requests, handler, token="foo") -> BaseClient:
+    def transport(request):
+        requests.append(request)
+        return handler(request)
+
+    c = BaseClient(api_info, token=token, response_cache=cache)
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        get_discovery_cache().set(c._discovery_url, load(fh))
+    c._client = Client(base_url=c.base_url, transport=MockTransport(transport))
+    return c
+
+
+def test_cache_hit(api_info, requests):
+    cache = ResponseCache({"user/*": CacheRule(ttl=60)})
+    c = make_client(api_info, cache, requests, lambda r: Response(200, json={"a": 1}))
+    user = c.get_call("user/get", email="a")
+    user["a"] = 2
+    assert c.get_call("user/get", email="a") == {"a": 1}
+    assert c.get_call("user/get", email="b") == {"a": 1}
+    assert len(requests) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_not_cached_endpoint(api_info, requests):
+    cache = ResponseCache({"content/get": CacheRule(ttl=60)})
+    c = make_client(api_info, cache, requests, lambda r: Response(200, json={}))
+    c.get_call("user/get", email="a")
+    c.get_call("user/get", email="a")
+    assert len(requests) == 2
+
+
+def test_etag_revalidation(api_info, requests):
+    def handler(request):
+        if request.headers.get("If-None-Match") == "v1":
+            return Response(304)
+        return Response(200, json={"a": 1}, headers={"ETag": "v1"})
+
+    cache = ResponseCache({"user/get": CacheRule(ttl=0)})
+    c = make_client(api_info, cache, requests, handler)
+    assert c.get_call("user/get", email="a") == {"a": 1}
+    assert c.get_call("user/get", email="a") == {"a": 1}
+    assert len(requests) == 2
+    assert "If-None-Match" not in requests[0].headers
+    assert cache.revalidations == 1
+
+
+def test_negative_caching(api_info, requests):
+    cache = ResponseCache({"user/get": CacheRule(ttl=60, cache_not_found=True)})
+    c = make_client(api_info, cache, requests, lambda r: Response(404))
+    for _ in range(2):
+        with raises(HTTPStatusError) as err:
+            c.get_call("user/get", email="a")
+        assert err.value.response.status_code == 404
+    assert len(requests) == 1
+
+
+def test_invalidation(api_info, requests):
+    cache = ResponseCache({"user/get": CacheRule(ttl=60)})
+    c = make_client(api_info, cache, requests, lambda r: Response(200, json={}))
+    c.get_call("user/get", email="a")
+    c.get_call("user/save", body={"email": "a"})
+    c.get_call("user/get", email="a")
+    assert len(requests) == 3
+
+
+def test_max_size(api_info, requests):
+    cache = ResponseCache({"user/get": CacheRule(ttl=60, max_size=1)})
+    c = make_client(api_info, cache, requests, lambda r: Response(200, json={}))
+    c.get_call("user/get", email="a")
+    c.get_call("user/get", email="b")
+    c.get_call("user/get", email="a")
+    assert len(requests) == 3
+
+
+def test_scopes(api_info, requests):
+    cache = ResponseCache({"user/get": CacheRule(ttl=60)})
+    c = make_client(api_info, cache, requests, lambda r: Response(200, json={}))
+    c2 = c.get_new_client_as("foo@bar.com", "123")
+    assert c2.response_cache is cache
+    assert c2._cache_scope != c._cache_scope
+
+
+def test_clients_do_not_share_entries(api_info, requests):
+    def handler(request):
+        return Response(200, json={"token": request.headers["authorization"]})
+
+    cache = ResponseCache({"user/get": CacheRule(ttl=60)})
+    c1 = make_client(api_info, cache, requests, handler, token="t1")
+    c2 = make_client(api_info, cache, requests, handler, token="t2")
+    other_cell = {**api_info, "base_url": "https://other-cell.api.lumapps.com"}
+    c3 = make_client(other_cell, cache, requests, handler, token="t1")
+    assert c1.get_call("user/get", email="a") == {"token": "Bearer t1"}
+    assert c2.get_call("user/get", email="a") == {"token": "Bearer t2"}
+    assert c3.get_call("user/get", email="a") == {"token": "Bearer t1"}
+    assert len(requests) == 3
+    assert c1.get_call("user/get", email="a") == {"token": "Bearer t1"}
+    assert len(requests) == 3
+    # The same user on two platforms
+    u1 = c1.get_new_client_as("foo@bar.com", "org1")
+    u2 = c1.get_new_client_as("foo@bar.com", "org2")
+    assert u1._response_cache_scope() != u2._response_cache_scope()
+
+
+def test_memory_backend():
+    backend = MemoryResponseCacheBackend(max_entries=2)
+    backend.set("a/get|1", {"v": 1})
+    backend.set("b/get|1", {"v": 2})
+    backend.get("a/get|1")
+    backend.set("c/get|1", {"v": 3})
+    assert backend.get("b/get|1") is None
+    backend.delete_prefix("a/")
+    assert backend.get("a/get|1") is None
+    assert backend.get("c/get|1") == {"v": 3}
+
+
+def test_sqlite_backend(tmp_path):
+    _set_sqlite_ok(True)
+    backend = SqliteResponseCacheBackend(str(tmp_path / "cache.db"))
+    forever = time() + 3600
+    backend.set("user/get|x", {"v": 1, "expires_at": forever})
+    backend.set("content/get|x", {"v": 2, "expires_at": forever})
+    assert backend.get("user/get|x") == {"v": 1, "expires_at": forever}
+    backend.delete_prefix("user/")
+    assert backend.get("user/get|x") is None
+    backend.delete("content/get|x")
+    assert backend.get("content/get|x") is None
+
+
+def test_sqlite_backend_purge(mocker, tmp_path):
+    _set_sqlite_ok(True)
+    now = mocker.patch("lumapps.api.response_cache.time", return_value=1000.0)
+    db_file = str(tmp_path / "cache.db")
+    backend = SqliteResponseCacheBackend(db_file, max_entries=3, stale_ttl=50)
+    backend.set("user/get|a", {"expires_at": 1010, "etag": None})
+    backend.set("user/get|b", {"expires_at": 1010, "etag": "v1"})
+    now.return_value = 1020.0
+    # Expired, kept for its revalidation when it has an ETag
+    assert backend.get("user/get|a") is None
+    assert backend.get("user/get|b") is not None
+    # The size of an endpoint is bounded for all the processes
+    other = SqliteResponseCacheBackend(db_file)
+    for i in range(3):
+        now.return_value += 1
+        other.set(f"content/get|{i}", {"expires_at": 2000}, max_size=2)
+    assert other.get("content/get|0") is None
+    now.return_value = 1100.0
+    backend._next_purge = 0
+    backend.set("media/get|a", {"expires_at": 2000})
+    conn = _get_conn(db_file)
+    keys = [r["key"] for r in conn.execute("SELECT key FROM responses")]
+    assert sorted(keys) == ["content/get|1", "content/get|2", "media/get|a"]
@@ -0,0 +1,198 @@
+from json import load
+
+from httpx import (
+    Client,
+    ConnectError,
+    HTTPStatusError,
+    MockTransport,
+    ReadTimeout,
+    Request,
+    Response,
+)
+from pytest import fixture, raises
+
+from lumapps.api.base_client import BaseClient
+from lumapps.api.decorators import retry_on_http_codes, retry_on_http_status_error
+from lumapps.api.retry import RetryBudget, RetryPolicy, retry_call
+from lumapps.api.utils import get_discovery_cache
+
+
+@fixture
+def sleeps():
+    return []
+
+
+@fixture
+def attempts():
+    return []
+
+
+@fixture
+def policy(sleeps, attempts) -> RetryPolicy:
+    return RetryPolicy(
+        max_attempts=3,
+        backoff_base=1,
+        jitter=False,
+        on_attempt=attempts.append,
+        sleeper=sleeps.append,
+    )
+
+
+def make_client(api_info, policy, handler) -> BaseClient:
+    c = BaseClient(api_info, token="foo", retry_policy=policy)
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        get_discovery_cache().set(c._discovery_url, load(fh))
+    c._client = Client(base_url=c.base_url, transport=MockTransport(handler))
+    return c
+
+
+def test_backoff():
+    policy = RetryPolicy(backoff_base=1, backoff_max=5, jitter=False)
+    assert [policy.backoff(i) for i in range(1, 5)] == [1, 2, 4, 5]
+    assert policy.backoff(1, retry_after=10) == 10
+    jittered = RetryPolicy(backoff_base=1)
+    assert all(0 <= jittered.backoff(3) <= 4 for _ in range(20))
+    with raises(ValueError):
+        RetryPolicy(max_attempts=0)
+
+
+def test_should_retry(policy):
+    req = Request("GET", "https://foo.com")
+    assert policy.should_retry("GET", ("user", "get"), 1, Response(503))
+    assert policy.should_retry("POST", ("content", "list"), 1, Response(502))
+    assert not policy.should_retry("GET", ("user", "get"), 3, Response(503))
+    assert not policy.should_retry("GET", ("user", "get"), 1, Response(400))
+    # Writes are only retried when the server did not process them
+    assert not policy.should_retry("POST", ("content", "save"), 1, Response(503))
+    assert policy.should_retry("POST", ("content", "save"), 1, Response(429))
+    assert policy.should_retry(
+        "POST", ("content", "save"), 1, error=ConnectError("", request=req)
+    )
+    assert not policy.should_retry(
+        "POST", ("content", "save"), 1, error=ReadTimeout("", request=req)
+    )
+    assert policy.should_retry(
+        "GET", ("user", "get"), 1, error=ReadTimeout("", request=req)
+    )
+    policy.retry_writes = True
+    assert policy.should_retry("POST", ("content", "save"), 1, Response(503))
+
+
+def test_budget():
+    budget = RetryBudget(ratio=0.5, max_tokens=1)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+    assert budget.exhausted == 1
+
+
+def test_call_retries_with_backoff(api_info, policy, sleeps, attempts):
+    responses = [Response(503), Response(503), Response(200, json={"id": "1"})]
+    c = make_client(api_info, policy, lambda r: responses.pop(0))
+    assert c.get_call("user/get", email="foo@bar.com") == {"id": "1"}
+    assert sleeps == [1, 2]
+    assert [(a.attempt, a.status_code, a.delay) for a in attempts] == [
+        (1, 503, 1),
+        (2, 503, 2),
+        (3, 200, None),
+    ]
+
+
+def test_call_retries_transport_errors(api_info, policy, sleeps):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectError("refused", request=request)
+        return Response(200, json={"id": "1"})
+
+    c = make_client(api_info, policy, handler)
+    assert c.get_call("user/get", email="foo@bar.com") == {"id": "1"}
+    calls.clear()
+    policy.max_attempts = 2
+    with raises(ConnectError):
+        c.get_call("user/get", email="foo@bar.com")
+
+
+def test_call_does_not_retry_writes(api_info, policy, sleeps):
+    c = make_client(api_info, policy, lambda r: Response(503))
+    with raises(HTTPStatusError):
+        c.get_call("content/save", body={})
+    assert sleeps == []
+
+
+def test_call_respects_budget(api_info, sleeps, attempts):
+    policy = RetryPolicy(
+        budget=RetryBudget(ratio=0, max_tokens=1),
+        on_attempt=attempts.append,
+        sleeper=sleeps.append,
+    )
+    c = make_client(api_info, policy, lambda r: Response(503))
+    with raises(HTTPStatusError):
+        c.get_call("user/get", email="foo@bar.com")
+    assert len(attempts) == 2
+    assert policy.budget.exhausted == 1
+    assert c.get_new_client_as("foo@bar.com", "123").retry_policy is policy
+
+
+def test_retry_call(policy, sleeps, attempts):
+    results = [ValueError(), ValueError(), "ok"]
+
+    def f():
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert retry_call(f, lambda e: isinstance(e, ValueError), 3, policy) == "ok"
+    assert sleeps == [1, 2]
+    assert len(attempts) == 3
+    with raises(KeyError):
+        retry_call(lambda: {}["a"], lambda e: False, 3)
+
+
+def test_retry_decorator_uses_client_policy(policy, sleeps):
+    class Foo:
+        retry_policy = policy
+        calls = 0
+
+        @retry_on_http_codes({409, 503})
+        def save(self, status_code):
+            self.calls += 1
+            raise HTTPStatusError(
+                "",
+                request=Request("POST", "https://foo.com"),
+                response=Response(status_code),
+            )
+
+    foo = Foo()
+    with raises(HTTPStatusError):
+        foo.save(409)
+    assert foo.calls == 3
+    assert sleeps == [1, 2]
+    # Retried by the calls of the client already
+    foo.calls = 0
+    with raises(HTTPStatusError):
+        foo.save(503)
+    assert foo.calls == 1
+
+
+def test_retries_do_not_multiply(api_info, policy):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return Response(503)
+
+    c = make_client(api_info, policy, handler)
+
+    @retry_on_http_status_error()
+    def get_user(client):
+        return client.get_call("user/get", email="foo@bar.com")
+
+    with raises(HTTPStatusError):
+        get_user(c)
+    assert len(requests) == 3
@@ -0,0 +1,86 @@
+from json import load
+from threading import Event, Thread
+from time import monotonic, sleep
+
+from httpx import Client, MockTransport, Response
+from pytest import raises
+
+from lumapps.api.base_client import BaseClient
+from lumapps.api.singleflight import SingleFlight
+from lumapps.api.utils import get_discovery_cache
+
+
+def run_threads(n, target):
+    results = []
+    threads = [Thread(target=lambda: results.append(target())) for _ in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def wait_for(condition, timeout=2):
+    deadline = monotonic() + timeout
+    while not condition() and monotonic() < deadline:
+        sleep(0.001)
+
+
+def test_single_flight_coalesces():
+    flight = SingleFlight()
+    started, release = Event(), Event()
+    calls = []
+
+    def f():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return {"id": "1"}
+
+    threads, results = run_threads(1, lambda: flight.do("k", f))
+    started.wait(2)
+    followers, follower_results = run_threads(4, lambda: flight.do("k", f))
+    wait_for(lambda: flight.coalesced == 4)
+    release.set()
+    for t in threads + followers:
+        t.join()
+    results += follower_results
+    assert results == [{"id": "1"}] * 5
+    # Every caller gets its own copy
+    assert len({id(r) for r in results}) == 5
+    assert len(calls) == 1
+    assert flight.coalesced == 4
+    assert flight.do("k", lambda: 2) == 2
+
+
+def test_single_flight_error():
+    flight = SingleFlight()
+    with raises(ValueError):
+        flight.do("k", lambda: int("a"))
+    assert flight.do("k", lambda: 1) == 1
+
+
+def test_call_coalesces_reads(api_info):
+    started, release = Event(), Event()
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        started.set()
+        release.wait(2)
+        return Response(200, json={"id": "1"})
+
+    c = BaseClient(api_info, token="foo")
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        get_discovery_cache().set(c._discovery_url, load(fh))
+    c._client = Client(base_url=c.base_url, transport=MockTransport(handler))
+
+    threads, results = run_threads(1, lambda: c.get_call("user/get", email="a"))
+    started.wait(2)
+    followers, _ = run_threads(2, lambda: c.get_call("user/get", email="a"))
+    wait_for(lambda: c.coalesced_calls == 2)
+    other, _ = run_threads(1, lambda: c.get_call("user/get", email="b"))
+    release.set()
+    for t in threads + followers + other:
+        t.join()
+    assert len(requests) == 2
+    assert c.coalesced_calls == 2
+    assert not BaseClient(api_info, token="foo", coalesce_reads=False).coalesce_reads
@@ -0,0 +1,121 @@
+from json import dumps, load, loads
+
+from httpx import Client, HTTPStatusError, MockTransport, Response
+from pytest import fixture, raises
+
+from lumapps.api.base_client import BaseClient
+from lumapps.api.streaming import ListingDecoder
+from lumapps.api.utils import FILTERS, get_discovery_cache
+
+
+def feed_all(decoder, content: bytes, size: int):
+    items = []
+    for i in range(0, len(content), size):
+        items += decoder.feed(content[i : i + size])
+    return items, decoder.close()
+
+
+def test_listing_decoder():
+    page = {
+        "cursor": 'a"items"',
+        "items": [
+            {"id": "1", "items": [1, {"a": "]}"}], "t": 'q\\"[{'},
+            [],
+            "é",
+            None,
+        ],
+        "more": True,
+    }
+    content = dumps(page, ensure_ascii=False).encode()
+    for size in (1, 2, 7, len(content)):
+        items, rest = feed_all(ListingDecoder(), content, size)
+        assert items == page["items"]
+        assert rest == {"cursor": 'a"items"', "items": [], "more": True}
+
+
+def test_listing_decoder_yields_items_early():
+    decoder = ListingDecoder()
+    assert decoder.feed(b'{"more": false, "items": [{"id": 1}, {"id"') == [{"id": 1}]
+    assert decoder.feed(b": 2}]}") == [{"id": 2}]
+    assert decoder.count == 2
+    assert decoder.close() == {"more": False, "items": []}
+
+
+def test_listing_decoder_no_items():
+    assert feed_all(ListingDecoder(), b'{"more": false}', 3) == ([], {"more": False})
+    assert feed_all(ListingDecoder(), b'{"items": []}', 3) == ([], {"items": []})
+    assert ListingDecoder().close() is None
+    decoder = ListingDecoder()
+    decoder.feed(b'{"items": [{"id": 1}')
+    with raises(ValueError):
+        decoder.close()
+
+
+@fixture(scope="module")
+def discovery_doc():
+    with open("tests/legacy/test_data/lumapps_discovery.json") as fh:
+        return load(fh)
+
+
+def make_client(api_info, discovery_doc, pages, requests) -> BaseClient:
+    def handler(request):
+        requests.append(request)
+        page = pages[len(requests) - 1]
+        if isinstance(page, int):
+            return Response(page, json={"error": "nope"})
+        content = dumps(page).encode()
+        # Received in small chunks
+        chunks = [content[i : i + 5] for i in range(0, len(content), 5)]
+        return Response(200, content=iter(chunks))
+
+    c = BaseClient(api_info, token="foo")
+    get_discovery_cache().set(c._discovery_url, discovery_doc)
+    c._client = Client(base_url=c.base_url, transport=MockTransport(handler))
+    return c
+
+
+def test_iter_call_stream(mocker, api_info, discovery_doc):
+    mocker.patch.dict(FILTERS, {"content/*": ["lastRevision"]})
+    pages = [
+        {"items": [{"id": "1", "lastRevision": 1}], "more": True, "cursor": "c1"},
+        {"items": [{"id": "2"}, {"id": "3"}], "more": False},
+    ]
+    requests = []
+    c = make_client(api_info, discovery_doc, pages, requests)
+    c.prune = True
+    items = c.iter_call("content/list", body={}, stream=True)
+    assert next(items) == {"id": "1"}
+    assert len(requests) == 1
+    assert list(items) == [{"id": "2"}, {"id": "3"}]
+    assert loads(requests[1].content) == {"cursor": "c1"}
+    assert c.cursor is None
+
+
+def test_iter_call_stream_more_without_items(api_info, discovery_doc):
+    pages = [{"items": [], "more": True, "cursor": "c1"}]
+    requests = []
+    c = make_client(api_info, discovery_doc, pages, requests)
+    assert list(c.iter_call("instance/list", stream=True)) == []
+    assert len(requests) == 1
+
+
+def test_iter_call_stream_error(api_info, discovery_doc):
+    requests = []
+    c = make_client(api_info, discovery_doc, [403], requests)
+    with raises(HTTPStatusError):
+        list(c.iter_call("instance/list", stream=True))
+    with raises(ValueError):
+        list(c.iter_call("instance/list", stream=True, prefetch=2))
+
+
+def test_iter_call_stream_max_items(api_info, discovery_doc):
+    pages = [
+        {"items": [{"id": "1"}, {"id": "2"}], "more": True, "cursor": "c1"},
+        {"items": [{"id": "3"}], "more": True, "cursor": "c2"},
+    ]
+    requests = []
+    c = make_client(api_info, discovery_doc, pages, requests)
+    items = c.iter_call("instance/list", stream=True, max_items=3)
+    assert [i["id"] for i in items] == ["1", "2", "3"]
+    assert [r.url.params.get("maxResults") for r in requests] == [None, "1"]
+    assert c.cursor == "c2"
@@ -0,0 +1,191 @@
+from asyncio import gather, run
+from asyncio import sleep as async_sleep
+from gc import collect
+from threading import Event, Thread
+from time import sleep
+
+from pytest import fixture, raises
+
+from lumapps.api.base_client import BaseClient
+from lumapps.api.token_manager import AsyncTokenManager, TokenManager
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@fixture
+def clock() -> Clock:
+    return Clock()
+
+
+def make_getter(expires_in=3600):
+    calls = []
+
+    def getter():
+        calls.append(1)
+        return f"token{len(calls)}", expires_in
+
+    return getter, calls
+
+
+def test_get_token_cached(clock):
+    getter, calls = make_getter()
+    manager = TokenManager(getter, clock=clock)
+    assert manager.get_token() == "token1"
+    assert manager.get_token() == "token1"
+    assert manager() == ("token1", 3600)
+    assert len(calls) == 1
+    assert manager.stats["refreshes"] == 1
+
+
+def test_refresh_ahead_of_expiry(clock):
+    getter, calls = make_getter()
+    manager = TokenManager(getter, refresh_margin=60, clock=clock)
+    assert manager.get_token() == "token1"
+    clock.now += 3550
+    assert manager.get_token() == "token2"
+    assert manager.stats["proactive_refreshes"] == 1
+
+
+def test_failed_proactive_refresh_keeps_valid_token(clock):
+    calls = []
+
+    def getter():
+        calls.append(1)
+        if len(calls) > 1:
+            raise ValueError("down")
+        return "token1", 3600
+
+    manager = TokenManager(getter, refresh_margin=60, clock=clock)
+    assert manager.get_token() == "token1"
+    clock.now += 3550
+    assert manager.get_token() == "token1"
+    assert manager.stats["refresh_failures"] == 1
+    clock.now += 100
+    with raises(ValueError):
+        manager.get_token()
+
+
+def test_never_serve_expired_token(clock):
+    getter, calls = make_getter(expires_in=100)
+    manager = TokenManager(getter, refresh_margin=10, clock=clock)
+    assert manager.get_token() == "token1"
+    clock.now += 200
+    assert manager.get_token() == "token2"
+    assert manager.stats["proactive_refreshes"] == 0
+
+
+def test_invalidate(clock):
+    getter, calls = make_getter()
+    manager = TokenManager(getter, clock=clock)
+    assert manager.get_token() == "token1"
+    manager.invalidate("old token")
+    assert manager.get_token() == "token1"
+    manager.invalidate("token1")
+    assert manager.get_token() == "token2"
+    assert manager.stats["invalidations"] == 1
+
+
+def test_no_expiry(clock):
+    getter, calls = make_getter(expires_in=None)
+    manager = TokenManager(getter, clock=clock)
+    assert manager() == ("token1", 0)
+    clock.now += 10 ** 9
+    assert manager.get_token() == "token1"
+
+
+def test_seed(clock):
+    getter, calls = make_getter()
+    manager = TokenManager(getter, clock=clock)
+    manager.seed("seeded")
+    manager.seed("ignored")
+    assert manager.get_token() == "seeded"
+    assert not calls
+
+
+def test_single_flight():
+    started = Event()
+    release = Event()
+    calls = []
+
+    def getter():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return "token", 3600
+
+    manager = TokenManager(getter)
+    results = []
+    threads = [
+        Thread(target=lambda: results.append(manager.get_token())) for _ in range(10)
+    ]
+    for t in threads:
+        t.start()
+    started.wait(2)
+    sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == ["token"] * 10
+    assert len(calls) == 1
+    assert manager.stats["waits"] == 9
+
+
+def test_async_single_flight():
+    calls = []
+
+    async def getter():
+        calls.append(1)
+        await async_sleep(0.05)
+        return f"token{len(calls)}", 3600
+
+    async def main():
+        manager = AsyncTokenManager(getter)
+        results = await gather(*(manager.get_token() for _ in range(10)))
+        return manager, results
+
+    manager, results = run(main())
+    assert results == ["token1"] * 10
+    assert len(calls) == 1
+    assert manager.stats["waits"] == 9
+
+
+def test_async_refresh_ahead_of_expiry(clock):
+    getter, calls = make_getter(expires_in=100)
+    manager = AsyncTokenManager(getter, refresh_margin=60, clock=clock)
+    assert run(manager.get_token()) == "token1"
+    clock.now += 50
+    assert run(manager.get_token()) == "token2"
+    assert manager.stats["proactive_refreshes"] == 1
+    manager.invalidate("token2")
+    assert run(manager()) == ("token3", 100)
+    assert len(calls) == 3
+
+
+def test_base_client_wraps_token_getter(api_info):
+    getter, calls = make_getter()
+    c = BaseClient(api_info, token_getter=getter)
+    assert isinstance(c.token_manager, TokenManager)
+    assert c._get_token() == "token1"
+    assert c.token == "token1"
+    manager = TokenManager(getter)
+    assert BaseClient(api_info, token_getter=manager).token_manager is manager
+    assert BaseClient(api_info, token="foo").token_manager is None
+
+
+def test_get_new_client_as_shares_token_manager(api_info):
+    c = BaseClient(api_info, auth_info={"client_id": "a", "client_secret": "b"})
+    c1 = c.get_new_client_as("foo@bar.com", "customer")
+    c2 = c.get_new_client_as("foo@bar.com", "customer")
+    c3 = c.get_new_client_as("bar@bar.com", "customer")
+    assert c1.token_manager is c2.token_manager
+    assert c1.token_manager is not c3.token_manager
+    # Not kept once the clients are gone
+    del c1, c2
+    collect()
+    assert list(c._token_managers) == [("customer", "bar@bar.com")]
@@ -0,0 +1,103 @@
+import os
+import stat
+from threading import Thread
+from time import sleep
+
+from pytest import fixture, raises
+
+from lumapps.api.client import LumAppsClient
+from lumapps.api.token_store import SqliteTokenStore
+from lumapps.api.utils import _set_sqlite_ok
+
+
+@fixture
+def db_file(tmp_path):
+    _set_sqlite_ok(True)
+    return str(tmp_path / "tokens.db")
+
+
+class Fetcher:
+    def __init__(self, expires_in=3600):
+        self.calls = 0
+        self.expires_in = expires_in
+
+    def __call__(self):
+        self.calls += 1
+        return f"tok{self.calls}", self.expires_in
+
+
+def test_get_shared_by_stores(db_file):
+    fetch = Fetcher()
+    assert SqliteTokenStore(db_file).get("a", "foo@bar.com", fetch) == (
+        "tok1",
+        3600,
+    )
+    # Another process reads the stored token
+    token, expires_in = SqliteTokenStore(db_file).get("a", "foo@bar.com", fetch)
+    assert token == "tok1"
+    assert 3598 <= expires_in <= 3600
+    assert fetch.calls == 1
+    assert SqliteTokenStore(db_file).get("b", "foo@bar.com", fetch)[0] == "tok2"
+
+
+def test_get_refreshes(db_file):
+    store = SqliteTokenStore(db_file, refresh_margin=60)
+    fetch = Fetcher(expires_in=30)
+    assert store.get("a", "foo@bar.com", fetch)[0] == "tok1"
+    # Expires within the refresh margin
+    assert store.get("a", "foo@bar.com", fetch)[0] == "tok2"
+    fetch.expires_in = 3600
+    assert store.get("a", "foo@bar.com", fetch)[0] == "tok3"
+    assert store.get("a", "foo@bar.com", fetch, rejected="tok3")[0] == "tok4"
+    assert store.get("a", "foo@bar.com", fetch)[0] == "tok4"
+
+
+def test_get_waits_for_other_process(db_file):
+    store = SqliteTokenStore(db_file, poll_interval=0.01)
+    other = SqliteTokenStore(db_file)
+    assert other._take_lease("a|foo@bar.com", None) is True
+
+    def other_fetches():
+        sleep(0.1)
+        other._fetch("a|foo@bar.com", lambda: ("other", 3600))
+
+    t = Thread(target=other_fetches)
+    t.start()
+    fetch = Fetcher()
+    assert store.get("a", "foo@bar.com", fetch)[0] == "other"
+    t.join()
+    assert fetch.calls == 0
+
+
+def test_get_failure_releases_lease(db_file):
+    store = SqliteTokenStore(db_file, lease_timeout=5)
+
+    def fail():
+        raise ValueError()
+
+    with raises(ValueError):
+        store.get("a", "foo@bar.com", fail)
+    # Not blocked by the lease of the failed fetch
+    assert store.get("a", "foo@bar.com", Fetcher())[0] == "tok1"
+
+
+def test_db_file_private(db_file):
+    SqliteTokenStore(db_file).get("a", "foo@bar.com", Fetcher())
+    assert stat.S_IMODE(os.stat(db_file).st_mode) == 0o600
+
+
+def test_client_token_store(mocker, api_info, db_file):
+    fetch = mocker.patch(
+        "lumapps.api.client.fetch_access_token", return_value=("tok", 3600)
+    )
+    store = SqliteTokenStore(db_file)
+    cli = LumAppsClient("a", "b", api_info, token="foo", token_store=store)
+    getter = cli.get_token_getter("foo@bar.com")
+    assert getter.get_token() == "tok"
+    assert cli.get_user_api("foo@bar.com").token_store is store
+    assert store.get("a", "foo@bar.com", Fetcher())[0] == "tok"
+    # A rejected token is fetched again
+    fetch.return_value = ("tok2", 3600)
+    getter.invalidate()
+    assert getter.get_token() == "tok2"
+    assert fetch.call_count == 2
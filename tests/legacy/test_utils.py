@@ -1,8 +1,9 @@
 import json
 from copy import deepcopy
 from datetime import datetime, timedelta
+from threading import Thread
 
-from pytest import fixture
+from pytest import fixture, raises
 
 import lumapps.api.utils
 
@@ -155,3 +156,74 @@ def test_pop_matches():
     obj = "foo"
     pop_matches("foo/bar", obj)
     assert obj == "foo"
+
+
+def test_get_conn_pooled_per_thread(tmp_path):
+    db_file = str(tmp_path / "sdk.db")
+    conn = lumapps.api.utils._get_conn(db_file)
+    assert lumapps.api.utils._get_conn(db_file) is conn
+    assert db_file in lumapps.api.utils._prepared
+    others = []
+    t = Thread(target=lambda: others.append(lumapps.api.utils._get_conn(db_file)))
+    t.start()
+    t.join()
+    assert others[0] is not None and others[0] is not conn
+    assert lumapps.api.utils._get_conn(":memory:") is not (
+        lumapps.api.utils._get_conn(":memory:")
+    )
+
+
+def test_get_conn_reset_after_fork(tmp_path):
+    db_file = str(tmp_path / "sdk.db")
+    conn = lumapps.api.utils._get_conn(db_file)
+    lumapps.api.utils._reset_connections()
+    assert conn in lumapps.api.utils._forked_conns
+    assert lumapps.api.utils._get_conn(db_file) is not conn
+
+
+def test_sqlite_transaction(tmp_path):
+    db_file = str(tmp_path / "sdk.db")
+    conn = lumapps.api.utils._get_conn(db_file)
+    with lumapps.api.utils.sqlite_transaction(db_file):
+        conn.execute("INSERT INTO config VALUES ('a', '1')")
+        with lumapps.api.utils.sqlite_transaction(db_file):
+            conn.execute("INSERT INTO config VALUES ('b', '2')")
+        assert conn.in_transaction
+    assert not conn.in_transaction
+    with raises(ValueError):
+        with lumapps.api.utils.sqlite_transaction(db_file):
+            conn.execute("INSERT INTO config VALUES ('c', '3')")
+            raise ValueError()
+    names = [r[0] for r in conn.execute("SELECT name FROM config")]
+    assert sorted(names) == ["a", "b"]
+
+
+def test_compile_prune_filters():
+    filters = {
+        "content/*": ["lastRevision", "properties/duplicateContent", "a/b/c"],
+        "content/get": ["a", "excerpt"],
+        "user/get": ["foo"],
+    }
+    trie = lumapps.api.utils.compile_prune_filters(["content", "get"], filters)
+    assert trie == {
+        "lastRevision": None,
+        "properties": {"duplicateContent": None},
+        "a": None,
+        "excerpt": None,
+    }
+    trie = lumapps.api.utils.compile_prune_filters(["content", "list"], filters)
+    assert trie["a"] == {"b": {"c": None}}
+    assert lumapps.api.utils.compile_prune_filters(["content"], filters) == {}
+
+
+def test_apply_prune_trie():
+    trie = {"a": None, "b": {"c": None}}
+    obj = {"a": 1, "b": [{"c": 1, "d": 2}, {"d": 3}, "x"], "e": 4}
+    lumapps.api.utils.apply_prune_trie(trie, [obj, "not a dict"])
+    assert obj == {"b": [{"d": 2}, {"d": 3}, "x"], "e": 4}
+    # Same result as pop_matches on the paths without lists
+    d = {"a": 1, "b": {"c": 2, "d": {"e": 3}}, "z": 33}
+    d2 = deepcopy(d)
+    lumapps.api.utils.apply_prune_trie({"b": {"d": {"e": None}}}, d)
+    lumapps.api.utils.pop_matches("b/d/e", d2)
+    assert d == d2